@@ -0,0 +1,90 @@
+#!/usr/bin/python3.6
+"""Loads the scout assignments from 'data/assignments/assignments.json'.
+
+The file contains the letters used to compress scout names and the
+assignments of every match, so parsing it is slow compared to
+decompressing a single tempTIMD.  The parsed file is kept in memory and
+shared by every file that uses it (e.g. decompressor.py and
+update_assignments.py).
+
+Before the cached file is used, the modification time and size of the
+file are compared with the cached ones, which does not open the file.
+If they changed, the file is read again, but it is only parsed again if
+its hash changed (e.g. it is not parsed again if the same assignments
+are copied over it)."""
+# External imports
+import hashlib
+import json
+import os
+import threading
+# Internal imports
+import utils
+
+ASSIGNMENTS_FILE = 'data/assignments/assignments.json'
+
+# The parsed file and the information used to check if it changed.
+# 'path' is needed since 'utils.MAIN_DIRECTORY' can change (e.g. in
+# replay_event.py).
+CACHE = {
+    'path': None,
+    'modificationTime': None,
+    'size': None,
+    'hash': None,
+    'assignments': None,
+    # Compressed letter to scout name
+    'scoutNames': None,
+}
+# The server decompresses tempTIMDs in different threads.  Reentrant,
+# since 'get_scout_names' holds it while calling 'load_assignments'.
+LOCK = threading.RLock()
+
+def load_assignments():
+    """Returns the parsed assignments file (dict).
+
+    The dict is shared by every caller, so it must not be changed."""
+    file_path = utils.create_file_path(ASSIGNMENTS_FILE, False)
+    file_stats = os.stat(file_path)
+    with LOCK:
+        if CACHE['path'] == file_path and \
+                CACHE['modificationTime'] == file_stats.st_mtime_ns and \
+                CACHE['size'] == file_stats.st_size:
+            return CACHE['assignments']
+        with open(file_path, 'rb') as file:
+            file_contents = file.read()
+        file_hash = hashlib.sha1(file_contents).hexdigest()
+        if CACHE['path'] != file_path or CACHE['hash'] != file_hash:
+            CACHE['assignments'] = json.loads(file_contents.decode('utf-8'))
+            # Reverses key:value pairs to enable accessing decompressed
+            # scout name from compressed scout name
+            CACHE['scoutNames'] = {letter: scout_name for scout_name, letter
+                                   in CACHE['assignments']['letters'].items()}
+            CACHE['hash'] = file_hash
+        CACHE['path'] = file_path
+        CACHE['modificationTime'] = file_stats.st_mtime_ns
+        CACHE['size'] = file_stats.st_size
+        return CACHE['assignments']
+
+def get_scout_letters():
+    """Returns a dict of scout names to their compressed letters.
+
+    The dict is shared by every caller, so it must not be changed."""
+    return load_assignments()['letters']
+
+def get_scout_names():
+    """Returns a dict of compressed letters to scout names.
+
+    The dict is shared by every caller, so it must not be changed."""
+    # Holds the lock so the file cannot be reloaded before 'scoutNames'
+    # is read.
+    with LOCK:
+        load_assignments()
+        return CACHE['scoutNames']
+
+def get_assignments_hash():
+    """Returns the hash of the contents of the assignments file.
+
+    Used to find data that needs to be updated when the assignments
+    change (e.g. decompressed scout names in temp_timd_cache.py)."""
+    with LOCK:
+        load_assignments()
+        return CACHE['hash']
@@ -0,0 +1,385 @@
+#!/usr/bin/python3.6
+"""Benchmarks every calculation stage on synthetic events.
+
+Generates events of increasing size with generate_event.py, then times
+each stage of the calculations on the whole event and measures its peak
+memory.  The time of each stage is fitted to the size of the event to
+find how the stage scales (e.g. an exponent of 1 is linear and 2 is
+quadratic), so that a stage that becomes quadratic is found before it
+is run at a championship-size event.
+
+The results are saved in 'data/benchmarks/results.json', and compared
+against the baseline saved in 'data/benchmarks/baseline.json' (saved by
+running with '--save-baseline').
+
+Usage: python3 benchmark.py [options]
+Run with '--help' for the options."""
+# External imports
+import argparse
+import copy
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy
+# Internal imports
+import calculate_abilities
+import calculate_defense
+import calculate_predictions
+import calculate_pushing_ability
+import calculate_sprs
+import calculate_team
+import calculate_timd
+import consolidation
+import data_store
+import decompressor
+import firebase_communicator
+import forward_temp_super
+import generate_event
+import local_firebase
+import temp_timd_cache
+import utils
+
+# upload_data.py connects to Firebase when it is imported, so a local
+# database is used instead.
+firebase_communicator.use_local_database(local_firebase.LocalDatabase())
+import upload_data  # pylint: disable=wrong-import-position
+
+# Number of teams in each benchmarked event
+DEFAULT_SIZES = [40, 80, 160]
+# Seed of the generated events, so every run uses the same events
+SEED = 1
+# A stage is reported as a regression if its scaling exponent is more
+# than 'EXPONENT_TOLERANCE' above the baseline, or if its time at the
+# largest size is more than 'TIME_TOLERANCE' times the baseline.
+EXPONENT_TOLERANCE = 0.3
+TIME_TOLERANCE = 1.5
+
+RESULTS_FILE = utils.create_file_path('data/benchmarks/results.json')
+BASELINE_FILE = utils.create_file_path('data/benchmarks/baseline.json')
+
+# Dicts that stages save results in between calls, as tuples of the
+# module and the name of the dict.  They are reset between the two runs
+# of a stage, along with the data directory.
+MEMOS = [
+    (decompressor, 'DECOMPRESSED_TEMP_TIMD_TOKENS'),
+    (temp_timd_cache, 'DECOMPRESSED_TEMP_TIMDS'),
+]
+
+def read_cache_folder(folder_name):
+    """Returns a dict of file names (without endings) to file contents.
+
+    folder_name is the name of a folder in 'data/cache'"""
+    files = {}
+    for file_name in os.listdir(utils.create_file_path(
+            f'data/cache/{folder_name}')):
+        with open(utils.create_file_path(
+                f'data/cache/{folder_name}/{file_name}'), 'r') as file:
+            files[file_name.split('.')[0]] = file.read()
+    return files
+
+def decompress_all(temp_timds, temp_supers):
+    """Decompresses every tempTIMD and tempSuper.
+
+    Returns a dict of TIMD names to a dict of scout names to the
+    decompressed tempTIMDs, in the format used by consolidation.py.
+
+    temp_timds is a dict of tempTIMD names to compressed tempTIMDs
+    temp_supers is a dict of tempSuper names to compressed tempSupers"""
+    temp_timds_by_timd = {}
+    for temp_timd_name, compressed_temp_timd in temp_timds.items():
+        decompressed_temp_timd = decompressor.decompress_temp_timd(
+            compressed_temp_timd)[temp_timd_name]
+        temp_timds_by_timd.setdefault(temp_timd_name.split('-')[0], {})[
+            decompressed_temp_timd['scoutName']] = decompressed_temp_timd
+    for compressed_temp_super in temp_supers.values():
+        decompressor.decompress_temp_super(compressed_temp_super)
+        decompressor.decompress_temp_super_pushing_battles(
+            compressed_temp_super)
+    return temp_timds_by_timd
+
+def decompress_all_timelines(timelines):
+    """Decompresses every tempTIMD timeline.
+
+    Times the timeline tokenizer separately from the rest of the
+    decompressor (e.g. the headers).  The decompressed tokens that
+    'decompress_all' saved are cleared first, so the tokenizer is timed
+    instead of the lookups of the saved tokens.
+
+    timelines is a list of compressed tempTIMD timelines"""
+    decompressor.DECOMPRESSED_TEMP_TIMD_TOKENS.clear()
+    return [decompressor.decompress_temp_timd_timeline(timeline) for
+            timeline in timelines]
+
+def consolidate_all(temp_timds_by_timd):
+    """Consolidates the tempTIMDs for every TIMD.
+
+    Returns a dict of TIMD names to consolidated TIMDs."""
+    timds = {}
+    for timd_name, temp_timds in temp_timds_by_timd.items():
+        timds[timd_name] = consolidation.consolidate_temp_timds(temp_timds)
+        # Added by calculate_timd.py
+        timds[timd_name]['matchNumber'] = int(timd_name.split('Q')[1])
+        timds[timd_name]['teamNumber'] = int(timd_name.split('Q')[0])
+    return timds
+
+def calculate_all_timds(timds):
+    """Calculates the calculated data of every TIMD.
+
+    Returns a dict of TIMD names to calculated data."""
+    return {timd_name: calculate_timd.calculate_timd_data(timd)
+            for timd_name, timd in timds.items()}
+
+def calculate_all_teams(timds_by_team):
+    """Calculates the calculated data of every team.
+
+    Returns a dict of team numbers to calculated data.
+
+    timds_by_team is a dict of team numbers to lists of TIMDs"""
+    return {team_number: calculate_team.team_calculations(timds, team_number)
+            for team_number, timds in timds_by_team.items()}
+
+def collect_all_upload_data():
+    """Converts every file in the upload queue to multi-location format.
+
+    Does not send the data, so only the flattening is timed."""
+    final_data = {}
+    for firebase_key, cache_key in upload_data.FIREBASE_TO_CACHE_KEY.items():
+        for file_name in os.listdir(utils.create_file_path(
+                f'data/upload_queue/{cache_key}')):
+            final_data.update(upload_data.collect_file_data(
+                utils.create_file_path(
+                    f'data/upload_queue/{cache_key}/{file_name}'),
+                firebase_key))
+    return final_data
+
+def save_state():
+    """Saves a copy of the data directory and of 'MEMOS'.
+
+    Returns the state (tuple), which is passed to 'restore_state'."""
+    # Closed so the database file is complete (e.g. its WAL file is
+    # checkpointed) before it is copied.
+    data_store.close()
+    state_directory = tempfile.mkdtemp(prefix='benchmark_state_')
+    shutil.copytree(utils.create_file_path('data', False),
+                    os.path.join(state_directory, 'data'))
+    memos = [dict(getattr(module, memo_name)) for module, memo_name in
+             MEMOS]
+    return state_directory, memos
+
+def restore_state(state):
+    """Restores the data directory and 'MEMOS' saved by 'save_state'.
+
+    state is the return value of 'save_state'"""
+    state_directory, memos = state
+    data_store.close()
+    shutil.rmtree(utils.create_file_path('data', False))
+    shutil.move(os.path.join(state_directory, 'data'),
+                utils.create_file_path('data', False))
+    shutil.rmtree(state_directory)
+    # Changed in place, since other modules can have imported the dicts
+    for (module, memo_name), memo in zip(MEMOS, memos):
+        getattr(module, memo_name).clear()
+        getattr(module, memo_name).update(memo)
+
+def run_stage(stage_function, *args):
+    """Runs a stage and measures its time and peak memory.
+
+    The stage is run twice, since measuring memory slows the stage
+    down.  The data directory (including data_store.py) and 'MEMOS' are
+    restored before the second run, so both runs do the same work (e.g.
+    delta uploads find the same changes, and the same decompressed
+    tempTIMDs are cached).  Returns a tuple of the return value of the
+    stage, its time in seconds, and its peak memory in bytes.
+
+    stage_function is the function that runs the stage
+    args are passed to 'stage_function'.  They are copied before each
+    run, since some stages (e.g. consolidation) change their arguments."""
+    state = save_state()
+    stage_args = copy.deepcopy(args)
+    start_time = time.perf_counter()
+    stage_function(*stage_args)
+    stage_time = time.perf_counter() - start_time
+
+    restore_state(state)
+    stage_args = copy.deepcopy(args)
+    tracemalloc.start()
+    return_value = stage_function(*stage_args)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return return_value, stage_time, peak_memory
+
+def benchmark_event(team_count):
+    """Benchmarks every stage on a single generated event.
+
+    Returns a dict of stage names to a dict of the 'time' and
+    'peakMemory' of the stage.
+
+    team_count is the number of teams in the generated event"""
+    # Each event is saved in a separate temporary directory, so the
+    # real cache is not changed.
+    utils.MAIN_DIRECTORY = tempfile.mkdtemp(prefix='benchmark_')
+    generate_event.save_data_directory(
+        generate_event.generate_event(team_count, seed=SEED))
+    temp_timds = read_cache_folder('temp_timds')
+    temp_supers = read_cache_folder('temp_super')
+
+    results = {}
+    def record(stage_name, stage_function, *args):
+        """Runs a stage and adds its time and memory to 'results'."""
+        return_value, stage_time, peak_memory = run_stage(
+            stage_function, *args)
+        results[stage_name] = {'time': stage_time,
+                               'peakMemory': peak_memory}
+        print(f'{team_count} teams: {stage_name} took {stage_time:.3f} '
+              f'seconds')
+        return return_value
+
+    temp_timds_by_timd = record('decompressor', decompress_all, temp_timds,
+                                temp_supers)
+    # Timelines of the tempTIMDs that have any actions (the part after
+    # the '_')
+    timelines = [temp_timd.split('_')[1] for temp_timd in
+                 temp_timds.values() if temp_timd.split('_')[1] != '']
+    record('decompress_timelines', decompress_all_timelines, timelines)
+    # Throughput of the timeline tokenizer in bytes per second
+    throughput = sum([len(timeline) for timeline in timelines]) / \
+        results['decompress_timelines']['time']
+    print(f'{team_count} teams: decompressed timelines at '
+          f'{throughput / 1e6:.2f} MB per second')
+    timds = record('consolidation', consolidate_all, temp_timds_by_timd)
+    calculated_data = record('calculate_timd_data', calculate_all_timds,
+                             timds)
+    with data_store.transaction():
+        for timd_name, timd in timds.items():
+            timd['calculatedData'] = calculated_data[timd_name]
+            data_store.write('timds', timd_name, timd)
+            with open(utils.create_file_path(
+                    f'data/upload_queue/timds/{timd_name}.json'),
+                      'w') as file:
+                json.dump(timd, file)
+
+    record('forward_temp_super', forward_temp_super.forward_temp_super)
+    # Reads the TIMDs again, since 'forward_temp_super' adds the
+    # tempSuper data to them.
+    timds_by_team = {}
+    for timd_name, timd in data_store.read_timds().items():
+        timds_by_team.setdefault(timd_name.split('Q')[0], []).append(timd)
+    teams = record('team_calculations', calculate_all_teams, timds_by_team)
+    with data_store.transaction():
+        for team_number, calculated_data in teams.items():
+            data_store.update('teams', team_number,
+                              {'calculatedData': calculated_data})
+            utils.update_json_file(utils.create_file_path(
+                f'data/upload_queue/teams/{team_number}.json'),
+                                   {'calculatedData': calculated_data})
+
+    record('calculate_defense', calculate_defense.calculate_defense)
+    record('calculate_pushing_ability',
+           calculate_pushing_ability.calculate_pushing_ability)
+    record('calculate_predictions', calculate_predictions.calculate_predictions)
+    record('calculate_abilities', calculate_abilities.calculate_abilities)
+    record('calculate_sprs', calculate_sprs.calculate_sprs)
+    record('upload_data', collect_all_upload_data)
+    return results
+
+def fit_exponent(sizes, times):
+    """Returns the exponent 'k' that best fits time = c * size ** k.
+
+    Returns None if there are fewer than two sizes with a time."""
+    points = [(math.log(size), math.log(stage_time)) for size, stage_time
+              in zip(sizes, times) if stage_time > 0]
+    if len(points) < 2:
+        return None
+    return float(numpy.polyfit([point[0] for point in points],
+                               [point[1] for point in points], 1)[0])
+
+def find_regressions(results, baseline):
+    """Returns a list of the stages that are slower than the baseline.
+
+    results is the benchmark results (dict)
+    baseline is the saved baseline, in the same format as 'results'"""
+    regressions = []
+    for stage_name, stage in results['stages'].items():
+        baseline_stage = baseline['stages'].get(stage_name)
+        if baseline_stage is None:
+            continue
+        if stage['exponent'] is not None and \
+                baseline_stage['exponent'] is not None and \
+                stage['exponent'] > baseline_stage['exponent'] + \
+                EXPONENT_TOLERANCE:
+            regressions.append(
+                f"{stage_name}: scaling exponent {stage['exponent']:.2f} "
+                f"(baseline {baseline_stage['exponent']:.2f})")
+        # Times are only compared at the largest size in both results
+        if results['sizes'][-1] in baseline['sizes']:
+            baseline_time = baseline_stage['times'][
+                baseline['sizes'].index(results['sizes'][-1])]
+            if stage['times'][-1] > baseline_time * TIME_TOLERANCE:
+                regressions.append(
+                    f"{stage_name}: {stage['times'][-1]:.3f} seconds at "
+                    f"{results['sizes'][-1]} teams (baseline "
+                    f"{baseline_time:.3f} seconds)")
+    return regressions
+
+def run_benchmarks(sizes):
+    """Benchmarks every stage on events of each size.
+
+    Returns the results (dict).
+
+    sizes is a list of the number of teams in each event"""
+    main_directory = utils.MAIN_DIRECTORY
+    results_by_size = [benchmark_event(team_count) for team_count in sizes]
+    utils.MAIN_DIRECTORY = main_directory
+
+    stages = {}
+    for stage_name in results_by_size[0]:
+        times = [size_results[stage_name]['time'] for size_results in
+                 results_by_size]
+        stages[stage_name] = {
+            'times': times,
+            'peakMemory': [size_results[stage_name]['peakMemory'] for
+                           size_results in results_by_size],
+            'exponent': fit_exponent(sizes, times),
+        }
+    return {'sizes': sizes, 'seed': SEED, 'stages': stages}
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(
+        description='Benchmarks every calculation stage.')
+    PARSER.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='number of teams in each event')
+    PARSER.add_argument('--save-baseline', action='store_true',
+                        help='save the results as the new baseline')
+    ARGUMENTS = PARSER.parse_args()
+    RESULTS = run_benchmarks(sorted(ARGUMENTS.sizes))
+
+    try:
+        with open(BASELINE_FILE, 'r') as file:
+            BASELINE = json.load(file)
+    except FileNotFoundError:
+        BASELINE = None
+    if BASELINE is not None:
+        RESULTS['regressions'] = find_regressions(RESULTS, BASELINE)
+        for regression in RESULTS['regressions']:
+            print(f'Warning: {regression}')
+
+    with open(RESULTS_FILE, 'w') as file:
+        json.dump(RESULTS, file, indent=2)
+    if ARGUMENTS.save_baseline is True:
+        with open(BASELINE_FILE, 'w') as file:
+            json.dump(RESULTS, file, indent=2)
+
+    for STAGE_NAME, STAGE in RESULTS['stages'].items():
+        if STAGE['exponent'] is None:
+            EXPONENT = 'n/a'
+        else:
+            EXPONENT = f"{STAGE['exponent']:.2f}"
+        print(f"{STAGE_NAME}: exponent {EXPONENT}, "
+              f"{STAGE['times'][-1]:.3f} seconds and "
+              f"{STAGE['peakMemory'][-1] / 1e6:.1f} MB at "
+              f"{RESULTS['sizes'][-1]} teams")
+    print(f'Results saved in {RESULTS_FILE}')
@@ -2,12 +2,19 @@
 
 Called by server.py after team specific calculations."""
 # External Imports
-import os
 import json
 import numpy
 # Internal Imports
+import data_store
+import event_cache
 import utils
 
+# Each Z-Score data field to the average data field it is calculated from.
+SUPER_ZSCORE_DATA_FIELDS = {
+    'agilityZScore': 'avgAgility',
+    'speedZScore': 'avgSpeed',
+}
+
 def calculate_driver_ability(calculated_data):
     """Calculates the relative driver ability for a team using driver zscores.
 
@@ -162,134 +169,134 @@ def calculate_third_pick_ability(calculated_data):
     # Adds all the previous scores together to get a full third pick score.
     return sand_score + level_1_teleop_score + level_2_teleop_score + level_3_teleop_score + end_game_score
 
-def calculate_zscores(team_average_field, team_zscore_field):
+def calculate_zscores(teams, team_average_field, team_zscore_field):
     """Calculates the zscore for a team average data point across all teams.
 
+    teams is a dictionary of team numbers to their team data.
     team_average_field is the name of the team average data field that
     the zscore is taken from.
     team_zscore_field is the name of the team zscore data field in which
     the calculated zscore is put into."""
     averages = {team: data['calculatedData'].get(
-        team_average_field, 0.0) for team, data in TEAMS.items()}
+        team_average_field, 0.0) for team, data in teams.items()}
 
     mean = numpy.mean(list(averages.values()))
     sd = numpy.std(list(averages.values()))
     for team, average in averages.items():
         if sd == 0.0:
-            TEAMS[team]['calculatedData'][team_zscore_field] = 0.0
+            teams[team]['calculatedData'][team_zscore_field] = 0.0
         else:
-            TEAMS[team]['calculatedData'][team_zscore_field] = (average - mean) / sd
-
-# Gathers the calculated data from all the teams.
-TEAMS = {}
-for team in os.listdir(utils.create_file_path('data/cache/teams')):
-    with open(utils.create_file_path(f'data/cache/teams/{team}')) as file:
-        team_data = json.load(file)
-    if team_data.get('calculatedData') is not None:
-        # '.split()' removes '.json' file ending
-        TEAMS[team.split('.')[0]] = team_data
-
-# Each Z-Score data field to the average data field it is calculated from.
-SUPER_ZSCORE_DATA_FIELDS = {
-    'agilityZScore': 'avgAgility',
-    'speedZScore': 'avgSpeed',
-}
-
-# Calculates zscores for teams based on data fields in 'SUPER_ZSCORE_DATA_FIELDS'
-for zscore_name, average_name in SUPER_ZSCORE_DATA_FIELDS.items():
-    calculate_zscores(average_name, zscore_name)
-
-# After the zscores are calculated for all the teams, other calculations
-# that use zscores can be calculated, like driverAbility and
-# firstPickAbility.
-for team in TEAMS.keys():
-    TEAMS[team]['calculatedData']['driverAbility'] = \
-        calculate_driver_ability(TEAMS[team]['calculatedData'])
-
-# TODO: Move if-statement immediately after pulling data
-if TEAMS != {}:
-    # Calculates the highest and lowest driverAbility for any team and uses
-    # it to weigh all other driverAbilities in secondPickAbility.
-    MAX_DA = max([team_data['calculatedData']['driverAbility'] for team_data
-                  in TEAMS.values()])
-    MIN_DA = min([team_data['calculatedData']['driverAbility'] for team_data
-                  in TEAMS.values()])
-
-    # Gathers the matches in the competition. These matches are cached from
-    # TBA when the server first runs.
-    MATCH_SCHEDULE = {}
-    for match_file in os.listdir(utils.create_file_path('data/cache/match_schedule')):
-        with open(utils.create_file_path(f'data/cache/match_schedule/{match_file}')) as file:
-            match_data = json.load(file)
-        # '.split()' removes '.txt' file ending
-        MATCH_SCHEDULE[match_file.split('.')[0]] = match_data
-
-    TIMD_FILES = os.listdir(utils.create_file_path('data/cache/timds'))
-    # Removes '.json' file ending.
-    TIMDS = [timd_file.split('.')[0] for timd_file in TIMD_FILES]
-    for team in TEAMS:
-        # Matches a team has played
-        matches = [timd.split('Q')[1] for timd in TIMDS if timd.split('Q')[0] == team]
-        # Gets the alliance partners of a team across their matches
-        alliance_members = []
-        for match in matches:
-            # Uses 'list()' to not associate the match schedule when
-            # alliance is deleted from.
-            red_alliance = list(MATCH_SCHEDULE[match]['redTeams'])
-            blue_alliance = list(MATCH_SCHEDULE[match]['blueTeams'])
-            if str(team) in red_alliance:
-                # Sets alliance the alliance equal to those teams
-                alliance = red_alliance
-            # Checks if the team is in the blue alliance
-            elif str(team) in blue_alliance:
-                # Sets alliance the alliance equal to those teams
-                alliance = blue_alliance
-            else:
-                print('Error: Team not in match schedule.')
-            # Removes own team and leaves only alliance partners in the list
-            alliance.remove(str(team))
-            alliance_members += alliance
-
-        # Scaled driver ability of the team's alliance partners
-        scaled_driver_abilities = []
-        for team_ in alliance_members:
-            driver_ability = \
-                TEAMS[team_]['calculatedData']['driverAbility']
-            # Scales driver ability so that the lowest driver ability is
-            # counted as 0, and the highest is counted as 1. All other
-            # values in between are scaled linearly.
-            scaled_driver_ability = 1 * \
-                (driver_ability - MIN_DA)/(MAX_DA - MIN_DA)
-            scaled_driver_abilities.append(scaled_driver_ability)
-        # Multiplies the average scaled alliance partner's driver ability
-        # by the team's nonscaled driver ability to get the team's normalized
-        # driver ability.
-        normalized_driver_ability = utils.avg(scaled_driver_abilities) * \
-            TEAMS[team]['calculatedData']['driverAbility']
-        TEAMS[team]['calculatedData']['normalizedDriverAbility'] = \
-            normalized_driver_ability
-
-    MAX_NORM_DA = max([
-        team_data['calculatedData']['normalizedDriverAbility'] for
-        team_data in TEAMS.values()])
-    MIN_NORM_DA = min([
-        team_data['calculatedData']['normalizedDriverAbility'] for
-        team_data in TEAMS.values()])
-    for team in TEAMS.keys():
-        if TEAMS[team].get('calculatedData') is not None:
-            TEAMS[team]['calculatedData']['firstPickAbility'] = \
-                calculate_first_pick_ability(TEAMS[team]['calculatedData'])
-            TEAMS[team]['calculatedData']['secondPickAbility'] = \
-                calculate_second_pick_ability(TEAMS[team]['calculatedData'],
-                                              MAX_NORM_DA, MIN_NORM_DA)
-            TEAMS[team]['calculatedData']['thirdPickAbility'] = \
-                calculate_third_pick_ability(TEAMS[team]['calculatedData'])
-
-    # Sends data to 'cache' and 'upload_queue'
-    for team, data in TEAMS.items():
-        with open(utils.create_file_path(
-                f'data/cache/teams/{team}.json'), 'w') as file:
-            json.dump(data, file)
-        with open(utils.create_file_path(
-                f'data/upload_queue/teams/{team}.json'), 'w') as file:
-            json.dump(data, file)
+            teams[team]['calculatedData'][team_zscore_field] = (average - mean) / sd
+
+def calculate_abilities(cache=None):
+    """Calculates advanced data points for every team in the competition.
+
+    Saves the results in the local cache and in the Firebase upload
+    queue.
+
+    cache is the 'event_cache.EventCache' to read the data from.
+    Defaults to reading every team from 'data_store'."""
+    if cache is None:
+        cache = event_cache.load_event_cache()
+    # Gathers the calculated data from all the teams.  The team data is
+    # copied, since the cache is shared with the other stages.
+    teams = {team: dict(team_data, calculatedData=dict(
+        team_data['calculatedData'])) for team, team_data in
+             cache.teams.items() if
+             team_data.get('calculatedData') is not None}
+
+    # Calculates zscores for teams based on data fields in
+    # 'SUPER_ZSCORE_DATA_FIELDS'
+    for zscore_name, average_name in SUPER_ZSCORE_DATA_FIELDS.items():
+        calculate_zscores(teams, average_name, zscore_name)
+
+    # After the zscores are calculated for all the teams, other calculations
+    # that use zscores can be calculated, like driverAbility and
+    # firstPickAbility.
+    for team in teams.keys():
+        teams[team]['calculatedData']['driverAbility'] = \
+            calculate_driver_ability(teams[team]['calculatedData'])
+
+    # TODO: Move if-statement immediately after pulling data
+    if teams != {}:
+        # Calculates the highest and lowest driverAbility for any team and uses
+        # it to weigh all other driverAbilities in secondPickAbility.
+        max_da = max([team_data['calculatedData']['driverAbility'] for team_data
+                      in teams.values()])
+        min_da = min([team_data['calculatedData']['driverAbility'] for team_data
+                      in teams.values()])
+
+        # Gathers the matches in the competition. These matches are cached from
+        # TBA when the server first runs.
+        match_schedule = cache.match_schedule
+
+        for team in teams:
+            # Matches a team has played, from the team index of the TIMDs
+            matches = [timd.split('Q')[1] for timd in
+                       cache.timds_by_team.get(team, {})]
+            # Gets the alliance partners of a team across their matches
+            alliance_members = []
+            for match in matches:
+                # Uses 'list()' to not associate the match schedule when
+                # alliance is deleted from.
+                red_alliance = list(match_schedule[match]['redTeams'])
+                blue_alliance = list(match_schedule[match]['blueTeams'])
+                if str(team) in red_alliance:
+                    # Sets alliance the alliance equal to those teams
+                    alliance = red_alliance
+                # Checks if the team is in the blue alliance
+                elif str(team) in blue_alliance:
+                    # Sets alliance the alliance equal to those teams
+                    alliance = blue_alliance
+                else:
+                    print('Error: Team not in match schedule.')
+                # Removes own team and leaves only alliance partners in the list
+                alliance.remove(str(team))
+                alliance_members += alliance
+
+            # Scaled driver ability of the team's alliance partners
+            scaled_driver_abilities = []
+            for team_ in alliance_members:
+                driver_ability = \
+                    teams[team_]['calculatedData']['driverAbility']
+                # Scales driver ability so that the lowest driver ability is
+                # counted as 0, and the highest is counted as 1. All other
+                # values in between are scaled linearly.
+                scaled_driver_ability = 1 * \
+                    (driver_ability - min_da)/(max_da - min_da)
+                scaled_driver_abilities.append(scaled_driver_ability)
+            # Multiplies the average scaled alliance partner's driver ability
+            # by the team's nonscaled driver ability to get the team's normalized
+            # driver ability.
+            normalized_driver_ability = utils.avg(scaled_driver_abilities) * \
+                teams[team]['calculatedData']['driverAbility']
+            teams[team]['calculatedData']['normalizedDriverAbility'] = \
+                normalized_driver_ability
+
+        max_norm_da = max([
+            team_data['calculatedData']['normalizedDriverAbility'] for
+            team_data in teams.values()])
+        min_norm_da = min([
+            team_data['calculatedData']['normalizedDriverAbility'] for
+            team_data in teams.values()])
+        for team in teams.keys():
+            if teams[team].get('calculatedData') is not None:
+                teams[team]['calculatedData']['firstPickAbility'] = \
+                    calculate_first_pick_ability(teams[team]['calculatedData'])
+                teams[team]['calculatedData']['secondPickAbility'] = \
+                    calculate_second_pick_ability(teams[team]['calculatedData'],
+                                                  max_norm_da, min_norm_da)
+                teams[team]['calculatedData']['thirdPickAbility'] = \
+                    calculate_third_pick_ability(teams[team]['calculatedData'])
+
+        # Sends data to 'cache' and 'upload_queue'
+        with data_store.transaction():
+            for team, data in teams.items():
+                data_store.write('teams', team, data)
+        for team, data in teams.items():
+            with open(utils.create_file_path(
+                    f'data/upload_queue/teams/{team}.json'), 'w') as file:
+                json.dump(data, file)
+
+if __name__ == '__main__':
+    calculate_abilities()
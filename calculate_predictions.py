@@ -3,9 +3,10 @@
 Called by server.py"""
 # External imports
 import json
-import os
 from scipy.stats import norm
 # Internal imports
+import data_store
+import event_cache
 import utils
 
 def probability_density(x, mu, sigma):
@@ -28,24 +29,27 @@ def probability_density(x, mu, sigma):
     else:
         return 1.0 - norm.cdf(x, mu, sigma)
 
-def calculate_predicted_alliance_score(team_numbers, pred_climb_points):
+def calculate_predicted_alliance_score(teams, team_numbers,
+                                       pred_climb_points):
     """Calculates the predicted score for an alliance.
 
+    teams is a dictionary of team numbers to their team data.
     team_numbers is a list of team numbers (integers) on the alliance.
     pred_climb_points is the predicted climb points for the alliance."""
     total_score = 0
     # Adds the predicted climb points for the alliance.
     total_score += pred_climb_points
     for team in team_numbers:
-        total_score += TEAMS[team]['calculatedData'].get('predictedSoloPoints', 0)
+        total_score += teams[team]['calculatedData'].get('predictedSoloPoints', 0)
     return total_score
 
-def calculate_predicted_climb_points(team_numbers):
+def calculate_predicted_climb_points(teams, team_numbers):
     """Calculates the predicted climb points for an alliance.
 
+    teams is a dictionary of team numbers to their team data.
     team_numbers is a list of team numbers (integers) on the alliance"""
     calculated_data_by_team = {team_number: \
-        TEAMS[team_number]['calculatedData'] for team_number in \
+        teams[team_number]['calculatedData'] for team_number in \
         team_numbers}
     total_points = 0
     for team_number, team_calculated_data in calculated_data_by_team.items():
@@ -64,13 +68,14 @@ def calculate_predicted_climb_points(team_numbers):
                                  6 * float(team_calculated_data.get('climbSuccessL2', 0)) / 100])
     return total_points
 
-def calculate_chance_climb_rp(team_numbers):
+def calculate_chance_climb_rp(teams, team_numbers):
     """Calculates the chance an alliance gets the climb RP (ranking point).
 
+    teams is a dictionary of team numbers to their team data.
     team_numbers are the team_numbers on the alliance."""
     # Each team to their 'calculatedData' dictionary
     calculated_data_by_team = {team_number: \
-        TEAMS[team_number]['calculatedData'] for team_number in \
+        teams[team_number]['calculatedData'] for team_number in \
         team_numbers}
 
     # Template for each team to their successes for each climb level.
@@ -134,11 +139,12 @@ def calculate_chance_climb_rp(team_numbers):
     # max of all the RP combination chances.
     return max(rp_combination_chances)
 
-def calculate_chance_rocket_rp(team_numbers):
+def calculate_chance_rocket_rp(teams, team_numbers):
     """Calculates the chance an alliance gets the rocket ranking point.
 
+    teams is a dictionary of team numbers to their team data.
     team_numbers are the team_numbers on the alliance."""
-    calculated_data_by_team = [TEAMS[team]['calculatedData'] for team in
+    calculated_data_by_team = [teams[team]['calculatedData'] for team in
                              team_numbers]
 
     # Calculates the chances that the alliance places 6 panels, then
@@ -176,120 +182,154 @@ def calculate_predicted_rps(calculated_data, color):
             calculated_data['blueChanceRocketRP']
         return total
 
-# Gathers the calculated data from all the teams.
-TEAMS = {}
-for team in os.listdir(utils.create_file_path('data/cache/teams')):
-    with open(utils.create_file_path(f'data/cache/teams/{team}')) as file:
-        team_data = json.load(file)
+def calculate_predictions(match_numbers=None, cache=None):
+    """Makes predictions for matches and teams in the competition.
+
+    Saves the predictions that changed in the local cache and in the
+    Firebase upload queue.
+
+    match_numbers is a collection of the match numbers (strings) to make
+    predictions for.  Predictions for the other matches are pulled from
+    the cache.  Defaults to every match in the match schedule.
+    cache is the 'event_cache.EventCache' to read the data from.
+    Defaults to reading every team and match from 'data_store'."""
+    if cache is None:
+        cache = event_cache.load_event_cache()
+    # Gathers the calculated data from all the teams.
     # Checks if the team has calculated data before considering them for
-    # predictions.
-    if team_data.get('calculatedData') is not None:
-        # '.split()' removes '.txt' file ending
-        TEAMS[team.split('.')[0]] = team_data
-
-# Gathers the matches in the competition. These matches are cached from
-# the tba match schedule when the server first runs.
-MATCH_SCHEDULE = {}
-for match in os.listdir(utils.create_file_path('data/cache/match_schedule')):
-    with open(utils.create_file_path(
-            f'data/cache/match_schedule/{match}')) as file:
-        match_data = json.load(file)
-    # '.split()' removes '.txt' file ending
-    MATCH_SCHEDULE[match.split('.')[0]] = match_data
-
-# Gathers the matches that already have data in the competition. This
-# data is added to, then sent to the cache and upload queue.
-MATCHES = {}
-for match in os.listdir(utils.create_file_path('data/cache/matches')):
-    with open(utils.create_file_path(f'data/cache/matches/{match}')) as file:
-        match_data = json.load(file)
-    # '.split()' removes '.txt' file ending
-    MATCHES[match.split('.')[0]] = match_data
-
-for team in TEAMS.keys():
-    TEAMS[team]['calculatedData']['predictedRPs'] = []
-
-# Each team to a list of the predicted rps they recieved in each of
-# their matches.
-PREDICTED_RPS_BY_TEAM = {}
-for match in MATCH_SCHEDULE.keys():
-    # The calculated_data dictionary where all the calculated match data
-    # will be stored.
-    calculated_data = {}
-
-    # Iterates through each of the alliances to do predictions on both
-    # of them.
-    for alliance_color in ['red', 'blue']:
-        alliance = MATCH_SCHEDULE[match][f'{alliance_color}Teams']
-
-        # At the beginning of competition, some teams don't have data,
-        # meaning they shouldn't be included in prediction calculation.
-        alliance = [team for team in alliance if \
-            TEAMS.get(team) is not None]
-        if len(alliance) == 0:
+    # predictions.  The team data is copied, since the cache is shared
+    # with the other stages.
+    teams = {team: dict(team_data, calculatedData=dict(
+        team_data['calculatedData'])) for team, team_data in
+             cache.teams.items() if
+             team_data.get('calculatedData') is not None}
+
+    # Gathers the matches in the competition. These matches are cached from
+    # the tba match schedule when the server first runs.
+    match_schedule = cache.match_schedule
+
+    # Gathers the matches that already have data in the competition. This
+    # data is added to, then sent to the cache and upload queue.
+    matches = {match: dict(match_data) for match, match_data in
+               cache.matches.items()}
+
+    # Team predictions before this calculation, used to only save the
+    # teams with predictions that changed.
+    previous_team_predictions = {}
+    for team in teams.keys():
+        previous_team_predictions[team] = (
+            teams[team]['calculatedData'].get('predictedRPs'),
+            teams[team]['calculatedData'].get('predictedSeed'))
+        teams[team]['calculatedData']['predictedRPs'] = []
+
+    # Each team to a list of the predicted rps they recieved in each of
+    # their matches.
+    predicted_rps_by_team = {}
+    for match in match_schedule.keys():
+        # Uses the cached predictions for matches that are not being
+        # calculated.
+        if match_numbers is not None and match not in match_numbers:
+            calculated_data = matches.get(match, {}).get('calculatedData', {})
+            for alliance_color in ['red', 'blue']:
+                # The alliance was not predicted because none of its
+                # teams had data.
+                if f'{alliance_color}PredictedRPs' not in calculated_data:
+                    continue
+                for team in match_schedule[match][f'{alliance_color}Teams']:
+                    if predicted_rps_by_team.get(team) is None:
+                        predicted_rps_by_team[team] = []
+                    predicted_rps_by_team[team].append(calculated_data[
+                        f'{alliance_color}PredictedRPs'])
             continue
 
-        calculated_data[f'{alliance_color}PredictedClimbPoints'] = \
-            calculate_predicted_climb_points(alliance)
-        calculated_data[f'{alliance_color}PredictedScore'] = \
-            calculate_predicted_alliance_score(alliance, \
-            calculated_data[f'{alliance_color}PredictedClimbPoints'])
-        calculated_data[f'{alliance_color}ChanceClimbRP'] = \
-            calculate_chance_climb_rp(alliance)
-        calculated_data[f'{alliance_color}ChanceRocketRP'] = \
-            calculate_chance_rocket_rp(alliance)
-
-        if MATCHES.get(match) is None:
-            MATCHES[match] = {}
-
-        # Uses actual rps instead of predicted rps when available.
-        # HACK: This should be handled when calculating predicted rps instead.
-        if MATCHES[match].get(f'{alliance_color}ActualRPs') is None:
-            calculated_data[f'{alliance_color}PredictedRPs'] = \
-                calculate_predicted_rps(calculated_data, alliance_color)
-        else:
-            calculated_data[f'{alliance_color}PredictedRPs'] = \
-                MATCHES[match][f'{alliance_color}ActualRPs']
-
-        for team in MATCH_SCHEDULE[match][f'{alliance_color}Teams']:
-            if PREDICTED_RPS_BY_TEAM.get(team) is None:
-                PREDICTED_RPS_BY_TEAM[team] = []
-            PREDICTED_RPS_BY_TEAM[team].append(calculated_data[
-                f'{alliance_color}PredictedRPs'])
-
-    # Adds the prediction data to the 'calculatedData' key in the match
-    # dictionary.
-    if MATCHES.get(match) is None:
-        MATCHES[match] = {}
-    MATCHES[match]['calculatedData'] = calculated_data
-
-# All the teams in order of their average predictedRPs from highest to lowest.
-PREDICTED_RP_LIST = {team: sum(predicted_rps) / len(predicted_rps) for \
-    team, predicted_rps in PREDICTED_RPS_BY_TEAM.items()}
-SEED_ORDER = sorted(PREDICTED_RP_LIST.keys(),
-                    key=PREDICTED_RP_LIST.get, reverse=True)
-
-# 'enumerate(, 1)' starts seeding at 1
-for seed, team in enumerate(SEED_ORDER, 1):
-    if TEAMS.get(team) is not None:
-        TEAMS[team]['calculatedData']['predictedRPs'] = \
-            sum(PREDICTED_RPS_BY_TEAM[team])
-    TEAMS[team]['calculatedData']['predictedSeed'] = seed
-
-# Sends data to 'cache' and 'upload_queue'
-for team, data in TEAMS.items():
-    with open(utils.create_file_path(
-            f'data/cache/teams/{team}.json'), 'w') as file:
-        json.dump(data, file)
-    with open(utils.create_file_path(
-            f'data/upload_queue/teams/{team}.json'), 'w') as file:
-        json.dump(data, file)
-
-# Sends data to 'cache' and 'upload_queue'
-for match, data in MATCHES.items():
-    with open(utils.create_file_path(
-            f'data/cache/matches/{match}.json'), 'w') as file:
-        json.dump(data, file)
-    with open(utils.create_file_path(
-            f'data/upload_queue/matches/{match}.json'), 'w') as file:
-        json.dump(data, file)
+        # The calculated_data dictionary where all the calculated match data
+        # will be stored.
+        calculated_data = {}
+
+        # Iterates through each of the alliances to do predictions on both
+        # of them.
+        for alliance_color in ['red', 'blue']:
+            alliance = match_schedule[match][f'{alliance_color}Teams']
+
+            # At the beginning of competition, some teams don't have data,
+            # meaning they shouldn't be included in prediction calculation.
+            alliance = [team for team in alliance if \
+                teams.get(team) is not None]
+            if len(alliance) == 0:
+                continue
+
+            calculated_data[f'{alliance_color}PredictedClimbPoints'] = \
+                calculate_predicted_climb_points(teams, alliance)
+            calculated_data[f'{alliance_color}PredictedScore'] = \
+                calculate_predicted_alliance_score(teams, alliance, \
+                calculated_data[f'{alliance_color}PredictedClimbPoints'])
+            calculated_data[f'{alliance_color}ChanceClimbRP'] = \
+                calculate_chance_climb_rp(teams, alliance)
+            calculated_data[f'{alliance_color}ChanceRocketRP'] = \
+                calculate_chance_rocket_rp(teams, alliance)
+
+            if matches.get(match) is None:
+                matches[match] = {}
+
+            # Uses actual rps instead of predicted rps when available.
+            # HACK: This should be handled when calculating predicted rps instead.
+            if matches[match].get(f'{alliance_color}ActualRPs') is None:
+                calculated_data[f'{alliance_color}PredictedRPs'] = \
+                    calculate_predicted_rps(calculated_data, alliance_color)
+            else:
+                calculated_data[f'{alliance_color}PredictedRPs'] = \
+                    matches[match][f'{alliance_color}ActualRPs']
+
+            for team in match_schedule[match][f'{alliance_color}Teams']:
+                if predicted_rps_by_team.get(team) is None:
+                    predicted_rps_by_team[team] = []
+                predicted_rps_by_team[team].append(calculated_data[
+                    f'{alliance_color}PredictedRPs'])
+
+        # Adds the prediction data to the 'calculatedData' key in the match
+        # dictionary.
+        if matches.get(match) is None:
+            matches[match] = {}
+        matches[match]['calculatedData'] = calculated_data
+
+    # All the teams in order of their average predictedRPs from highest to lowest.
+    predicted_rp_list = {team: sum(predicted_rps) / len(predicted_rps) for \
+        team, predicted_rps in predicted_rps_by_team.items()}
+    seed_order = sorted(predicted_rp_list.keys(),
+                        key=predicted_rp_list.get, reverse=True)
+
+    # 'enumerate(, 1)' starts seeding at 1
+    for seed, team in enumerate(seed_order, 1):
+        if teams.get(team) is not None:
+            # Casts numpy floats to floats so they can be compared with
+            # the previous (cached) predictions.
+            teams[team]['calculatedData']['predictedRPs'] = \
+                float(sum(predicted_rps_by_team[team]))
+            teams[team]['calculatedData']['predictedSeed'] = seed
+
+    # Only the teams with predictions that changed are saved.
+    changed_teams = {team: data for team, data in teams.items() if
+                     previous_team_predictions[team] != (
+                         data['calculatedData'].get('predictedRPs'),
+                         data['calculatedData'].get('predictedSeed'))}
+    if match_numbers is not None:
+        matches = {match: data for match, data in matches.items() if
+                   match in match_numbers}
+
+    # Sends data to 'cache' and 'upload_queue'
+    with data_store.transaction():
+        for team, data in changed_teams.items():
+            data_store.write('teams', team, data)
+        for match, data in matches.items():
+            data_store.write('matches', match, data)
+    for team, data in changed_teams.items():
+        with open(utils.create_file_path(
+                f'data/upload_queue/teams/{team}.json'), 'w') as file:
+            json.dump(data, file)
+    for match, data in matches.items():
+        with open(utils.create_file_path(
+                f'data/upload_queue/matches/{match}.json'), 'w') as file:
+            json.dump(data, file)
+
+if __name__ == '__main__':
+    calculate_predictions()
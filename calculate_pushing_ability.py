@@ -4,25 +4,12 @@ For more info, about how Elo works, see:
 https://en.wikipedia.org/wiki/Elo_rating_system"""
 # External imports
 import json
-import os
 # Internal imports
-import decompressor
+import data_store
+import input_registry
+import temp_super_store
 import utils
 
-TEMP_SUPER_FILES = os.listdir(utils.create_file_path('data/cache/temp_super'))
-# Sorts by match number, since Elo needs to be in chronological order
-TEMP_SUPER_FILES.sort(key=lambda file_name: file_name.split('-')[0].split('Q')[1])
-
-PUSHING_BATTLES = []
-for temp_super_file in TEMP_SUPER_FILES:
-    with open(utils.create_file_path(
-            f'data/cache/temp_super/{temp_super_file}'), 'r') as file:
-        compressed_temp_super = file.read()
-    decompressed_pushing_battles = \
-        decompressor.decompress_temp_super_pushing_battles(
-            compressed_temp_super)
-    PUSHING_BATTLES += decompressed_pushing_battles
-
 # Constants:
 # C is used for calculating win probability. When team A has CONSTANT_C
 # more Elo than team B, team A is predicted to win 10 out of 11 battles
@@ -35,40 +22,61 @@ CONSTANT_VALUE = {
     'smallWin': 0.6,
 }
 
-# Team number to their ELO
-ELOS = {}
+def calculate_pushing_ability():
+    """Calculates pushing ability Elos for every team with a pushing battle.
+
+    Saves each team's Elo in the local cache and exports all of the Elos
+    to 'data/exports/pushing-ability-elos.json'."""
+    # The tempSupers are in order of match number (as an integer), since
+    # Elo needs to be in chronological order
+    pushing_battles = []
+    for temp_super in temp_super_store.read_temp_supers().values():
+        # Pushing battles that could not be decompressed are None
+        pushing_battles += temp_super['pushingBattles'] or []
 
-for pushing_battle in PUSHING_BATTLES:
-    # Uses 500 as the starting Elo for a team that doesn't already have one.
-    winner_old_elo = ELOS.get(pushing_battle['winner'], 500)
-    loser_old_elo = ELOS.get(pushing_battle['loser'], 500)
+    # Team number to their ELO
+    elos = {}
 
-    winner_weighted_ranking = 10 ** (winner_old_elo / CONSTANT_C)
-    loser_weighted_ranking = 10 ** (loser_old_elo / CONSTANT_C)
+    for pushing_battle in pushing_battles:
+        # Uses 500 as the starting Elo for a team that doesn't already
+        # have one.
+        winner_old_elo = elos.get(pushing_battle['winner'], 500)
+        loser_old_elo = elos.get(pushing_battle['loser'], 500)
 
-    # Expected win rate for the robot that ended up winning.
-    winner_expected_win_rate = winner_weighted_ranking / (
-        winner_weighted_ranking + loser_weighted_ranking)
-    # If f(x) = winner_expected_win_rate
-    # and x = winner_old_elo - loser_old_elo
-    # then the graph of f(x) is a logistic curve.
-    # f(x) = 1/(1+10**(-x/CONSTANT_C))
+        winner_weighted_ranking = 10 ** (winner_old_elo / CONSTANT_C)
+        loser_weighted_ranking = 10 ** (loser_old_elo / CONSTANT_C)
 
-    if pushing_battle['winMarginIsLarge'] is True:
-        win_value = CONSTANT_VALUE['largeWin']
-    else:
-        win_value = CONSTANT_VALUE['smallWin']
+        # Expected win rate for the robot that ended up winning.
+        winner_expected_win_rate = winner_weighted_ranking / (
+            winner_weighted_ranking + loser_weighted_ranking)
+        # If f(x) = winner_expected_win_rate
+        # and x = winner_old_elo - loser_old_elo
+        # then the graph of f(x) is a logistic curve.
+        # f(x) = 1/(1+10**(-x/CONSTANT_C))
 
-    winner_new_elo = winner_old_elo + CONSTANT_K * (win_value - \
-        winner_expected_win_rate)
-    loser_new_elo = loser_old_elo - CONSTANT_K * (win_value - \
-        winner_expected_win_rate)
+        if pushing_battle['winMarginIsLarge'] is True:
+            win_value = CONSTANT_VALUE['largeWin']
+        else:
+            win_value = CONSTANT_VALUE['smallWin']
 
-    ELOS[pushing_battle['winner']] = winner_new_elo
-    ELOS[pushing_battle['loser']] = loser_new_elo
+        winner_new_elo = winner_old_elo + CONSTANT_K * (win_value - \
+            winner_expected_win_rate)
+        loser_new_elo = loser_old_elo - CONSTANT_K * (win_value - \
+            winner_expected_win_rate)
+
+        elos[pushing_battle['winner']] = winner_new_elo
+        elos[pushing_battle['loser']] = loser_new_elo
+
+    with data_store.transaction():
+        for team in elos.keys():
+            data_store.update('teams', team,
+                              {'calculatedData': {'pushAbility': elos[team]}})
+    with open(utils.create_file_path(
+            'data/exports/pushing-ability-elos.json'), 'w') as file:
+        json.dump(elos, file)
 
-for team in ELOS.keys():
-    utils.update_json_file(utils.create_file_path(
-        f'data/cache/teams/{team}.json'), {'calculatedData': {'pushAbility': ELOS[team]}})
-with open(utils.create_file_path('data/exports/pushing-ability-elos.json'), 'w') as file:
-    json.dump(ELOS, file)
+if __name__ == '__main__':
+    # The 'inputs' index is kept up to date by server.py, which may not
+    # be running, so it is rebuilt from the cached inputs first.
+    input_registry.load_registry()
+    calculate_pushing_ability()
@@ -8,124 +8,138 @@ scout training and competition to decrease errors in the future."""
 # External imports
 import csv
 import json
-import os
 # Internal imports
-import decompressor
+import data_store
+import input_registry
+import temp_timd_cache
 import utils
 
-TEMP_TIMDS = os.listdir(utils.create_file_path('data/cache/temp_timds'))
-TIMDS = os.listdir(utils.create_file_path('data/cache/timds'))
+# SPR data fields that are exported to CSV
+SPR_KEYS = ['scoutName', 'overall', 'matchesScouted']
 
-# Scout name to SPR breakdown dictionary
-# Example format: 'Sam C': {'placement': {'correct': 3}, {'total': 10}}
-SPRS = {}
+def register_value(sprs, scout_name_, data_field_, is_correct):
+    """Registers correct or incorrect value in 'sprs'.
 
-def register_value(scout_name_, data_field_, is_correct):
-    """Registers correct or incorrect value in 'SPRS'."""
-    if SPRS.get(scout_name_) is None:
-        SPRS[scout_name_] = {}
-    if SPRS[scout_name_].get(data_field_) is None:
-        SPRS[scout_name_][data_field_] = {}
-    previous_breakdown = SPRS[scout_name_][data_field_]
+    sprs is a dictionary of scout names to SPR breakdowns."""
+    if sprs.get(scout_name_) is None:
+        sprs[scout_name_] = {}
+    if sprs[scout_name_].get(data_field_) is None:
+        sprs[scout_name_][data_field_] = {}
+    previous_breakdown = sprs[scout_name_][data_field_]
     previous_correct = previous_breakdown.get('correct', 0)
     previous_total = previous_breakdown.get('total', 0)
     if is_correct is True:
-        SPRS[scout_name_][data_field_]['correct'] = previous_correct + 1
+        sprs[scout_name_][data_field_]['correct'] = previous_correct + 1
     else:
-        SPRS[scout_name_][data_field_]['correct'] = previous_correct
-    SPRS[scout_name_][data_field_]['total'] = previous_total + 1
-
-for temp_timd in TEMP_TIMDS:
-    with open(utils.create_file_path(
-            f'data/cache/temp_timds/{temp_timd}'), 'r') as file:
-        file_data = file.read()
-    # Removes trailing newline (if it exists) from file data.
-    # Many file editors will automatically add a newline at the end of files.
-    file_data = file_data.rstrip('\n')
-
-    decompressed_temp_timd = decompressor.decompress_temp_timd(file_data)
-    temp_timd_name = list(decompressed_temp_timd)[0]
-    temp_timd_data = decompressed_temp_timd[temp_timd_name]
-
-    timd_name = temp_timd_name.split('-')[0]
-    try:
-        with open(utils.create_file_path(
-                f'data/cache/timds/{timd_name}.json'), 'r') as file:
-            timd_data = json.load(file)
-    except FileNotFoundError:
-        timd_data = {}
-
-    # Remove data fields that are not shared between tempTIMDs and TIMDs.
-    # tempTIMD specific data fields
-    scout_name = temp_timd_data.pop('scoutName')
-    assignment_mode = temp_timd_data.pop('assignmentMode')
-    cycle_number = temp_timd_data.pop('currentCycle', 0)
-    app_version = temp_timd_data.pop('appVersion')
-    assignment_file_timestamp = temp_timd_data.pop(
-        'assignmentFileTimestamp')
-    for data_field in ['timerStarted', 'scoutID']:
-        temp_timd_data.pop(data_field, None)
-    # TIMD specific data fields
-    for data_field in ['calculatedData', 'superNotes']:
-        timd_data.pop(data_field, None)
-
-    # Compares tempTIMD to TIMD
-    temp_timd_timeline = temp_timd_data.pop('timeline', [])
-    timd_timeline = timd_data.pop('timeline', [])
-
-    # Compares non-timed data fields
-    for key, value in temp_timd_data.items():
-        timd_value = timd_data.get(key)
-        if value == timd_value:
-            register_value(scout_name, key, True)
-        else:
-            register_value(scout_name, key, False)
-
-    # Compares the number of occurrences of each action type in the timeline
-    for type_ in ['intake', 'placement', 'drop', 'pinningFoul', 'climb',
-                  'incap', 'unincap', 'startDefense', 'endDefense']:
-        temp_timd_type_occurrences = 0
-        for action in temp_timd_timeline:
-            if action['type'] == type_:
-                temp_timd_type_occurrences += 1
-        timd_type_occurrences = 0
-        for action in timd_timeline:
-            if action['type'] == type_:
-                timd_type_occurrences += 1
-        if temp_timd_type_occurrences == timd_type_occurrences:
-            register_value(scout_name, type_, True)
-        else:
-            register_value(scout_name, type_, False)
-
-    # Increments 'matchesScouted'
-    SPRS[scout_name]['matchesScouted'] = SPRS[scout_name].get(
-        'matchesScouted', 0) + 1
-
-# Calculates overall SPR
-for scout_name, scout_breakdown in SPRS.items():
-    correct = 0
-    total = 0
-    for data_field, breakdown in scout_breakdown.items():
-        if data_field != 'matchesScouted':
-            correct += breakdown['correct']
-            total += breakdown['total']
-    SPRS[scout_name]['overall'] = correct / total
-
-# Saves SPRS to JSON file
-with open(utils.create_file_path('data/sprs/sprs.json'), 'w') as file:
-    json.dump(SPRS, file)
-
-# Exports SPRS to CSV file
-SPR_KEYS = ['scoutName', 'overall', 'matchesScouted']
-with open(utils.create_file_path(f'data/sprs/sprs.csv'),
-          'w') as file:
-    CSV_WRITER = csv.DictWriter(file, fieldnames=SPR_KEYS)
-    CSV_WRITER.writeheader()
-    for scout, breakdown in SPRS.items():
-        scout_breakdown = {}
-        for key in SPR_KEYS:
-            if key == 'scoutName':
-                scout_breakdown[key] = scout
-            else:
-                scout_breakdown[key] = breakdown[key]
-        CSV_WRITER.writerow(scout_breakdown)
+        sprs[scout_name_][data_field_]['correct'] = previous_correct
+    sprs[scout_name_][data_field_]['total'] = previous_total + 1
+
+def calculate_sprs():
+    """Calculates SPRs for every scout by comparing tempTIMDs to TIMDs.
+
+    Saves the SPRs to 'data/sprs/sprs.json' and 'data/sprs/sprs.csv'."""
+    # Scout name to SPR breakdown dictionary
+    # Example format: 'Sam C': {'placement': {'correct': 3}, {'total': 10}}
+    sprs = {}
+
+    # Uses the 'inputs' index in 'data_store' to find the tempTIMDs for
+    # each TIMD, so each TIMD is only read once.
+    for timd_name, temp_timd_names in data_store.read_input_groups(
+            'temp_timds').items():
+        timd_data = data_store.read('timds', timd_name)
+        if timd_data is None:
+            timd_data = {}
+        # Remove data fields that are not shared between tempTIMDs and
+        # TIMDs.
+        # TIMD specific data fields
+        for data_field in ['calculatedData', 'superNotes']:
+            timd_data.pop(data_field, None)
+        timd_timeline = timd_data.pop('timeline', [])
+
+        for temp_timd_name in temp_timd_names:
+            with open(utils.create_file_path(
+                    f'data/cache/temp_timds/{temp_timd_name}.txt'),
+                      'r') as file:
+                file_data = file.read()
+            # Removes trailing newline (if it exists) from file data.
+            # Many file editors will automatically add a newline at the
+            # end of files.
+            file_data = file_data.rstrip('\n')
+
+            decompressed_temp_timd = temp_timd_cache.decompress_temp_timd(
+                file_data)
+            temp_timd_data = list(decompressed_temp_timd.values())[0]
+
+            # tempTIMD specific data fields
+            scout_name = temp_timd_data.pop('scoutName')
+            for data_field in ['assignmentMode', 'currentCycle',
+                               'appVersion', 'assignmentFileTimestamp',
+                               'timerStarted', 'scoutID']:
+                temp_timd_data.pop(data_field, None)
+
+            # Compares tempTIMD to TIMD
+            temp_timd_timeline = temp_timd_data.pop('timeline', [])
+
+            # Compares non-timed data fields
+            for key, value in temp_timd_data.items():
+                timd_value = timd_data.get(key)
+                if value == timd_value:
+                    register_value(sprs, scout_name, key, True)
+                else:
+                    register_value(sprs, scout_name, key, False)
+
+            # Compares the number of occurrences of each action type in
+            # the timeline
+            for type_ in ['intake', 'placement', 'drop', 'pinningFoul',
+                          'climb', 'incap', 'unincap', 'startDefense',
+                          'endDefense']:
+                temp_timd_type_occurrences = 0
+                for action in temp_timd_timeline:
+                    if action['type'] == type_:
+                        temp_timd_type_occurrences += 1
+                timd_type_occurrences = 0
+                for action in timd_timeline:
+                    if action['type'] == type_:
+                        timd_type_occurrences += 1
+                if temp_timd_type_occurrences == timd_type_occurrences:
+                    register_value(sprs, scout_name, type_, True)
+                else:
+                    register_value(sprs, scout_name, type_, False)
+
+            # Increments 'matchesScouted'
+            sprs[scout_name]['matchesScouted'] = sprs[scout_name].get(
+                'matchesScouted', 0) + 1
+
+    # Calculates overall SPR
+    for scout_name, scout_breakdown in sprs.items():
+        correct = 0
+        total = 0
+        for data_field, breakdown in scout_breakdown.items():
+            if data_field != 'matchesScouted':
+                correct += breakdown['correct']
+                total += breakdown['total']
+        sprs[scout_name]['overall'] = correct / total
+
+    # Saves SPRs to JSON file
+    with open(utils.create_file_path('data/sprs/sprs.json'), 'w') as file:
+        json.dump(sprs, file)
+
+    # Exports SPRs to CSV file
+    with open(utils.create_file_path(f'data/sprs/sprs.csv'),
+              'w') as file:
+        csv_writer = csv.DictWriter(file, fieldnames=SPR_KEYS)
+        csv_writer.writeheader()
+        for scout, breakdown in sprs.items():
+            scout_breakdown = {}
+            for key in SPR_KEYS:
+                if key == 'scoutName':
+                    scout_breakdown[key] = scout
+                else:
+                    scout_breakdown[key] = breakdown[key]
+            csv_writer.writerow(scout_breakdown)
+
+if __name__ == '__main__':
+    # The 'inputs' index is kept up to date by server.py, which may not
+    # be running, so it is rebuilt from the cached tempTIMDs first.
+    input_registry.load_registry()
+    calculate_sprs()
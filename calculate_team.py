@@ -4,14 +4,15 @@
 Team calculations include the calculation of data points that are
 reflective of a team's performance across all of their matches.
 
-Called by server.py with the number of the Team to be calculated."""
+Called by server.py with the number of the Team to be calculated.  Can
+also be run from the command line with the number of the Team as an
+argument."""
 # External imports
-import json
-import os
 import sys
 import math
 import numpy as np
 # Internal imports
+import data_store
 import utils
 
 # Name of team calculated average data field to the respective timd data
@@ -940,33 +941,56 @@ def team_calculations(timds, team_number):
 
     return calculated_data
 
-# Check to ensure Team number is being passed as an argument
-if len(sys.argv) == 2:
-    # Extract Team number from system argument
-    # Team number is a string
-    TEAM_NUMBER = sys.argv[1]
-else:
-    print('Error: Team number not being passed as an argument. Exiting...')
-    sys.exit(0)
-
-# Uses the team number to find all the TIMDs for the passed team.
-TIMDS = []
-for timd in os.listdir(utils.create_file_path('data/cache/timds')):
-    if timd.split('Q')[0] == TEAM_NUMBER:
-        with open(utils.create_file_path(
-                f'data/cache/timds/{timd}')) as timd_file:
-            timd_data = json.load(timd_file)
-        # If there is no calculatedData in the timd, it hasn't been
-        # calculated yet, so it shouldn't be used in calculations.
-        if timd_data.get('calculatedData') is not None:
-            TIMDS.append(timd_data)
-
-FINAL_TEAM_DATA = {'calculatedData': team_calculations(TIMDS, TEAM_NUMBER)}
-
-# Save data in local cache
-utils.update_json_file(utils.create_file_path(
-    f'data/cache/teams/{TEAM_NUMBER}.json'), FINAL_TEAM_DATA)
-
-# Save data in Firebase upload queue
-utils.update_json_file(utils.create_file_path(
-    f'data/upload_queue/teams/{TEAM_NUMBER}.json'), FINAL_TEAM_DATA)
+def calculate_team(team_number, cache=None):
+    """Calculates a single team from its TIMDs, then saves it.
+
+    Saves the team's calculated data in the local cache and in the
+    Firebase upload queue.  Returns a list of the calculated data fields
+    that changed.
+
+    team_number is the number of the team (string)
+    cache is the 'event_cache.EventCache' to read the team's data from.
+    Defaults to reading it from 'data_store'."""
+    # Uses the team number index to find all the TIMDs for the passed
+    # team.
+    if cache is None:
+        team_timds = data_store.read_timds(team_number=team_number).values()
+        previous_team_data = data_store.read('teams', team_number)
+    else:
+        team_timds = cache.get_team_timds(team_number)
+        previous_team_data = cache.teams.get(team_number)
+    # If there is no calculatedData in the timd, it hasn't been
+    # calculated yet, so it shouldn't be used in calculations.
+    timds = [timd_data for timd_data in team_timds if
+             timd_data.get('calculatedData') is not None]
+
+    # Previous calculated data is used to find which data fields changed.
+    if previous_team_data is None:
+        previous_calculated_data = {}
+    else:
+        previous_calculated_data = previous_team_data.get(
+            'calculatedData', {})
+
+    final_team_data = {
+        'calculatedData': team_calculations(timds, team_number)}
+
+    # Save data in local cache
+    data_store.update('teams', team_number, final_team_data)
+
+    # Save data in Firebase upload queue
+    utils.update_json_file(utils.create_file_path(
+        f'data/upload_queue/teams/{team_number}.json'), final_team_data)
+
+    return [data_field for data_field, value in
+            final_team_data['calculatedData'].items() if
+            previous_calculated_data.get(data_field) != value]
+
+if __name__ == '__main__':
+    # Check to ensure Team number is being passed as an argument
+    if len(sys.argv) == 2:
+        # Extract Team number from system argument
+        # Team number is a string
+        calculate_team(sys.argv[1])
+    else:
+        print('Error: Team number not being passed as an argument. Exiting...')
+        sys.exit(0)
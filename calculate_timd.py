@@ -14,15 +14,18 @@ tempTIMDs per robot per match (aka 3 tempTIMDs per TIMD).  However, the
 number of tempTIMDs per TIMD may be less than 3, depending on scout
 availability, incorrect scout distribution, or missing data.
 
-Called by server.py with the name of the TIMD to be calculated."""
+Called by server.py with the name of the TIMD to be calculated.  Can also
+be run from the command line with the name of the TIMD as an argument."""
 # External imports
 import json
-import os
 import sys
-import subprocess
 # Internal imports
+import calculate_team
 import consolidation
-import decompressor
+import data_store
+import forward_temp_super
+import input_registry
+import temp_timd_cache
 import utils
 
 def percent_success(actions):
@@ -391,59 +394,68 @@ def calculate_timd_data(timd):
         calculated_data['timeDefending'] = 0.0
     return calculated_data
 
-# Check to ensure TIMD name is being passed as an argument
-if len(sys.argv) == 2:
-    # Extract TIMD name from system argument
-    TIMD_NAME = sys.argv[1]
-else:
-    print('Error: TIMD name not being passed as an argument. Exiting...')
-    sys.exit(0)
-
-COMPRESSED_TIMDS = []
-
-TEMP_TIMDS = {}
-
-# Goes into the temp_timds folder to get the names of all the tempTIMDs
-# that correspond to the given TIMD. Afterwards, the tempTIMDs are
-# decompressed and addded them to the TEMP_TIMDS dictionary with the
-# scout name as the key and the decompressed tempTIMD as the value.
-# This is needed for the consolidation function
-for temp_timd in os.listdir(utils.create_file_path('data/cache/temp_timds')):
-    if temp_timd.split('-')[0] == TIMD_NAME:
+def calculate_timd(timd_name):
+    """Consolidates and calculates a single TIMD, then saves it.
+
+    Saves the TIMD in the local cache and in the Firebase upload queue.
+    The data that depends on the TIMD (e.g. the team's data) is not
+    recalculated.  server.py uses 'dependency_graph' to recalculate it.
+
+    timd_name is the name of the TIMD (e.g. '1678Q3')"""
+    temp_timds = {}
+
+    # Uses the 'inputs' index in 'data_store' to get the names of all
+    # the tempTIMDs that correspond to the given TIMD. Afterwards, the
+    # tempTIMDs are decompressed and addded them to the 'temp_timds'
+    # dictionary with the scout name as the key and the decompressed
+    # tempTIMD as the value.  This is needed for the consolidation
+    # function.
+    for temp_timd in data_store.read_group_input_names(
+            'temp_timds', timd_name):
         file_path = utils.create_file_path(
-            f'data/cache/temp_timds/{temp_timd}')
+            f'data/cache/temp_timds/{temp_timd}.txt')
         with open(file_path, 'r') as file:
             compressed_temp_timd = file.read()
-        decompressed_temp_timd = list(decompressor.decompress_temp_timd(
+        decompressed_temp_timd = list(temp_timd_cache.decompress_temp_timd(
             compressed_temp_timd).values())[0]
         scout_name = decompressed_temp_timd.get('scoutName')
-        TEMP_TIMDS[scout_name] = decompressed_temp_timd
-
-# After the TEMP_TIMDS are decompressed, they are fed into the
-# consolidation script where they are returned as one final TIMD.
-FINAL_TIMD = consolidation.consolidate_temp_timds(TEMP_TIMDS)
-
-# Adds the matchNumber and teamNumber necessary for later team calcs.
-FINAL_TIMD['matchNumber'] = int(TIMD_NAME.split('Q')[1])
-FINAL_TIMD['teamNumber'] = int(TIMD_NAME.split('Q')[0])
-
-# Adds calculatedData to the FINAL_TIMD using the
-# add_calculated_data_to_timd function at the top of the file.
-FINAL_TIMD['calculatedData'] = calculate_timd_data(FINAL_TIMD)
-
-# Save data in local cache
-with open(utils.create_file_path(f'data/cache/timds/{TIMD_NAME}.json'),
-          'w') as file:
-    json.dump(FINAL_TIMD, file)
-
-# Save data in Firebase upload queue
-with open(utils.create_file_path(
-        f'data/upload_queue/timds/{TIMD_NAME}.json'), 'w') as file:
-    json.dump(FINAL_TIMD, file)
-
-# TODO: Make 'forward_temp_super' more efficient (call it less often)
-subprocess.call(f'python3 forward_temp_super.py', shell=True)
-
-# After the timd is calculated, the team is calculated.
-TEAM = TIMD_NAME.split('Q')[0]
-subprocess.call(f'python3 calculate_team.py {TEAM}', shell=True)
+        temp_timds[scout_name] = decompressed_temp_timd
+
+    # After the tempTIMDs are decompressed, they are fed into the
+    # consolidation script where they are returned as one final TIMD.
+    final_timd = consolidation.consolidate_temp_timds(temp_timds)
+
+    # Adds the matchNumber and teamNumber necessary for later team calcs.
+    final_timd['matchNumber'] = int(timd_name.split('Q')[1])
+    final_timd['teamNumber'] = int(timd_name.split('Q')[0])
+
+    # Adds calculatedData to the 'final_timd' using the
+    # calculate_timd_data function at the top of the file.
+    final_timd['calculatedData'] = calculate_timd_data(final_timd)
+
+    # Save data in local cache
+    data_store.write('timds', timd_name, final_timd)
+
+    # Save data in Firebase upload queue
+    with open(utils.create_file_path(
+            f'data/upload_queue/timds/{timd_name}.json'), 'w') as file:
+        json.dump(final_timd, file)
+
+if __name__ == '__main__':
+    # Check to ensure TIMD name is being passed as an argument
+    if len(sys.argv) == 2:
+        # Extract TIMD name from system argument
+        TIMD_NAME = sys.argv[1]
+        # The 'inputs' index is kept up to date by server.py, which may
+        # not be running (e.g. on a new computer), so it is rebuilt from
+        # the cached tempTIMDs first.
+        input_registry.load_registry()
+        calculate_timd(TIMD_NAME)
+        # Recalculating a TIMD replaces its tempSuper data, so the
+        # tempSuper data for the match is forwarded again.
+        forward_temp_super.forward_temp_super([TIMD_NAME.split('Q')[1]])
+        # After the timd is calculated, the team is calculated.
+        calculate_team.calculate_team(TIMD_NAME.split('Q')[0])
+    else:
+        print('Error: TIMD name not being passed as an argument. Exiting...')
+        sys.exit(0)
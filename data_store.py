@@ -0,0 +1,667 @@
+#!/usr/bin/python3.6
+"""Stores the calculated data in a single SQLite database.
+
+Replaces the folders of JSON files that were previously used for the
+calculated data in the local cache ('data/cache/timds',
+'data/cache/teams', 'data/cache/matches', and
+'data/cache/match_schedule').  Each folder is a table (a 'collection'),
+and each file is a row containing the same JSON data.  TIMDs are
+indexed by team number and match number, so loading every TIMD for a
+team (or for a match) is a single indexed query instead of opening every
+file in the folder.
+
+The database uses write-ahead logging (WAL), so the TIMD worker
+processes in server.py can save TIMDs while other processes read.
+
+The Firebase upload queue ('data/upload_queue') is not stored in the
+database.  The cached tempTIMDs and tempSupers are still stored as
+files, but the database has an index of them (the 'inputs' table, kept
+up to date by input_registry.py), so the tempTIMDs for a TIMD can be
+found in any process without listing the folder.
+
+The database also has a copy of the data last uploaded to Firebase (the
+'uploads' table, used by upload_data.py), so only the data that changed
+is uploaded, and a journal of the changes that are waiting to be
+uploaded (the 'upload_journal' table), which keeps them while Firebase
+is unreachable.  The decompressed tempSupers and tempTIMDs are saved in
+the 'temp_supers' and 'decompressed_temp_timds' tables (see
+temp_super_store.py and temp_timd_cache.py), so they are not
+decompressed again after a restart.
+
+Usage: python3 data_store.py <import|export>
+'import' adds the JSON files in the old cache layout to the database,
+and 'export' writes the database in the old cache layout (e.g. to
+inspect the data or to use it with an older version of the server)."""
+# External imports
+import contextlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+# Internal imports
+import utils
+
+DATABASE_FILE = 'data/cache/data.db'
+# Number of seconds to wait for another process to finish writing
+# before raising an error.
+BUSY_TIMEOUT = 30
+# Maximum number of parameters used in a single query.  Older versions
+# of SQLite allow up to 999.
+QUERY_PARAMETER_LIMIT = 500
+
+# Collection name to the columns it is indexed by.  The names of the
+# collections are the same as the names of the folders they replace.
+COLLECTIONS = {
+    'timds': ['team_number', 'match_number'],
+    'teams': ['team_number'],
+    'matches': ['match_number'],
+    'match_schedule': ['match_number'],
+}
+# Indexed column to its SQLite type.  Team numbers are strings
+# everywhere else in the server, and match numbers are integers so that
+# they are sorted numerically.
+COLUMN_TYPES = {
+    'team_number': 'TEXT',
+    'match_number': 'INTEGER',
+}
+
+# SQLite connections cannot be shared between processes or threads, so
+# each thread opens its own connection.
+LOCAL = threading.local()
+
+def create_tables(connection):
+    """Creates the table and indexes of each collection (if needed)."""
+    for collection, columns in COLLECTIONS.items():
+        column_definitions = ''.join([
+            f', {column} {COLUMN_TYPES[column]}' for column in columns])
+        connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {collection} (name TEXT PRIMARY '
+            f'KEY{column_definitions}, version INTEGER NOT NULL DEFAULT 0, '
+            f'data TEXT NOT NULL)')
+        # Adds the 'version' column to databases created before it was
+        # added.
+        existing_columns = [row[1] for row in connection.execute(
+            f'PRAGMA table_info({collection})')]
+        if 'version' not in existing_columns:
+            connection.execute(f'ALTER TABLE {collection} ADD COLUMN '
+                               f'version INTEGER NOT NULL DEFAULT 0')
+        for column in columns + ['version']:
+            connection.execute(
+                f'CREATE INDEX IF NOT EXISTS {collection}_{column} ON '
+                f'{collection} ({column})')
+    # Collection name to the version of its last write.  Stored
+    # separately from the rows, so a version is not reused when the
+    # newest row is deleted.
+    connection.execute('CREATE TABLE IF NOT EXISTS versions (collection '
+                       'TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+    for collection in COLLECTIONS:
+        connection.execute('INSERT OR IGNORE INTO versions VALUES (?, 0)',
+                           (collection,))
+    # Index of the cached inputs (e.g. tempTIMDs).  'group_name' is the
+    # name of the group the input is in (e.g. the TIMD of a tempTIMD).
+    connection.execute('CREATE TABLE IF NOT EXISTS inputs (folder TEXT, '
+                       'name TEXT, group_name TEXT, hash TEXT NOT NULL, '
+                       'PRIMARY KEY (folder, name))')
+    connection.execute('CREATE INDEX IF NOT EXISTS inputs_group_name ON '
+                       'inputs (folder, group_name, name)')
+    # Copy of the data last uploaded to Firebase.  'path' is a
+    # multi-location update path (e.g. 'TIMDs/1678Q3/startingLocation'),
+    # and 'value' is the JSON of the value that was uploaded to it.
+    connection.execute('CREATE TABLE IF NOT EXISTS uploads (path TEXT '
+                       'PRIMARY KEY, value TEXT NOT NULL)')
+    # Journal of the data waiting to be uploaded to Firebase.  Changes
+    # are appended in the order they were made ('sequence'), and older
+    # entries for the same path are removed by 'compact_journal'.
+    connection.execute('CREATE TABLE IF NOT EXISTS upload_journal (sequence '
+                       'INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT '
+                       'NULL, value TEXT NOT NULL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS upload_journal_path ON '
+                       'upload_journal (path, sequence)')
+    # Decompressed tempSupers, used by temp_super_store.py.  'hash' is
+    # the hash of the compressed tempSuper the row was decompressed from,
+    # and 'data' is the JSON of the decompressed tempSuper (or 'null' if
+    # it could not be decompressed).
+    connection.execute('CREATE TABLE IF NOT EXISTS temp_supers (name TEXT '
+                       'PRIMARY KEY, match_number INTEGER, hash TEXT NOT '
+                       'NULL, data TEXT NOT NULL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS temp_supers_match_number '
+                       'ON temp_supers (match_number)')
+    # Decompressed tempTIMDs (pickled), used by temp_timd_cache.py.
+    # 'key' is the key from 'temp_timd_cache.get_key', and 'input_hash'
+    # is the hash of the compressed tempTIMD (the same as its hash in the
+    # 'inputs' index), which is used to remove the rows of tempTIMDs
+    # that were edited or deleted.
+    existing_columns = [row[1] for row in connection.execute(
+        'PRAGMA table_info(decompressed_temp_timds)')]
+    if existing_columns != [] and 'input_hash' not in existing_columns:
+        # Created before 'input_hash' was added.  The rows cannot be
+        # removed without it, and are decompressed again if needed.
+        connection.execute('DROP TABLE decompressed_temp_timds')
+    connection.execute('CREATE TABLE IF NOT EXISTS decompressed_temp_timds '
+                       '(key TEXT PRIMARY KEY, input_hash TEXT NOT NULL, '
+                       'data BLOB NOT NULL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS '
+                       'decompressed_temp_timds_input_hash ON '
+                       'decompressed_temp_timds (input_hash)')
+
+def get_connection():
+    """Returns the connection to the database for the current thread.
+
+    Opens a new connection if the thread does not have one yet, if the
+    process was forked (e.g. a TIMD worker process), or if
+    'utils.MAIN_DIRECTORY' changed."""
+    # Directories are only created when a connection is opened, since
+    # 'os.makedirs' is slow compared to most queries.
+    database_path = utils.create_file_path(DATABASE_FILE, False)
+    key = (os.getpid(), database_path)
+    if getattr(LOCAL, 'key', None) != key:
+        utils.create_file_path(DATABASE_FILE)
+        # 'isolation_level=None' stops 'sqlite3' from starting
+        # transactions automatically, so transactions are only used
+        # where they are needed (see 'transaction').
+        connection = sqlite3.connect(database_path, timeout=BUSY_TIMEOUT,
+                                     isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # With WAL, 'NORMAL' only syncs at checkpoints.  A power loss
+        # can lose the most recent writes, but cannot corrupt the
+        # database, and the cache can always be recalculated.
+        connection.execute('PRAGMA synchronous=NORMAL')
+        create_tables(connection)
+        LOCAL.connection = connection
+        LOCAL.key = key
+    return LOCAL.connection
+
+def close():
+    """Closes the connection of the current thread.
+
+    Needs to be called before the database file is deleted (e.g. when
+    the server deletes the cache)."""
+    if getattr(LOCAL, 'key', None) is not None:
+        # A connection inherited from the parent process is not closed,
+        # since it is still used by the parent.
+        if LOCAL.key[0] == os.getpid():
+            LOCAL.connection.close()
+        LOCAL.connection = None
+        LOCAL.key = None
+
+@contextlib.contextmanager
+def transaction():
+    """Groups writes into a single transaction.
+
+    Saving many rows in one transaction is much faster than saving each
+    row separately, and other processes never see a partial update.
+    Transactions can be nested; only the outermost one is committed."""
+    connection = get_connection()
+    if connection.in_transaction:
+        yield connection
+        return
+    # 'IMMEDIATE' locks the database for writing when the transaction
+    # starts, so a read-modify-write (see 'update') cannot be interleaved
+    # with a write from another process.
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        yield connection
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+def get_index_values(collection, name):
+    """Returns the values of the indexed columns for a row (dict).
+
+    collection is the name of the collection (e.g. 'timds')
+    name is the name of the row (e.g. '1678Q3', '1678', or '3')"""
+    if collection == 'timds':
+        team_number, match_number = name.split('Q')
+        return {'team_number': team_number, 'match_number': int(match_number)}
+    elif COLLECTIONS[collection] == ['team_number']:
+        return {'team_number': name}
+    return {'match_number': int(name)}
+
+def read(collection, name):
+    """Returns the data of a single row (dict).
+
+    Returns None if the row does not exist.
+
+    collection is the name of the collection (e.g. 'teams')
+    name is the name of the row (e.g. '1678')"""
+    row = get_connection().execute(
+        f'SELECT data FROM {collection} WHERE name = ?', (name,)).fetchone()
+    if row is None:
+        return None
+    return json.loads(row[0])
+
+def read_all(collection):
+    """Returns a dict of row names to the data of every row.
+
+    collection is the name of the collection (e.g. 'match_schedule')"""
+    rows = get_connection().execute(f'SELECT name, data FROM {collection}')
+    return {name: json.loads(data) for name, data in rows}
+
+def read_timds(team_number=None, match_number=None):
+    """Returns a dict of TIMD names to TIMD data, in match order.
+
+    Uses the indexes, so only the TIMDs that are returned are read.
+
+    team_number is the team (string) to return the TIMDs of.  Defaults
+    to every team.
+    match_number is the match (string or int) to return the TIMDs of.
+    Defaults to every match."""
+    conditions = []
+    parameters = []
+    if team_number is not None:
+        conditions.append('team_number = ?')
+        parameters.append(str(team_number))
+    if match_number is not None:
+        conditions.append('match_number = ?')
+        parameters.append(int(match_number))
+    query = 'SELECT name, data FROM timds'
+    if conditions != []:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    # Orders the TIMDs by match, so the order of a team's TIMDs is the
+    # same every time they are read.
+    query += ' ORDER BY match_number'
+    rows = get_connection().execute(query, parameters)
+    return {name: json.loads(data) for name, data in rows}
+
+def read_changed(collection, version):
+    """Returns the rows saved after a version of a collection.
+
+    Returns a list of (name, version, data) tuples, in the order they
+    were saved.  Used to refresh data that was read earlier without
+    reading the rows that did not change (see event_cache.py).
+
+    collection is the name of the collection (e.g. 'teams')
+    version is the highest version that was already read (int), or -1
+    to return every row"""
+    rows = get_connection().execute(
+        f'SELECT name, version, data FROM {collection} WHERE version > ? '
+        f'ORDER BY version', (version,))
+    return [(name, row_version, json.loads(data)) for name, row_version,
+            data in rows]
+
+def count(collection):
+    """Returns the number of rows in a collection.
+
+    collection is the name of the collection (e.g. 'timds')"""
+    return get_connection().execute(
+        f'SELECT COUNT(*) FROM {collection}').fetchone()[0]
+
+def get_names(collection):
+    """Returns a list of the names of every row in a collection.
+
+    collection is the name of the collection (e.g. 'timds')"""
+    return [row[0] for row in get_connection().execute(
+        f'SELECT name FROM {collection}')]
+
+def write(collection, name, data):
+    """Saves the data of a row, replacing any previous data.
+
+    collection is the name of the collection (e.g. 'timds')
+    name is the name of the row (e.g. '1678Q3')
+    data is the data to save (dict)"""
+    index_values = get_index_values(collection, name)
+    columns = ['name'] + list(index_values) + ['version', 'data']
+    # Each write increases the version of the collection, which is used
+    # by 'read_changed'.
+    with transaction() as connection:
+        connection.execute('UPDATE versions SET version = version + 1 '
+                           'WHERE collection = ?', (collection,))
+        version = connection.execute(
+            'SELECT version FROM versions WHERE collection = ?',
+            (collection,)).fetchone()[0]
+        connection.execute(
+            f"INSERT OR REPLACE INTO {collection} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['?'] * len(columns))})",
+            [name] + list(index_values.values()) +
+            [version, json.dumps(data)])
+
+def update(collection, name, updated_data):
+    """Updates the data of a row.  (Preserves old data)
+
+    Nested dictionaries (i.e. 'calculatedData') are updated in the same
+    way as 'utils.update_json_file'.  Creates the row if it does not
+    exist.
+
+    collection is the name of the collection (e.g. 'teams')
+    name is the name of the row (e.g. '1678')
+    updated_data is the data to add to the row (dict)"""
+    with transaction():
+        data = read(collection, name)
+        if data is None:
+            data = {}
+        for key, value in updated_data.items():
+            if isinstance(value, dict):
+                data[key] = data.get(key, {})
+                data[key].update(value)
+            else:
+                data[key] = value
+        write(collection, name, data)
+
+def delete(collection, name):
+    """Deletes a row (if it exists).
+
+    collection is the name of the collection (e.g. 'timds')
+    name is the name of the row (e.g. '1678Q3')"""
+    get_connection().execute(
+        f'DELETE FROM {collection} WHERE name = ?', (name,))
+
+def write_input(folder_name, input_name, group_name, value_hash):
+    """Adds a cached input to the 'inputs' index, or updates its hash.
+
+    folder_name is the cache folder of the input (e.g. 'temp_timds')
+    input_name is the name of the input (e.g. '1678Q3-12')
+    group_name is the group the input is in (e.g. '1678Q3')
+    value_hash is the hash of the contents of the input (string)"""
+    get_connection().execute(
+        'INSERT OR REPLACE INTO inputs VALUES (?, ?, ?, ?)',
+        (folder_name, input_name, group_name, value_hash))
+
+def delete_input(folder_name, input_name):
+    """Removes a cached input from the 'inputs' index."""
+    get_connection().execute(
+        'DELETE FROM inputs WHERE folder = ? AND name = ?',
+        (folder_name, input_name))
+
+def delete_inputs(folder_name):
+    """Removes every input in a cache folder from the 'inputs' index."""
+    get_connection().execute('DELETE FROM inputs WHERE folder = ?',
+                             (folder_name,))
+
+def read_input_hashes(folder_name):
+    """Returns a dict of the names of the inputs in a cache folder to the
+    hashes of their contents.
+
+    folder_name is the cache folder of the inputs (e.g. 'temp_super')"""
+    return dict(get_connection().execute(
+        'SELECT name, hash FROM inputs WHERE folder = ?', (folder_name,)))
+
+def read_group_input_names(folder_name, group_name):
+    """Returns a list of the names of the inputs in a group.
+
+    Uses the group index, so it does not depend on the number of other
+    inputs.
+
+    folder_name is the cache folder of the inputs (e.g. 'temp_timds')
+    group_name is the name of the group (e.g. '1678Q3')"""
+    return [row[0] for row in get_connection().execute(
+        'SELECT name FROM inputs WHERE folder = ? AND group_name = ? '
+        'ORDER BY name', (folder_name, group_name))]
+
+def read_input_groups(folder_name):
+    """Returns a dict of group names to lists of the names of the inputs
+    in each group (e.g. TIMD names to the names of their tempTIMDs).
+
+    Groups and inputs are in order of name.  Uses the group index, so
+    the inputs are read in a single query without listing the cache
+    folder.
+
+    folder_name is the cache folder of the inputs (e.g. 'temp_timds')"""
+    input_groups = {}
+    for input_name, group_name in get_connection().execute(
+            'SELECT name, group_name FROM inputs WHERE folder = ? ORDER BY '
+            'group_name, name', (folder_name,)):
+        input_groups.setdefault(group_name, []).append(input_name)
+    return input_groups
+
+def get_document_path(path):
+    """Returns the path of the document that a path is in.
+
+    path is a multi-location update path (e.g.
+    'TIMDs/1678Q3/startingLocation' -> 'TIMDs/1678Q3')"""
+    return '/'.join(path.split('/')[:2])
+
+def is_document_path(path):
+    """Returns True if a path is the path of an entire document (e.g.
+    'TIMDs/1678Q3').
+
+    Only the removal of a document (from 'journal_removal') is journaled
+    at the path of a document.  Other changes are journaled at the paths
+    of their data fields."""
+    return path.count('/') == 1
+
+def read_uploads(paths):
+    """Returns a dict of paths to the JSON of the values last uploaded
+    to them.
+
+    Paths that have not been uploaded are not included.
+
+    paths is a list of multi-location update paths (e.g.
+    'TIMDs/1678Q3/startingLocation')"""
+    connection = get_connection()
+    uploads = {}
+    # SQLite limits the number of parameters in a query, so the paths are
+    # read in groups.
+    for i in range(0, len(paths), QUERY_PARAMETER_LIMIT):
+        group = paths[i:i + QUERY_PARAMETER_LIMIT]
+        uploads.update(connection.execute(
+            f"SELECT path, value FROM uploads WHERE path IN "
+            f"({', '.join(['?'] * len(group))})", group))
+    return uploads
+
+def read_pending_uploads(paths):
+    """Returns a dict of paths to the JSON of their most recent values
+    that were uploaded or are waiting in the upload journal.
+
+    Paths that have not been uploaded or journaled are not included.
+
+    paths is a list of multi-location update paths (e.g.
+    'TIMDs/1678Q3/startingLocation')"""
+    connection = get_connection()
+    pending_uploads = read_uploads(paths)
+    # Uploaded values inside a document that is waiting to be removed
+    # (e.g. a deleted TIMD) are removed with it, so they are not
+    # included.  Journal entries inside the document are newer than the
+    # removal (see 'journal_removal'), so they are still included.
+    document_paths = list({get_document_path(path) for path in paths})
+    removed_documents = set()
+    for i in range(0, len(document_paths), QUERY_PARAMETER_LIMIT):
+        group = document_paths[i:i + QUERY_PARAMETER_LIMIT]
+        removed_documents.update(row[0] for row in connection.execute(
+            f"SELECT path FROM upload_journal WHERE path IN "
+            f"({', '.join(['?'] * len(group))})", group))
+    for path in list(pending_uploads):
+        if get_document_path(path) in removed_documents:
+            del pending_uploads[path]
+    for i in range(0, len(paths), QUERY_PARAMETER_LIMIT):
+        group = paths[i:i + QUERY_PARAMETER_LIMIT]
+        # Rows are in order of 'sequence', so the most recent value of a
+        # path replaces the older ones.
+        pending_uploads.update(connection.execute(
+            f"SELECT path, value FROM upload_journal WHERE path IN "
+            f"({', '.join(['?'] * len(group))}) ORDER BY sequence", group))
+    return pending_uploads
+
+def append_journal(changes):
+    """Adds changes to the end of the upload journal.
+
+    changes is a dict of multi-location update paths to the JSON of
+    their new values"""
+    with transaction() as connection:
+        connection.executemany(
+            'INSERT INTO upload_journal (path, value) VALUES (?, ?)',
+            changes.items())
+
+def journal_removal(path):
+    """Adds the removal of a document (e.g. a deleted TIMD) to the end of
+    the upload journal.
+
+    Removes the journal entries inside the document, since they were
+    made before the removal and would re-create it.  The uploaded values
+    inside the document are removed by 'acknowledge_journal' once the
+    removal is uploaded.
+
+    path is the path of the document in Firebase (e.g. 'TIMDs/1678Q3')"""
+    # Every path inside 'path' starts with 'path/'.  '0' is the next
+    # character after '/', so the range includes every path that starts
+    # with 'path/' and can use the primary key index.
+    with transaction() as connection:
+        connection.execute(
+            'DELETE FROM upload_journal WHERE path >= ? AND path < ?',
+            (f'{path}/', f'{path}0'))
+        connection.execute(
+            'INSERT INTO upload_journal (path, value) VALUES (?, ?)',
+            (path, json.dumps(None)))
+
+def compact_journal():
+    """Removes every journal entry that has a more recent entry for the
+    same path.
+
+    Only the most recent value of a path needs to be uploaded, so a path
+    that changed many times while Firebase was unreachable is uploaded
+    once.  Returns the number of entries that were removed."""
+    with transaction() as connection:
+        return connection.execute(
+            'DELETE FROM upload_journal WHERE sequence NOT IN (SELECT '
+            'MAX(sequence) FROM upload_journal GROUP BY path)').rowcount
+
+def read_journal():
+    """Returns the entries in the upload journal, oldest first.
+
+    Each entry is a (sequence, path, JSON of the value) tuple."""
+    return get_connection().execute(
+        'SELECT sequence, path, value FROM upload_journal ORDER BY '
+        'sequence').fetchall()
+
+def acknowledge_journal(entries):
+    """Removes uploaded entries from the upload journal, and saves their
+    values as the values that were uploaded.
+
+    Both are saved in a single transaction, so an entry is never lost
+    between the two tables.  When the removal of a document is uploaded,
+    the uploaded values inside the document are also removed, so the
+    document is uploaded again if it is re-created.
+
+    entries is a list of (sequence, path, JSON of the value) tuples from
+    'read_journal'"""
+    with transaction() as connection:
+        connection.executemany(
+            'DELETE FROM upload_journal WHERE sequence = ?',
+            [(sequence,) for sequence, _, _ in entries])
+        connection.executemany(
+            'INSERT OR REPLACE INTO uploads VALUES (?, ?)',
+            [(path, value) for _, path, value in entries])
+        # Same range as in 'journal_removal'
+        connection.executemany(
+            'DELETE FROM uploads WHERE path >= ? AND path < ?',
+            [(f'{path}/', f'{path}0') for _, path, _ in entries
+             if is_document_path(path)])
+
+def read_temp_super_hashes():
+    """Returns a dict of tempSuper names to the hashes of the compressed
+    tempSupers they were decompressed from."""
+    return dict(get_connection().execute(
+        'SELECT name, hash FROM temp_supers'))
+
+def read_temp_supers(match_numbers=None):
+    """Returns a dict of tempSuper names to decompressed tempSupers.
+
+    The tempSupers are in order of match number, then name.  tempSupers
+    that could not be decompressed are None.
+
+    match_numbers is a list of the match numbers (strings or integers)
+    to read.  Defaults to every match."""
+    query = 'SELECT name, data FROM temp_supers'
+    parameters = []
+    if match_numbers is not None:
+        parameters = [int(match_number) for match_number in match_numbers]
+        # SQLite limits the number of parameters in a query.  Matches are
+        # read in groups if there are more.
+        if len(parameters) > QUERY_PARAMETER_LIMIT:
+            temp_supers = {}
+            for i in range(0, len(parameters), QUERY_PARAMETER_LIMIT):
+                temp_supers.update(read_temp_supers(
+                    parameters[i:i + QUERY_PARAMETER_LIMIT]))
+            return temp_supers
+        query += (f" WHERE match_number IN "
+                  f"({', '.join(['?'] * len(parameters))})")
+    return {name: json.loads(data) for name, data in get_connection().execute(
+        f'{query} ORDER BY match_number, name', parameters)}
+
+def write_temp_super(name, value_hash, data):
+    """Saves a decompressed tempSuper.
+
+    name is the name of the tempSuper (e.g. 'S!Q3-B')
+    value_hash is the hash of the compressed tempSuper
+    data is the decompressed tempSuper, or None if it could not be
+    decompressed"""
+    # tempSuper naming format: S!Q{match_number}-{alliance_color}
+    match_number = int(name.split('-')[0].split('Q')[1])
+    get_connection().execute(
+        'INSERT OR REPLACE INTO temp_supers VALUES (?, ?, ?, ?)',
+        (name, match_number, value_hash, json.dumps(data)))
+
+def delete_temp_super(name):
+    """Removes a decompressed tempSuper."""
+    get_connection().execute('DELETE FROM temp_supers WHERE name = ?',
+                             (name,))
+
+def read_decompressed_temp_timd(key):
+    """Returns a pickled decompressed tempTIMD (bytes), or None if it is
+    not saved.
+
+    key is the key from 'temp_timd_cache.get_key'"""
+    row = get_connection().execute(
+        'SELECT data FROM decompressed_temp_timds WHERE key = ?',
+        (key,)).fetchone()
+    return None if row is None else row[0]
+
+def write_decompressed_temp_timd(key, input_hash, pickled_temp_timd):
+    """Saves a pickled decompressed tempTIMD.
+
+    Replaces the other rows for the same compressed tempTIMD (e.g. from
+    before the assignments changed).
+
+    key is the key from 'temp_timd_cache.get_key'
+    input_hash is the hash of the compressed tempTIMD
+    pickled_temp_timd is the pickled decompressed tempTIMD (bytes)"""
+    with transaction() as connection:
+        connection.execute(
+            'DELETE FROM decompressed_temp_timds WHERE input_hash = ?',
+            (input_hash,))
+        connection.execute(
+            'INSERT OR REPLACE INTO decompressed_temp_timds VALUES '
+            '(?, ?, ?)', (key, input_hash, pickled_temp_timd))
+
+def delete_decompressed_temp_timds(input_hash):
+    """Removes the decompressed copies of a compressed tempTIMD.
+
+    input_hash is the hash of the compressed tempTIMD"""
+    get_connection().execute(
+        'DELETE FROM decompressed_temp_timds WHERE input_hash = ?',
+        (input_hash,))
+
+def import_files():
+    """Adds the JSON files in the old cache layout to the database.
+
+    Each file replaces the row with the same name.  The files are not
+    deleted."""
+    with transaction():
+        for collection in COLLECTIONS:
+            folder_path = utils.create_file_path(f'data/cache/{collection}')
+            for file_name in os.listdir(folder_path):
+                with open(os.path.join(folder_path, file_name), 'r') as file:
+                    # '.split()' removes '.json' file ending
+                    write(collection, file_name.split('.')[0],
+                          json.load(file))
+
+def export_files():
+    """Writes every row in the database as a JSON file in the old cache
+    layout (e.g. 'data/cache/timds/1678Q3.json')."""
+    for collection in COLLECTIONS:
+        for name, data in read_all(collection).items():
+            with open(utils.create_file_path(
+                    f'data/cache/{collection}/{name}.json'), 'w') as file:
+                json.dump(data, file)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in ['import', 'export']:
+        print('Usage: python3 data_store.py <import|export>')
+        sys.exit(1)
+    if sys.argv[1] == 'import':
+        import_files()
+    else:
+        export_files()
+    for COLLECTION in COLLECTIONS:
+        print(f'{COLLECTION}: {len(get_names(COLLECTION))} rows')
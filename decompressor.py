@@ -2,9 +2,9 @@
 
 Called by calculate_timd.py or forward_temp_super.py."""
 # External imports
-import json
+import re
 # Internal imports
-import utils
+import assignments
 
 # Compressed tempTIMD key to uncompressed tempTIMD key
 TEMP_TIMD_COMPRESSION_KEYS = {
@@ -85,6 +85,28 @@ TEMP_TIMD_COMPRESSION_VALUES = {
     'r': 'twoGamePieces',
     's': 'near',
 }
+# Regular expression of a compressed value in a tempTIMD timeline.  A
+# compressed value (e.g. '143.5' in 's143.5' or
+# '{D1;E0;F0}' in 'B{D1;E0;F0}') starts with any character (e.g. the
+# letter in 'tG').  After that, the value ends at the next letter, which
+# is the next key.  Letters inside curly brackets (e.g. in a climb
+# dictionary) are part of the value.  Characters that are not ASCII are
+# not allowed after the first character of a value, since 'isalpha' was
+# used to find keys.  Commas separate actions.
+# (The characters after the first one are matched as runs of a
+# character class, which is faster than matching each character with an
+# alternation.)
+TEMP_TIMD_VALUE = (r'(?:\{[^},]*\}|[^{,])[\x00-+\--@\[-`|-\x7f]*'
+                   r'(?:\{[^},]*\}[\x00-+\--@\[-`|-\x7f]*)*')
+# A comma, or a compressed key and its compressed value (e.g. 'tG')
+TEMP_TIMD_TIMELINE_TOKEN = re.compile(rf',|[A-Za-z]{TEMP_TIMD_VALUE}')
+# Compressed key and value (e.g. 'tG') to the decompressed key and value
+# (e.g. ('piece', 'panel')).  Most tokens are repeated many times in an
+# event, so each one is only decompressed once.
+DECOMPRESSED_TEMP_TIMD_TOKENS = {}
+# The cache is cleared when it has more tokens than this, so that its
+# memory is limited.
+MAX_CACHED_TEMP_TIMD_TOKENS = 100000
 
 def decompress_temp_timd_value(compressed_value):
     """Decompresses a single tempTIMD value.
@@ -109,16 +131,9 @@ def decompress_temp_timd_headers(compressed_headers):
 
     compressed_headers are non-timed data fields."""
 
-    with open(utils.create_file_path(
-            'data/assignments/assignments.json'), 'r') as file:
-        file_data = json.load(file)
-    # Decompressed scout name to compressed scout name
-    scout_name_compression_values = file_data['letters']
-
-    # Reverses key:value pairs to enable accessing decompressed scout
-    # name from compressed scout name
-    scout_name_compression_values = {letter: scout_name for \
-        scout_name, letter in scout_name_compression_values.items()}
+    # Compressed scout name to decompressed scout name.  The assignments
+    # file is only read again if it changed.
+    scout_name_compression_values = assignments.get_scout_names()
 
     if compressed_headers[-1] == ',':
         # Removes trailing comma.
@@ -141,85 +156,148 @@ def decompress_temp_timd_headers(compressed_headers):
 
     return decompressed_headers
 
+def decompress_temp_timd_action_by_character(action, key):
+    """Decompresses a single tempTIMD action one character at a time.
+
+    Only used for timelines that cannot be split into tokens by
+    'TEMP_TIMD_TIMELINE_TOKEN' (e.g. an action that ends with a key
+    without a value).
+    Returns the decompressed action and the last key in the action.
+
+    action is the compressed action (string)
+    key is the last key of the previous action (an action that does not
+    start with a key continues with it)"""
+    decompressed_action = {}
+    # Index of the last key in the action.
+    index_last_key = 0
+    inside_curly_bracket = False
+
+    for index, character in enumerate(action):
+        if character == '{':
+            inside_curly_bracket = True
+        elif character == '}':
+            inside_curly_bracket = False
+        if inside_curly_bracket is True:
+            # Ignore characters in curly brackets (e.g. climb), and
+            # deal with them later.
+            pass
+        # The character is the last character in the string
+        elif index == len(action)-1:
+            # Decompress the previous key and value
+            decompressed_key = TEMP_TIMD_COMPRESSION_KEYS[key]
+            # The previous value is from the last key to the end of
+            # the string.
+            compressed_value = action[index_last_key+1:]
+            decompressed_value = decompress_temp_timd_value(
+                compressed_value)
+
+            # Save the previous key:value pair in the final dictionary.
+            decompressed_action[decompressed_key] = decompressed_value
+        # Special handling for the first key
+        elif character.isalpha() and index == 0:
+            index_last_key = 0
+            key = character
+        # The character is a key if it is more than one character
+        # after the last key and it is a letter.
+        elif character.isalpha() and (index - index_last_key > 1):
+            # Decompress the previous key and value
+            decompressed_key = TEMP_TIMD_COMPRESSION_KEYS[key]
+            # The previous value is between the last key and the
+            # current key.
+            compressed_value = action[index_last_key+1:index]
+            decompressed_value = decompress_temp_timd_value(
+                compressed_value)
+
+            # Save the previous key:value pair in the final dictionary.
+            decompressed_action[decompressed_key] = decompressed_value
+
+            # Save the index and value of the key
+            index_last_key = index
+            key = character
+    return decompressed_action, key
+
+def decompress_climb(decompressed_action):
+    """Decompresses the climb dictionaries of a climb action.
+
+    decompressed_action is the action, with the compressed climb
+    dictionaries as strings (e.g. '{D1;E0;F0}')"""
+    for climb_key in ['attempted', 'actual']:
+        # 'climb_items' example format: ['D3', 'E3', 'F0']
+        # [1:-1] removes curly brackets
+        climb_items = decompressed_action[climb_key][1:-1].split(';')
+        decompressed_climb = {}
+        for climb_item in climb_items:
+            compressed_key = climb_item[0]
+            compressed_value = climb_item[1]
+            decompressed_key = TEMP_TIMD_COMPRESSION_KEYS[compressed_key]
+            decompressed_value = int(compressed_value)
+            decompressed_climb[decompressed_key] = decompressed_value
+        decompressed_action[climb_key] = decompressed_climb
+
+def decompress_temp_timd_token(token):
+    """Decompresses a single compressed key and value.
+
+    Returns a tuple of the decompressed key and the decompressed value.
+
+    token is a compressed key and its compressed value (e.g. 'tG')"""
+    decompressed_token = DECOMPRESSED_TEMP_TIMD_TOKENS.get(token)
+    if decompressed_token is None:
+        decompressed_token = (TEMP_TIMD_COMPRESSION_KEYS[token[0]],
+                              decompress_temp_timd_value(token[1:]))
+        if len(DECOMPRESSED_TEMP_TIMD_TOKENS) >= MAX_CACHED_TEMP_TIMD_TOKENS:
+            DECOMPRESSED_TEMP_TIMD_TOKENS.clear()
+        DECOMPRESSED_TEMP_TIMD_TOKENS[token] = decompressed_token
+    return decompressed_token
+
 def decompress_temp_timd_timeline(compressed_temp_timd_timeline):
     """Decompresses a single tempTIMD timeline.
 
     Decompresses a tempTIMD timeline to a list of dictionaries.
     Each dictionary represents an action in the timeline.
 
+    The timeline is split into its actions, keys, and values by a
+    single 'findall' of 'TEMP_TIMD_TIMELINE_TOKEN'.  A timeline with
+    characters that are not part of a token is decompressed one
+    character at a time instead, so that it is decompressed in the same
+    way as before the tokenizer was added.
+
     compressed_temp_timd_timeline is a string."""
     if compressed_temp_timd_timeline[-1] == ',':
         # In case of an extra comma in the headers it removes them
         compressed_temp_timd_timeline = compressed_temp_timd_timeline[:-1]
-    compressed_temp_timd_timeline = compressed_temp_timd_timeline.split(',')
     decompressed_timeline = []
-    for action in compressed_temp_timd_timeline:
-        decompressed_action = {}
-        # Index of the last key in the action.
-        index_last_key = 0
-        inside_curly_bracket = False
-
-        for index, character in enumerate(action):
-            if character == '{':
-                inside_curly_bracket = True
-            elif character == '}':
-                inside_curly_bracket = False
-            if inside_curly_bracket is True:
-                # Ignore characters in curly brackets (e.g. climb), and
-                # deal with them later.
-                pass
-            # The character is the last character in the string
-            elif index == len(action)-1:
-                # Decompress the previous key and value
-                decompressed_key = TEMP_TIMD_COMPRESSION_KEYS[key]
-                # The previous value is from the last key to the end of
-                # the string.
-                compressed_value = action[index_last_key+1:]
-                decompressed_value = decompress_temp_timd_value(
-                    compressed_value)
-
-                # Save the previous key:value pair in the final dictionary.
-                decompressed_action[decompressed_key] = decompressed_value
-            # Special handling for the first key
-            elif character.isalpha() and index == 0:
-                index_last_key = 0
-                key = character
-            # The character is a key if it is more than one character
-            # after the last key and it is a letter.
-            elif character.isalpha() and (index - index_last_key > 1):
-                # Decompress the previous key and value
-                decompressed_key = TEMP_TIMD_COMPRESSION_KEYS[key]
-                # The previous value is between the last key and the
-                # current key.
-                compressed_value = action[index_last_key+1:index]
-                decompressed_value = decompress_temp_timd_value(
-                    compressed_value)
-
-                # Save the previous key:value pair in the final dictionary.
-                decompressed_action[decompressed_key] = decompressed_value
-
-                # Save the index and value of the key
-                index_last_key = index
-                key = character
 
+    tokens = TEMP_TIMD_TIMELINE_TOKEN.findall(compressed_temp_timd_timeline)
+    # 'findall' skips the characters that are not part of a token, so
+    # the tokens are shorter than the timeline if any were skipped.
+    if len(''.join(tokens)) != len(compressed_temp_timd_timeline):
+        # Last key of the previous action
+        key = None
+        for action in compressed_temp_timd_timeline.split(','):
+            decompressed_action, key = \
+                decompress_temp_timd_action_by_character(action, key)
+            # Special case to deal with the data from the climb.
+            if decompressed_action.get('type') == 'climb':
+                decompress_climb(decompressed_action)
+            decompressed_timeline.append(decompressed_action)
+        return decompressed_timeline
+
+    decompressed_action = {}
+    for token in tokens:
+        if token != ',':
+            decompressed_key, decompressed_value = \
+                decompress_temp_timd_token(token)
+            decompressed_action[decompressed_key] = decompressed_value
+            continue
+        # The comma ends the action.
         # Special case to deal with the data from the climb.
-        # Finds which action dictionary has climb in it.
         if decompressed_action.get('type') == 'climb':
-            for climb_key in ['attempted', 'actual']:
-                # 'climb_items' example format: ['D3', 'E3', 'F0']
-                # [1:-1] removes curly brackets
-                climb_items = decompressed_action[climb_key][1:-1].split(';')
-                decompressed_climb = {}
-                for climb_item in climb_items:
-                    compressed_key = climb_item[0]
-                    compressed_value = climb_item[1]
-                    decompressed_key = TEMP_TIMD_COMPRESSION_KEYS[
-                        compressed_key]
-                    decompressed_value = int(compressed_value)
-                    decompressed_climb[decompressed_key] = decompressed_value
-                decompressed_action[climb_key] = decompressed_climb
-
+            decompress_climb(decompressed_action)
         decompressed_timeline.append(decompressed_action)
+        decompressed_action = {}
+    if decompressed_action.get('type') == 'climb':
+        decompress_climb(decompressed_action)
+    decompressed_timeline.append(decompressed_action)
     return decompressed_timeline
 
 def decompress_temp_timd(compressed_temp_timd):
@@ -277,16 +355,35 @@ TEMP_SUPER_COMPRESSION_VALUES = {
     'b': 'endDefense',
 }
 
+def split_temp_super(compressed_temp_super):
+    """Splits a single tempSuper into its name, headers, and teams.
+
+    Returns a tuple of the tempSuper name (e.g. 'S!Q3-B') and a list
+    containing the compressed headers and (if it exists) the compressed
+    teams.
+
+    compressed_temp_super is the full tempSuper"""
+    compressed_temp_super = compressed_temp_super.split('|')
+    return compressed_temp_super[0], compressed_temp_super[1].split('!')
+
 def decompress_temp_super_pushing_battles(compressed_temp_super):
     """HACK: Decompresses pushing_battles for a single tempSuper.
 
     NOT called by decompress_temp_super()
 
     compressed_temp_super is the full tempSuper"""
-    temp_super_key = compressed_temp_super.split('|')[0]
+    temp_super_key, compressed_sections = split_temp_super(
+        compressed_temp_super)
+    return decompress_pushing_battles(temp_super_key, compressed_sections[0])
+
+def decompress_pushing_battles(temp_super_key, compressed_header):
+    """Decompresses the pushing battles in the header of a tempSuper.
+
+    Returns None if the header cannot be decompressed.
+
+    temp_super_key is the name of the tempSuper (e.g. 'S!Q3-B')
+    compressed_header is the compressed tempSuper header (string)"""
     match_number = temp_super_key.split('-')[0].split('Q')[1]
-    compressed_value = compressed_temp_super.split('|')[1]
-    compressed_header = compressed_value.split('!')[0]
 
     # Currently, there is only 1 header: 'pushingBattles'
     # TODO: Add support for multiple headers
@@ -388,6 +485,22 @@ def decompress_temp_super_team(compressed_temp_super_team):
         decompressed_team_value[decompressed_key] = decompressed_value
     return decompressed_team_value
 
+def decompress_temp_super_teams(compressed_teams):
+    """Decompresses the teams of a single tempSuper.
+
+    Returns a list of dictionaries.
+
+    compressed_teams is the compressed tempSuper teams (string)"""
+    compressed_teams = compressed_teams.rstrip('_').split('_')
+
+    decompressed_temp_super = []
+
+    for compressed_team in compressed_teams:
+        decompressed_temp_super.append(decompress_temp_super_team(
+            compressed_team))
+
+    return decompressed_temp_super
+
 def decompress_temp_super(compressed_temp_super):
     """Decompresses a single tempSuper data.
 
@@ -395,14 +508,36 @@ def decompress_temp_super(compressed_temp_super):
     teamSuper teams data contains data that is specific to a team.
 
     compressed_temp_super is a string."""
-    temp_super_key = compressed_temp_super.split('|')[0]
-    compressed_value = compressed_temp_super.split('|')[1]
-    compressed_teams = compressed_value.split('!')[1].rstrip('_').split('_')
+    temp_super_key, compressed_sections = split_temp_super(
+        compressed_temp_super)
+    return {temp_super_key: decompress_temp_super_teams(
+        compressed_sections[1])}
 
-    decompressed_temp_super = []
+def decompress_temp_super_data(compressed_temp_super):
+    """Decompresses the teams and pushing battles of a single tempSuper.
 
-    for compressed_team in compressed_teams:
-        decompressed_temp_super.append(decompress_temp_super_team(
-            compressed_team))
+    Same as 'decompress_temp_super' and
+    'decompress_temp_super_pushing_battles', but only splits the
+    tempSuper once.  Returns a dictionary containing the 'teams' and the
+    'pushingBattles'.  Either of them is None if it cannot be
+    decompressed, so the other can still be used.
 
-    return {temp_super_key: decompressed_temp_super}
+    compressed_temp_super is the full tempSuper"""
+    temp_super_key, compressed_sections = split_temp_super(
+        compressed_temp_super)
+    try:
+        decompressed_teams = decompress_temp_super_teams(
+            compressed_sections[1])
+    except (IndexError, KeyError, ValueError):
+        print('Error: Unable to decompress tempSuper teams.')
+        decompressed_teams = None
+    try:
+        decompressed_pushing_battles = decompress_pushing_battles(
+            temp_super_key, compressed_sections[0])
+    except (IndexError, KeyError, ValueError):
+        print('Error: Unable to decompress tempSuper pushing battles.')
+        decompressed_pushing_battles = None
+    return {
+        'teams': decompressed_teams,
+        'pushingBattles': decompressed_pushing_battles,
+    }
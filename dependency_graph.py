@@ -0,0 +1,191 @@
+"""Keeps track of which data is out of date and needs to be recalculated.
+
+The server's data forms a dependency graph.  Each node is a single piece
+of data (e.g. the TIMD '1678Q3' or the team '1678').  When an input
+(e.g. a tempTIMD) changes, the nodes calculated from it are marked as
+dirty.  When server.py recalculates a dirty node, it marks the nodes
+calculated from that node as dirty, so they are recalculated after it
+(even if they are recalculated in a later loop).  server.py only
+recalculates dirty nodes, so the amount of work done in a loop depends
+on the amount of new data instead of the size of the event.
+
+Dependency graph:
+tempTIMD -> TIMD -> tempSuper forwarding, defense, team
+tempSuper -> tempSuper forwarding, Elo
+team -> abilities, predictions
+TBA -> match -> predictions
+
+Inputs can be held (e.g. until every scout has sent their tempTIMD for
+a TIMD) and released later, so a burst of inputs is only calculated
+once.
+
+Some stages only know which nodes they changed after they run (e.g.
+defense only changes the teams that played defense).  server.py marks
+those nodes as dirty using the return value of the stage.
+
+Called by server.py"""
+# External imports
+import threading
+import time
+# No internal imports
+
+# Every type of node in the dependency graph.
+# Named nodes use the TIMD name (e.g. '1678Q3'), team number (e.g.
+# '1678'), match number (e.g. '3'), or tempTIMD/tempSuper name as their
+# name.  Event-wide nodes ('elo' and 'abilities') use None as their name.
+NODE_TYPES = [
+    'temp_timd',
+    'temp_super',
+    'tba_match',
+    'timd',
+    'super_forward',
+    'elo',
+    'team',
+    'defense',
+    'predictions',
+    'abilities',
+]
+
+# Nodes that are downloaded instead of calculated.  They are never
+# recalculated, so only their dependents are marked as dirty.
+INPUT_NODE_TYPES = ['temp_timd', 'temp_super', 'tba_match']
+
+# Node type to the names of the dirty nodes of that type.
+DIRTY_NODES = {node_type: set() for node_type in NODE_TYPES}
+
+# Inputs whose dependents are not marked as dirty yet, because more
+# inputs for the same group (e.g. the other scouts' tempTIMDs for a TIMD)
+# are expected soon.  Group name (e.g. '1678Q3') to a dict containing
+# the held inputs as (node_type, node_name) tuples and the time (epoch)
+# the first input was held.
+HELD_GROUPS = {}
+
+# Team number (string) to the match numbers (strings) the team plays in.
+MATCHES_BY_TEAM = {}
+# Match number (string) to the team numbers (strings) in the match.
+TEAMS_BY_MATCH = {}
+
+# Stream handlers mark nodes as dirty from other threads, so all access
+# to 'DIRTY_NODES' and 'HELD_GROUPS' goes through this lock.
+LOCK = threading.RLock()
+
+def register_match(match_number, team_numbers):
+    """Adds a match from the match schedule to the dependency graph.
+
+    Predictions for a match depend on the teams in the match, so the
+    match schedule is needed to find the predictions that are calculated
+    from a team.
+
+    match_number is the number of the match (string)
+    team_numbers is a list of the team numbers (strings) in the match"""
+    with LOCK:
+        TEAMS_BY_MATCH[match_number] = list(team_numbers)
+        for team_number in team_numbers:
+            matches = MATCHES_BY_TEAM.setdefault(team_number, [])
+            if match_number not in matches:
+                matches.append(match_number)
+
+def get_dependents(node_type, node_name):
+    """Returns the nodes that are calculated directly from a single node.
+
+    Returns a list of (node_type, node_name) tuples."""
+    if node_type == 'temp_timd':
+        # Removes the scout ID to find the TIMD of the tempTIMD
+        # (e.g. '1678Q3-12' -> '1678Q3')
+        return [('timd', node_name.split('-')[0])]
+    elif node_type == 'temp_super':
+        # tempSuper naming format: S!Q{match_number}-{alliance_color}
+        # (e.g. S!Q3-B is the blue alliance in match 3)
+        match_number = node_name.split('-')[0].split('Q')[1]
+        return [('super_forward', match_number), ('elo', None)]
+    elif node_type == 'tba_match':
+        return [('predictions', node_name)]
+    elif node_type == 'timd':
+        team_number, match_number = node_name.split('Q')
+        # A TIMD is replaced when it is recalculated, so tempSuper data
+        # and defense data need to be added to it again.
+        return [('super_forward', match_number), ('defense', match_number),
+                ('team', team_number)]
+    elif node_type == 'team':
+        return [('predictions', match_number) for match_number in
+                MATCHES_BY_TEAM.get(node_name, [])] + [('abilities', None)]
+    # The other nodes do not have any dependents that are known before
+    # the node is calculated.
+    return []
+
+def mark_dirty(node_type, node_name=None):
+    """Marks a node as dirty.
+
+    Inputs are never recalculated, so the nodes calculated from an input
+    are marked as dirty instead.
+
+    node_type is one of 'NODE_TYPES'
+    node_name is the name of the node (None for event-wide nodes)"""
+    with LOCK:
+        if node_type in INPUT_NODE_TYPES:
+            mark_dependents(node_type, node_name)
+        else:
+            DIRTY_NODES[node_type].add(node_name)
+
+def mark_dependents(node_type, node_name=None):
+    """Marks every node that is calculated directly from a node as dirty.
+
+    Called after a node is recalculated.
+
+    node_type is one of 'NODE_TYPES'
+    node_name is the name of the node (None for event-wide nodes)"""
+    with LOCK:
+        for dependent_type, dependent_name in get_dependents(
+                node_type, node_name):
+            mark_dirty(dependent_type, dependent_name)
+
+def get_dirty(node_type):
+    """Returns the names of the dirty nodes of a type.
+
+    Does not mark them clean."""
+    with LOCK:
+        return set(DIRTY_NODES[node_type])
+
+def pop_dirty(node_type, is_selected=None):
+    """Returns the names of the dirty nodes of a type and marks them clean.
+
+    Nodes that are marked as dirty after this is called (e.g. by a later
+    stage in the same loop) are returned by the next call.
+
+    is_selected is a function that is passed a node name and returns
+    True if the node should be popped.  Defaults to every dirty node."""
+    with LOCK:
+        if is_selected is None:
+            dirty_nodes = DIRTY_NODES[node_type]
+            DIRTY_NODES[node_type] = set()
+        else:
+            dirty_nodes = {node_name for node_name in DIRTY_NODES[node_type]
+                           if is_selected(node_name)}
+            DIRTY_NODES[node_type] -= dirty_nodes
+    return dirty_nodes
+
+def has_dirty_nodes():
+    """Returns True if any node in the dependency graph is dirty."""
+    with LOCK:
+        return any(DIRTY_NODES.values())
+
+def hold(node_type, node_name, group_name):
+    """Holds an input node instead of marking it as dirty.
+
+    The node is marked as dirty when 'release' is called for its group,
+    so inputs that arrive close together are calculated once.
+
+    node_type is one of 'INPUT_NODE_TYPES'
+    node_name is the name of the node
+    group_name is the name of the group the node is released with"""
+    with LOCK:
+        group = HELD_GROUPS.setdefault(
+            group_name, {'inputs': set(), 'firstHoldTime': time.time()})
+        group['inputs'].add((node_type, node_name))
+
+def release(group_name):
+    """Marks every held input in a group as dirty."""
+    with LOCK:
+        group = HELD_GROUPS.pop(group_name, {'inputs': set()})
+        for node_type, node_name in group['inputs']:
+            mark_dirty(node_type, node_name)
@@ -0,0 +1,92 @@
+"""Holds the cached data for the entire event in memory.
+
+The calculation stages that use the data for every team or match (e.g.
+calculate_defense.py, calculate_predictions.py, and
+calculate_abilities.py) read it from a shared 'EventCache' object instead
+of each reading the entire data store.  server.py refreshes the object
+before each stage, which only reads the rows that were saved since the
+last refresh, so each row is only parsed once after it changes.
+
+The data in an 'EventCache' object is shared between the stages, so a
+stage that changes the data needs to copy it first.
+
+Called by server.py"""
+# No external imports
+# Internal imports
+import data_store
+
+class EventCache:
+    """The TIMDs, teams, matches, and match schedule of the event.
+
+    'timds', 'teams', 'matches', and 'match_schedule' are dicts of names
+    to data, in the same format as 'data_store.read_all'.  The TIMDs are
+    also indexed by team and by match in 'timds_by_team' and
+    'timds_by_match' (team or match number to a dict of TIMD names to
+    TIMD data)."""
+    def __init__(self):
+        # Collection name to a dict of row names to data
+        self.collections = {collection: {} for collection in
+                            data_store.COLLECTIONS}
+        self.timds = self.collections['timds']
+        self.teams = self.collections['teams']
+        self.matches = self.collections['matches']
+        self.match_schedule = self.collections['match_schedule']
+        self.timds_by_team = {}
+        self.timds_by_match = {}
+        # Collection name to the highest version that was read
+        self.versions = {collection: -1 for collection in
+                         data_store.COLLECTIONS}
+
+    def add_timd_to_indexes(self, timd_name, timd_data):
+        """Adds a TIMD to 'timds_by_team' and 'timds_by_match'."""
+        team_number, match_number = timd_name.split('Q')
+        self.timds_by_team.setdefault(team_number, {})[timd_name] = timd_data
+        self.timds_by_match.setdefault(match_number, {})[timd_name] = \
+            timd_data
+
+    def remove_timd_from_indexes(self, timd_name):
+        """Removes a TIMD from 'timds_by_team' and 'timds_by_match'."""
+        team_number, match_number = timd_name.split('Q')
+        for index, key in [(self.timds_by_team, team_number),
+                           (self.timds_by_match, match_number)]:
+            index.get(key, {}).pop(timd_name, None)
+            if index.get(key) == {}:
+                del index[key]
+
+    def refresh(self):
+        """Reads the rows that changed since the last refresh.
+
+        The first refresh reads every row."""
+        for collection, rows in self.collections.items():
+            for name, version, data in data_store.read_changed(
+                    collection, self.versions[collection]):
+                rows[name] = data
+                if collection == 'timds':
+                    self.add_timd_to_indexes(name, data)
+                self.versions[collection] = version
+            # Rows are rarely deleted (e.g. a TIMD with every tempTIMD
+            # deleted), so the names are only compared if the number of
+            # rows is different.
+            if len(rows) != data_store.count(collection):
+                names = set(data_store.get_names(collection))
+                for name in [name for name in rows if name not in names]:
+                    del rows[name]
+                    if collection == 'timds':
+                        self.remove_timd_from_indexes(name)
+
+    def get_team_timds(self, team_number):
+        """Returns a list of a team's TIMDs, in match order.
+
+        team_number is the number of the team (string)"""
+        return [timd_data for timd_name, timd_data in sorted(
+            self.timds_by_team.get(team_number, {}).items(),
+            key=lambda timd: int(timd[0].split('Q')[1]))]
+
+def load_event_cache():
+    """Returns an 'EventCache' object with every row in the data store.
+
+    Used when a stage is run without a shared 'EventCache' object (e.g.
+    from the command line)."""
+    event_cache = EventCache()
+    event_cache.refresh()
+    return event_cache
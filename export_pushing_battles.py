@@ -2,24 +2,21 @@
 """Collects and exports all Super Scout pushing battles to a CSV file."""
 # External imports
 import csv
-import os
 # Internal imports
-import decompressor
+import input_registry
+import temp_super_store
 import utils
 
-TEMP_SUPER_FILES = os.listdir(utils.create_file_path('data/cache/temp_super'))
-# Sorts by match number, since Elo needs to be in chronological order
-TEMP_SUPER_FILES.sort(key=lambda file_name: file_name.split('-')[0].split('Q')[1])
+# The 'inputs' index is kept up to date by server.py, which may not be
+# running, so it is rebuilt from the cached tempSupers first.
+input_registry.load_registry()
 
+# The tempSupers are in order of match number (as an integer), since Elo
+# needs to be in chronological order
 PUSHING_BATTLES = []
-for temp_super_file in TEMP_SUPER_FILES:
-    with open(utils.create_file_path(
-            f'data/cache/temp_super/{temp_super_file}'), 'r') as file:
-        compressed_temp_super = file.read()
-    decompressed_pushing_battles = \
-        decompressor.decompress_temp_super_pushing_battles(
-            compressed_temp_super)
-    PUSHING_BATTLES += decompressed_pushing_battles
+for temp_super in temp_super_store.read_temp_supers().values():
+    # Pushing battles that could not be decompressed are None
+    PUSHING_BATTLES += temp_super['pushingBattles'] or []
 
 # Orders pushing battle keys for CSV export
 CSV_HEADERS = ['matchNumber', 'winner', 'loser', 'winMarginIsLarge']
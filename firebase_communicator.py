@@ -5,16 +5,39 @@ import pyrebase
 
 URL = 'scouting-2019-cmp-d43a4'
 
+# Local stand-in for Firebase (e.g. 'local_firebase.LocalDatabase').
+# When set, it is returned instead of connecting to Firebase.
+LOCAL_DATABASE = None
+
+def use_local_database(database):
+    """Makes 'configure_firebase' return a local database.
+
+    Needs to be called before importing modules that configure Firebase
+    when they are imported (e.g. server.py and upload_data.py).
+
+    database is the local database (e.g. 'local_firebase.LocalDatabase')"""
+    global LOCAL_DATABASE
+    LOCAL_DATABASE = database
+
 def configure_firebase(url=None):
     """Returns a firebase database instance based on a database URL.
 
-    If no URL is given, use the default URL."""
+    If no URL is given, use the default URL.  The URL can also be the
+    full URL of a database (e.g. 'http://localhost:8200/' for a database
+    served by local_firebase.py).  If a local database is being used,
+    returns the local database instead."""
+    if LOCAL_DATABASE is not None:
+        return LOCAL_DATABASE
     if url is None:
         url = URL
+    if url.startswith('http'):
+        database_url = url
+    else:
+        database_url = f'https://{url}.firebaseio.com/'
     config = {
         'apiKey': 'mykey',
         'authDomain': f'{url}.firebaseapp.com',
-        'databaseURL': f'https://{url}.firebaseio.com/',
+        'databaseURL': database_url,
         'storageBucket': f'{url}.appspot.com',
     }
     firebase = pyrebase.initialize_app(config)
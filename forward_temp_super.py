@@ -7,10 +7,10 @@ Sends to 'matches' and 'timds' in the local cache, and to 'Matches' and
 'tempSuper', 'Matches', and 'TIMDs' are collections on Firebase."""
 # External imports
 import json
-import os
 # Internal imports
-import decompressor
-import firebase_communicator
+import data_store
+import input_registry
+import temp_super_store
 import utils
 
 def avg_without_zeroes(lis):
@@ -23,76 +23,91 @@ def avg_without_zeroes(lis):
     else:
         return sum(lis)/len(lis)
 
-# Uses default Firebase URL
-# DB stands for database
-DB = firebase_communicator.configure_firebase()
+def forward_temp_super(match_numbers=None):
+    """Forwards cached tempSuper data to the TIMDs in its match.
 
-# List of files (tempSuper datas) in the 'temp_super' cache directory.
-TEMP_SUPER_FILES = os.listdir(utils.create_file_path('data/cache/temp_super'))
+    Saves the forwarded data in the local cache and in the Firebase
+    upload queue.  TIMDs without tempTIMDs are skipped.  Returns a set of
+    the teams (strings) whose TIMDs were updated.
 
-# Match number (string) to list of tempSuper files for that match
-FILES_BY_MATCH = {}
-for file_name in TEMP_SUPER_FILES:
-    # tempSuper naming format:
-    # S!Q{match_number}-{alliance_color}
-    # (e.g. S!Q3-B is the blue alliance in match 3)
-    match_number = file_name.split('-')[0].split('Q')[1]
-    if FILES_BY_MATCH.get(match_number) is None:
-        FILES_BY_MATCH[match_number] = []
-    FILES_BY_MATCH[match_number].append(file_name)
-
-for match_number, files in FILES_BY_MATCH.items():
-    compressed_data = {}
-    for temp_super_file in files:
+    match_numbers is a list of the match numbers (strings) to forward.
+    Defaults to every match with tempSuper data."""
+    # Match number (string) to a dict of alliances ('R' or 'B') to the
+    # decompressed teams of the alliance's tempSuper data
+    temp_supers_by_match = {}
+    for temp_super_name, temp_super in temp_super_store.read_temp_supers(
+            match_numbers).items():
+        # Teams that could not be decompressed are None
+        if temp_super['teams'] is None:
+            continue
+        # tempSuper naming format:
+        # S!Q{match_number}-{alliance_color}
+        # (e.g. S!Q3-B is the blue alliance in match 3)
+        match_number = temp_super_name.split('-')[0].split('Q')[1]
         # Possible values of 'alliance': 'R' (red) or 'B' (blue)
-        alliance = temp_super_file.split('.')[0].split('-')[1]
-        with open(utils.create_file_path(
-                f'data/cache/temp_super/{temp_super_file}'), 'r') as file:
-            compressed_data[alliance] = file.read()
-    decompressed_data = {}
-    for alliance, alliance_data in compressed_data.items():
-        # Removes trailing newline (if it exists) from file data.
-        # Many file editors will automatically add a newline at the end of files.
-        alliance_data = alliance_data.rstrip('\n')
-        decompressed_data[alliance] = list(
-            decompressor.decompress_temp_super(alliance_data).values())[0]
+        alliance = temp_super_name.split('-')[1]
+        temp_supers_by_match.setdefault(match_number, {})[alliance] = \
+            temp_super['teams']
+
+    # Teams whose TIMDs were updated
+    updated_teams = set()
 
-    temp_super_teams = {}
-    for alliance, alliance_data in decompressed_data.items():
-        if alliance == 'R':
-            opponent_alliance = 'B'
-        else:
-            opponent_alliance = 'R'
-        for team in alliance_data:
-            team_number = team['teamNumber']
-            temp_super_teams[team_number] = {}
-            for key in ['rankAgility', 'rankDefense', 'rankSpeed']:
-                temp_super_teams[team_number][key] = team[key]
-            temp_super_teams[team_number]['superTimeline'] = team['timeline']
-            # Extracts defensive information for the 'team' from the
-            # tempSuper data for the opposing alliance.
-            opponent_data = decompressed_data.get(opponent_alliance, [])
-            team_data_from_opponents = {
-                'rankCounterDefense': [],
-                'rankResistance': [],
-            }
-            for opponent_team in opponent_data:
-                team_data = opponent_team['opponents']
-                team_data = [team2 for team2 in team_data if \
-                    team2['teamNumber'] == team_number][0]
-                for key, value_list in team_data_from_opponents.items():
-                    value_list.append(team_data[key])
-            for key, value_list_ in team_data_from_opponents.items():
-                temp_super_teams[team_number][key] = avg_without_zeroes(value_list_)
+    for match_number, decompressed_data in temp_supers_by_match.items():
+        temp_super_teams = {}
+        for alliance, alliance_data in decompressed_data.items():
+            if alliance == 'R':
+                opponent_alliance = 'B'
+            else:
+                opponent_alliance = 'R'
+            for team in alliance_data:
+                team_number = team['teamNumber']
+                temp_super_teams[team_number] = {}
+                for key in ['rankAgility', 'rankDefense', 'rankSpeed']:
+                    temp_super_teams[team_number][key] = team[key]
+                temp_super_teams[team_number]['superTimeline'] = \
+                    team['timeline']
+                # Extracts defensive information for the 'team' from the
+                # tempSuper data for the opposing alliance.
+                opponent_data = decompressed_data.get(opponent_alliance, [])
+                team_data_from_opponents = {
+                    'rankCounterDefense': [],
+                    'rankResistance': [],
+                }
+                for opponent_team in opponent_data:
+                    team_data = opponent_team['opponents']
+                    team_data = [team2 for team2 in team_data if \
+                        team2['teamNumber'] == team_number][0]
+                    for key, value_list in team_data_from_opponents.items():
+                        value_list.append(team_data[key])
+                for key, value_list_ in team_data_from_opponents.items():
+                    temp_super_teams[team_number][key] = \
+                        avg_without_zeroes(value_list_)
 
-    for team_number, data in temp_super_teams.items():
-        timd_name = f'{team_number}Q{match_number}'
-        for folder in ['cache', 'upload_queue']:
+        for team_number, data in temp_super_teams.items():
+            timd_name = f'{team_number}Q{match_number}'
+            # Skips TIMDs without tempTIMDs, which have not been
+            # calculated yet or have been deleted.  Calculating a TIMD
+            # forwards the tempSuper data for its match again.
+            if data_store.read_group_input_names(
+                    'temp_timds', timd_name) == []:
+                continue
+            data_store.update('timds', timd_name, data)
+            file_path = utils.create_file_path(
+                f'data/upload_queue/timds/{timd_name}.json')
             try:
-                with open(f'data/{folder}/timds/{timd_name}.json', 'r') as file:
+                with open(file_path, 'r') as file:
                     file_data = json.load(file)
             except FileNotFoundError:
                 file_data = {}
             file_data.update(data)
-            with open(f'data/{folder}/timds/{timd_name}.json', 'w') as file:
+            with open(file_path, 'w') as file:
                 json.dump(file_data, file)
+            updated_teams.add(str(team_number))
+
+    return updated_teams
+
+if __name__ == '__main__':
+    # The 'inputs' index is kept up to date by server.py, which may not
+    # be running, so it is rebuilt from the cached inputs first.
+    input_registry.load_registry()
+    forward_temp_super()
@@ -0,0 +1,650 @@
+#!/usr/bin/python3.6
+"""Generates a synthetic event to benchmark and test the server.
+
+Creates a match schedule, an assignment file, and compressed tempTIMDs
+and tempSupers in the same format that the Scout and Super Scout apps
+send (the format parsed by decompressor.py).  TBA responses (including
+match results and rankings) are generated from the same data, so the
+whole server can be run on the event.
+
+Every scout of a robot starts from the same actions, and each scout
+disagrees with the others on some of them (by missing the action, or
+recording a different result), in the same way as real scouts.
+
+The same arguments and seed always generate the same event, so
+benchmarks on generated events can be compared over time.
+
+The event is saved in the recorded event format used by
+replay_event.py.  'save_data_directory' saves the event in the same
+layout as the server's 'data' directory instead, with every tempTIMD
+and tempSuper in the cache.
+
+Usage: python3 generate_event.py <output file> [options]
+Run with '--help' for the options."""
+# External imports
+import argparse
+import json
+import random
+import string
+# Internal imports
+import data_store
+import decompressor
+import input_registry
+import utils
+
+# Same as 'tba_communicator.EVENT_CODE'.  Not imported, since
+# tba_communicator.py needs a TBA API key when it is imported.
+EVENT_CODE = '2019carv'
+# Used to find the number of matches if it is not given
+MATCHES_PER_TEAM = 12
+# Range of the number of teams at an event
+MIN_TEAM_COUNT = 40
+MAX_TEAM_COUNT = 600
+# Seconds between the starts of matches
+MATCH_CYCLE_TIME = 420
+# Length of a match in seconds.  Times in the timeline count down from
+# 'MATCH_LENGTH'.
+MATCH_LENGTH = 150
+SANDSTORM_END_TIME = 135
+# Probability that a robot does not show up to a match
+NO_SHOW_RATE = 0.01
+# Probability that a robot plays defense
+DEFENSE_RATE = 0.15
+# Seconds after the end of a match when data is sent.  Each item is a
+# (minimum, maximum) tuple.
+TEMP_TIMD_DELAY = (10, 60)
+TEMP_SUPER_DELAY = (30, 90)
+TBA_RESULTS_DELAY = (60, 180)
+
+# Uncompressed tempTIMD key to compressed tempTIMD key
+TEMP_TIMD_KEY_COMPRESSION = {
+    value: key for key, value in
+    decompressor.TEMP_TIMD_COMPRESSION_KEYS.items()}
+# Uncompressed tempTIMD value to compressed tempTIMD value.  Booleans
+# are compressed separately, since True == 1 and False == 0.
+TEMP_TIMD_VALUE_COMPRESSION = {
+    value: key for key, value in
+    decompressor.TEMP_TIMD_COMPRESSION_VALUES.items()
+    if not isinstance(value, bool)}
+# Uncompressed tempSuper key to compressed tempSuper key
+TEMP_SUPER_KEY_COMPRESSION = {
+    value: key for key, value in
+    decompressor.TEMP_SUPER_COMPRESSION_KEYS.items()}
+# Uncompressed tempSuper value to compressed tempSuper value
+TEMP_SUPER_VALUE_COMPRESSION = {
+    value: key for key, value in
+    decompressor.TEMP_SUPER_COMPRESSION_VALUES.items()
+    if not isinstance(value, bool)}
+# 'rankResistance' is reversed by decompressor.py (see the HACK there),
+# so it is reversed before it is compressed.
+RANK_RESISTANCE_COMPRESSION = {0: 0, 1: 3, 2: 2, 3: 1}
+
+def compress_temp_timd_value(value):
+    """Compresses a single tempTIMD value.
+
+    value is a boolean, number, string, or climb dictionary"""
+    if value is True:
+        return 'T'
+    elif value is False:
+        return 'F'
+    elif isinstance(value, int):
+        return str(value)
+    elif isinstance(value, float):
+        # Times are sent with a single decimal place
+        return f'{value:.1f}'
+    elif isinstance(value, dict):
+        # Climb dictionary (e.g. {'self': 3, 'robot1': 0, 'robot2': 0})
+        return '{' + ';'.join(TEMP_TIMD_KEY_COMPRESSION[key] + str(value_)
+                              for key, value_ in value.items()) + '}'
+    return TEMP_TIMD_VALUE_COMPRESSION[value]
+
+def compress_temp_timd(temp_timd_name, headers, timeline, letters):
+    """Compresses a single tempTIMD.
+
+    The reverse of 'decompressor.decompress_temp_timd'.
+
+    temp_timd_name is the name of the tempTIMD (e.g. '1678Q3-12')
+    headers is a dict of the non-timed data fields
+    timeline is a list of action dictionaries
+    letters is a dict of scout names to their compressed letters"""
+    compressed_headers = []
+    for key, value in headers.items():
+        if key == 'scoutName':
+            compressed_value = letters[value]
+        elif key == 'appVersion':
+            compressed_value = value
+        else:
+            compressed_value = compress_temp_timd_value(value)
+        compressed_headers.append(TEMP_TIMD_KEY_COMPRESSION[key] +
+                                  compressed_value)
+    compressed_timeline = [''.join(
+        TEMP_TIMD_KEY_COMPRESSION[key] + compress_temp_timd_value(value)
+        for key, value in action.items()) for action in timeline]
+    return (f"{temp_timd_name}|{','.join(compressed_headers)},_"
+            f"{','.join(compressed_timeline)}")
+
+def compress_temp_super_value(value):
+    """Compresses a single tempSuper value."""
+    if value is True:
+        return 'T'
+    elif value is False:
+        return 'F'
+    elif isinstance(value, (int, float)):
+        return str(value)
+    return TEMP_SUPER_VALUE_COMPRESSION[value]
+
+def compress_temp_super(temp_super_name, pushing_battles, teams):
+    """Compresses a single tempSuper.
+
+    The reverse of 'decompressor.decompress_temp_super' and
+    'decompressor.decompress_temp_super_pushing_battles'.
+
+    temp_super_name is the name of the tempSuper (e.g. 'S!Q3-B')
+    pushing_battles is a list of pushing battle dictionaries
+    teams is a list of the data for each team on the alliance"""
+    compressed_battles = ';'.join(''.join(
+        f'{TEMP_SUPER_KEY_COMPRESSION[key]}'
+        f'{compress_temp_super_value(value)},'
+        for key, value in battle.items()) for battle in pushing_battles)
+    compressed_teams = []
+    for team in teams:
+        compressed_items = []
+        for key, value in team.items():
+            if key in ['opponents', 'timeline']:
+                # Example format: '[u1678?y2?z1?,u254?y0?z3?,]'
+                compressed_list_items = []
+                for item in value:
+                    compressed_list_items.append(''.join(
+                        f'{TEMP_SUPER_KEY_COMPRESSION[key2]}'
+                        f'{compress_temp_super_value(value2)}?'
+                        for key2, value2 in item.items()) + ',')
+                compressed_value = f"[{''.join(compressed_list_items)}]"
+            else:
+                compressed_value = compress_temp_super_value(value)
+            compressed_items.append(TEMP_SUPER_KEY_COMPRESSION[key] +
+                                    compressed_value)
+        compressed_teams.append(';'.join(compressed_items) + ';')
+    return (f"{temp_super_name}|J[{compressed_battles}]!"
+            f"{'_'.join(compressed_teams)}_")
+
+def create_timeline(rng, team_skill, action_count, preload, is_defending):
+    """Returns the actions of a single robot in a match.
+
+    rng is the random number generator (random.Random)
+    team_skill is how good the team is, from 0 to 1
+    action_count is the number of intakes and placements in the match
+    preload is the game piece the robot starts with
+    is_defending is True if the robot plays defense"""
+    timeline = []
+    # Time between actions, so the actions fill the match
+    action_spacing = (SANDSTORM_END_TIME - 15) / max(action_count, 1)
+    time = MATCH_LENGTH - rng.uniform(2, 8)
+    # Sandstorm placement of the preloaded game piece
+    if rng.random() < 0.5 + team_skill / 2:
+        timeline.append({
+            'type': 'placement', 'time': time, 'piece': preload,
+            'didSucceed': rng.random() < 0.5 + team_skill / 2,
+            'wasDefended': False, 'structure': 'cargoShip',
+            'side': 'near', 'level': 1,
+        })
+    time = SANDSTORM_END_TIME
+    if is_defending:
+        timeline.append({'type': 'startDefense', 'time': time - 1})
+        time -= 2
+    piece = None
+    for _ in range(action_count):
+        time -= rng.uniform(0.5, 1.5) * action_spacing
+        if time < 15:
+            break
+        if piece is None:
+            piece = rng.choice(['cargo', 'panel'])
+            timeline.append({
+                'type': 'intake', 'time': time, 'piece': piece,
+                'zone': rng.choice(['leftLoadingStation',
+                                    'rightLoadingStation', 'zone1Left',
+                                    'zone2Right', 'zone3Left']),
+                'didSucceed': rng.random() < 0.7 + team_skill * 0.3,
+            })
+        elif rng.random() < 0.1:
+            timeline.append({'type': 'drop', 'time': time, 'piece': piece,
+                             'wasDefended': rng.random() < 0.3})
+            piece = None
+        else:
+            timeline.append({
+                'type': 'placement', 'time': time, 'piece': piece,
+                'didSucceed': rng.random() < 0.4 + team_skill * 0.6,
+                'wasDefended': rng.random() < 0.3,
+                'structure': rng.choice(['leftRocket', 'rightRocket',
+                                         'cargoShip']),
+                'side': rng.choice(['near', 'far']),
+                'level': rng.choice([1, 2, 3]),
+                'shotOutOfField': rng.random() < 0.03,
+            })
+            piece = None
+    if is_defending:
+        timeline.append({'type': 'endDefense', 'time': max(time - 1, 12.0),
+                         'failedCyclesCaused': rng.randint(0, 3)})
+    if rng.random() < 0.05:
+        timeline.append({'type': 'incap', 'time': 11.0,
+                         'cause': rng.choice(['tippedOver',
+                                              'brokenMechanism'])})
+        timeline.append({'type': 'unincap', 'time': 10.5})
+    if rng.random() < 0.4 + team_skill / 2:
+        level = rng.choice([1, 2, 3] if team_skill > 0.5 else [1, 2])
+        timeline.append({
+            'type': 'climb', 'time': rng.uniform(2, 9),
+            'attempted': {'self': level, 'robot1': 0, 'robot2': 0},
+            'actual': {'self': level if rng.random() < 0.8 else 0,
+                       'robot1': 0, 'robot2': 0},
+        })
+    return timeline
+
+def create_scout_timeline(rng, timeline, disagreement_rate):
+    """Returns the actions of a robot as recorded by a single scout.
+
+    rng is the random number generator (random.Random)
+    timeline is the list of actions the robot actually did
+    disagreement_rate is the probability (0 to 1) that the scout
+    records each action differently from the other scouts"""
+    scout_timeline = []
+    for action in timeline:
+        action = dict(action)
+        # Scouts do not tap at exactly the same time
+        action['time'] = max(action['time'] + rng.uniform(-1, 1), 0.1)
+        if rng.random() < disagreement_rate:
+            # Missed action.  Climbs are always recorded, since the
+            # Scout app requires them.
+            if action['type'] not in ['climb', 'startDefense', 'endDefense',
+                                      'incap', 'unincap'] and \
+                    rng.random() < 0.5:
+                continue
+            if 'didSucceed' in action:
+                action['didSucceed'] = not action['didSucceed']
+            elif 'level' in action:
+                action['level'] = rng.choice([1, 2, 3])
+        scout_timeline.append(action)
+    return scout_timeline
+
+def create_schedule(rng, teams, match_count):
+    """Returns the match schedule as a list of (red teams, blue teams).
+
+    Every team plays the same number of matches (+/- 1), and a team is
+    never in the same match twice."""
+    schedule = []
+    order = []
+    for _ in range(match_count):
+        match_teams = []
+        while len(match_teams) < 6:
+            # Teams that are already in the match stay at the front of
+            # 'order', so they play in the next match instead.
+            available_teams = [team for team in order
+                               if team not in match_teams]
+            if available_teams == []:
+                # Starts the next round.  Teams still in 'order' are not
+                # added again, so every team plays once in each round.
+                next_round = [team for team in teams if team not in order]
+                order += rng.sample(next_round, len(next_round))
+                continue
+            team = available_teams[0]
+            order.remove(team)
+            match_teams.append(team)
+        schedule.append((match_teams[:3], match_teams[3:]))
+    return schedule
+
+def score_alliance(timelines, starting_levels, hab_lines):
+    """Returns the score breakdown of an alliance (dict).
+
+    Only contains the fields used by forward_tba_data.py.
+
+    timelines is a list of the actual timelines of the alliance's robots
+    starting_levels is a list of the robots' starting levels (None if the
+    robot is a no-show)
+    hab_lines is a list of whether each robot crossed the hab line"""
+    breakdown = {}
+    score = 0
+    climb_points = 0
+    for driver_station, (timeline, starting_level, hab_line) in enumerate(
+            zip(timelines, starting_levels, hab_lines), 1):
+        breakdown[f'preMatchLevelRobot{driver_station}'] = \
+            'None' if starting_level is None else f'HabLevel{starting_level}'
+        breakdown[f'habLineRobot{driver_station}'] = \
+            'CrossedHabLineInSandstorm' if hab_line else 'None'
+        if hab_line:
+            score += 3 * starting_level
+        for action in timeline:
+            if action['type'] == 'placement' and action['didSucceed']:
+                score += 3 if action['piece'] == 'cargo' else 2
+            elif action['type'] == 'climb':
+                climb_points += [0, 3, 6, 12][action['actual']['self']]
+    breakdown['totalPoints'] = score + climb_points
+    breakdown['foulPoints'] = 0
+    breakdown['completeRocketRankingPoint'] = False
+    breakdown['habDockingRankingPoint'] = climb_points >= 15
+    return breakdown
+
+def create_rankings(ranking_points, matches_played):
+    """Returns TBA rankings for the matches that have been played.
+
+    ranking_points is a dict of team numbers to their total RPs
+    matches_played is a dict of team numbers to their matches played"""
+    teams = sorted(ranking_points, key=lambda team: (
+        -ranking_points[team], int(team)))
+    return {'rankings': [{
+        'team_key': f'frc{team}',
+        'rank': rank,
+        'matches_played': matches_played[team],
+        'extra_stats': [ranking_points[team]],
+    } for rank, team in enumerate(teams, 1)]}
+
+def generate_event(team_count=40, match_count=None, scouts_per_robot=3,
+                   actions_per_match=12, disagreement_rate=0.05,
+                   pushing_battle_density=1, seed=1):
+    """Returns a synthetic event in the recorded event format (dict).
+
+    team_count is the number of teams at the event (40 to 600)
+    match_count is the number of qualification matches.  Defaults to
+    enough matches for each team to play 'MATCHES_PER_TEAM' matches.
+    scouts_per_robot is the number of scouts that scout each robot
+    actions_per_match is the number of intakes and placements each robot
+    does in a match
+    disagreement_rate is the probability (0 to 1) that a scout records
+    an action differently from the other scouts
+    pushing_battle_density is the average number of pushing battles in
+    each match
+    seed is the seed of the random number generator"""
+    if not MIN_TEAM_COUNT <= team_count <= MAX_TEAM_COUNT:
+        raise ValueError(f'team_count must be from {MIN_TEAM_COUNT} to '
+                         f'{MAX_TEAM_COUNT}, not {team_count}')
+    rng = random.Random(seed)
+    if match_count is None:
+        match_count = -(-team_count * MATCHES_PER_TEAM // 6)
+    teams = [str(team) for team in rng.sample(range(1, 8000), team_count)]
+    # How good each team is, from 0 to 1
+    team_skills = {team: rng.random() for team in teams}
+    schedule = create_schedule(rng, teams, match_count)
+
+    # There is a scout for each robot in a match.  Scout names are
+    # compressed to a single letter, so there can be up to 52 scouts.
+    scout_names = [f'Scout {scout_id}' for scout_id in
+                   range(1, 6 * scouts_per_robot + 1)]
+    assignments = {
+        'matches': {},
+        'letters': {scout_name: letter for scout_name, letter in
+                    zip(scout_names, string.ascii_letters)},
+        'timestamp': 1549000000,
+    }
+
+    match_keys = [f'{EVENT_CODE}_qm{match_number}' for match_number in
+                  range(1, match_count + 1)]
+    # TBA match data before the matches are played
+    tba_matches = [{
+        'key': match_key,
+        'comp_level': 'qm',
+        'match_number': match_number,
+        'alliances': {
+            'red': {'team_keys': [f'frc{team}' for team in red_teams]},
+            'blue': {'team_keys': [f'frc{team}' for team in blue_teams]},
+        },
+        'score_breakdown': None,
+    } for match_number, (match_key, (red_teams, blue_teams)) in enumerate(
+        zip(match_keys, schedule), 1)]
+    tba = {
+        f'event/{EVENT_CODE}/teams/simple': [{
+            'key': f'frc{team}', 'team_number': int(team),
+            'nickname': f'Team {team}',
+        } for team in sorted(teams, key=int)],
+        f'event/{EVENT_CODE}/matches/simple': tba_matches,
+        f'event/{EVENT_CODE}/matches/keys': match_keys,
+        f'event/{EVENT_CODE}/rankings': create_rankings(
+            {team: 0 for team in teams}, {team: 0 for team in teams}),
+    }
+    for match_key, tba_match in zip(match_keys, tba_matches):
+        tba[f'match/{match_key}'] = tba_match
+
+    events = []
+    ranking_points = {team: 0 for team in teams}
+    matches_played = {team: 0 for team in teams}
+    # Rankings are updated after every team has played another match
+    rankings_interval = max(team_count // 6, 1)
+    for match_number, (red_teams, blue_teams) in enumerate(schedule, 1):
+        start_time = (match_number - 1) * MATCH_CYCLE_TIME
+        end_time = start_time + MATCH_LENGTH
+        events.append({'time': start_time,
+                       'path': 'scoutManagement/currentMatchNumber',
+                       'value': match_number})
+        assignments['matches'][match_number] = {
+            index: {'number': int(team), 'alliance': alliance}
+            for index, (team, alliance) in enumerate(
+                [(team, 'red') for team in red_teams] +
+                [(team, 'blue') for team in blue_teams], 1)}
+
+        score_breakdown = {}
+        defenders = {}
+        for alliance, alliance_teams in [('red', red_teams),
+                                         ('blue', blue_teams)]:
+            timelines = []
+            starting_levels = []
+            hab_lines = []
+            for driver_station, team in enumerate(alliance_teams, 1):
+                skill = team_skills[team]
+                is_no_show = rng.random() < NO_SHOW_RATE
+                preload = rng.choice(['cargo', 'panel'])
+                if is_no_show:
+                    starting_level = None
+                    timeline = []
+                else:
+                    starting_level = 2 if rng.random() < skill / 2 else 1
+                    defenders[team] = rng.random() < DEFENSE_RATE
+                    timeline = create_timeline(
+                        rng, skill, actions_per_match, preload,
+                        defenders[team])
+                hab_line = not is_no_show and rng.random() < 0.9
+                timelines.append(timeline)
+                starting_levels.append(starting_level)
+                hab_lines.append(hab_line)
+
+                # Scout IDs are numbered by driver station, so each
+                # scout has the same ID in every match.
+                first_scout_id = (driver_station - 1 + (
+                    3 if alliance == 'blue' else 0)) * scouts_per_robot + 1
+                for scout_id in range(first_scout_id,
+                                      first_scout_id + scouts_per_robot):
+                    temp_timd_name = f'{team}Q{match_number}-{scout_id}'
+                    headers = {
+                        'startingLevel': starting_level or 1,
+                        'crossedHabLine': hab_line,
+                        'startingLocation': rng.choice(['left', 'mid',
+                                                        'right']),
+                        'preload': preload,
+                        'driverStation': driver_station,
+                        'isNoShow': is_no_show,
+                        'timerStarted': 1549000000 + start_time,
+                        'currentCycle': 0,
+                        'scoutID': scout_id,
+                        'scoutName': scout_names[scout_id - 1],
+                        'appVersion': '1.2',
+                        'assignmentMode': 'QR',
+                        'assignmentFileTimestamp': assignments['timestamp'],
+                    }
+                    events.append({
+                        'time': end_time + rng.uniform(*TEMP_TIMD_DELAY),
+                        'path': f'tempTIMDs/{temp_timd_name}',
+                        'value': compress_temp_timd(
+                            temp_timd_name, headers, create_scout_timeline(
+                                rng, timeline, disagreement_rate),
+                            assignments['letters']),
+                    })
+            score_breakdown[alliance] = score_alliance(
+                timelines, starting_levels, hab_lines)
+
+        # Pushing battles between robots on opposite alliances.  Each
+        # battle is recorded by one of the super scouts.
+        pushing_battles = {'red': [], 'blue': []}
+        for _ in range(int(pushing_battle_density)):
+            pushing_battles[rng.choice(['red', 'blue'])].append(None)
+        if rng.random() < pushing_battle_density % 1:
+            pushing_battles[rng.choice(['red', 'blue'])].append(None)
+        for alliance, alliance_teams, opponent_teams in [
+                ('red', red_teams, blue_teams),
+                ('blue', blue_teams, red_teams)]:
+            battles = []
+            for _ in pushing_battles[alliance]:
+                winner = rng.choice(alliance_teams)
+                loser = rng.choice(opponent_teams)
+                if rng.random() < 0.5:
+                    winner, loser = loser, winner
+                battles.append({'winner': int(winner), 'loser': int(loser),
+                                'winMarginIsLarge': rng.random() < 0.3})
+            super_teams = []
+            for team in alliance_teams:
+                timeline = []
+                if defenders.get(team):
+                    timeline = [{'type': 'startDefense', 'time': 134.0},
+                                {'type': 'endDefense', 'time': 20.0}]
+                super_teams.append({
+                    'teamNumber': int(team),
+                    'rankAgility': rng.randint(1, 3),
+                    'rankSpeed': rng.randint(1, 3),
+                    'rankDefense': rng.randint(0, 3),
+                    'opponents': [{
+                        'teamNumber': int(opponent),
+                        'rankCounterDefense': rng.randint(0, 3),
+                        'rankResistance': RANK_RESISTANCE_COMPRESSION[
+                            rng.randint(0, 3)],
+                    } for opponent in opponent_teams],
+                    'timeline': timeline,
+                })
+            temp_super_name = f"S!Q{match_number}-{alliance[0].upper()}"
+            events.append({
+                'time': end_time + rng.uniform(*TEMP_SUPER_DELAY),
+                'path': f'tempSuper/{temp_super_name}',
+                'value': compress_temp_super(temp_super_name, battles,
+                                             super_teams),
+            })
+
+        # Match results and rankings
+        red_score = score_breakdown['red']['totalPoints']
+        blue_score = score_breakdown['blue']['totalPoints']
+        for alliance, alliance_teams, win_rps in [
+                ('red', red_teams, 2 * (red_score > blue_score)),
+                ('blue', blue_teams, 2 * (blue_score > red_score))]:
+            if red_score == blue_score:
+                win_rps = 1
+            score_breakdown[alliance]['rp'] = win_rps + int(
+                score_breakdown[alliance]['habDockingRankingPoint'])
+            for team in alliance_teams:
+                ranking_points[team] += score_breakdown[alliance]['rp']
+                matches_played[team] += 1
+        results_time = end_time + rng.uniform(*TBA_RESULTS_DELAY)
+        tba_match = dict(tba_matches[match_number - 1])
+        tba_match['score_breakdown'] = score_breakdown
+        events.append({'time': results_time,
+                       'tbaUrl': f'match/{match_keys[match_number - 1]}',
+                       'value': tba_match})
+        if match_number % rankings_interval == 0 or \
+                match_number == match_count:
+            events.append({'time': results_time,
+                           'tbaUrl': f'event/{EVENT_CODE}/rankings',
+                           'value': create_rankings(ranking_points,
+                                                    matches_played)})
+
+    events.sort(key=lambda event: event['time'])
+    return {
+        'assignments': assignments,
+        'firebase': {'scoutManagement': {
+            'currentMatchNumber': 1,
+            'cycleNumber': 0,
+            'QRcode': f'0_{assignments["timestamp"]}',
+            'availability': {scout_name: 1 for scout_name in scout_names},
+        }},
+        'tba': tba,
+        'events': events,
+    }
+
+def save_data_directory(recorded_event):
+    """Saves the final state of an event in the 'data' directory.
+
+    Saves the assignment file, the match schedule, every tempTIMD and
+    tempSuper, and the TBA cache, in the same files as the server, so
+    the calculations can be run on the event without replaying it.
+    Uses 'utils.MAIN_DIRECTORY', which should be changed first so the
+    real data is not overwritten.
+
+    recorded_event is the event returned by 'generate_event' (dict)"""
+    with open(utils.create_file_path('data/assignments/assignments.json'),
+              'w') as file:
+        json.dump(recorded_event['assignments'], file)
+    tba = dict(recorded_event['tba'])
+    with data_store.transaction():
+        for event in recorded_event['events']:
+            if 'tbaUrl' in event:
+                tba[event['tbaUrl']] = event['value']
+                continue
+            keys = event['path'].split('/')
+            if keys[0] == 'tempTIMDs':
+                folder_name = 'temp_timds'
+            elif keys[0] == 'tempSuper':
+                folder_name = 'temp_super'
+            else:
+                continue
+            with open(utils.create_file_path(
+                    f'data/cache/{folder_name}/{keys[1]}.txt'), 'w') as file:
+                file.write(event['value'])
+            # Indexes the input in the same way as the server, so the
+            # tempTIMDs for a TIMD can be found (e.g. by calculate_timd.py).
+            data_store.write_input(folder_name, keys[1],
+                                   input_registry.get_group_name(keys[1]),
+                                   input_registry.hash_value(event['value']))
+
+    with data_store.transaction():
+        for match_data in tba[f'event/{EVENT_CODE}/matches/simple']:
+            match_number = match_data['match_number']
+            data_store.write('match_schedule', str(match_number), {
+                'matchNumber': match_number,
+                'redTeams': [team[3:] for team in
+                             match_data['alliances']['red']['team_keys']],
+                'blueTeams': [team[3:] for team in
+                              match_data['alliances']['blue']['team_keys']],
+            })
+    # Same format as the cache in tba_communicator.py
+    with open(utils.create_file_path('data/cache/tba/tba.json'),
+              'w') as file:
+        json.dump({api_url: {
+            'last_requested': 0,
+            'last_modified': 'Thu, 01 Jan 1970 00:00:00 GMT',
+            'data': data,
+        } for api_url, data in tba.items()}, file)
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(
+        description='Generates a synthetic event.')
+    PARSER.add_argument('output_file', help='path of the recorded event')
+    PARSER.add_argument('--teams', type=int, default=40,
+                        help=f'number of teams ({MIN_TEAM_COUNT} to '
+                        f'{MAX_TEAM_COUNT})')
+    PARSER.add_argument('--matches', type=int, default=None,
+                        help='number of qualification matches')
+    PARSER.add_argument('--scouts-per-robot', type=int, default=3)
+    PARSER.add_argument('--actions-per-match', type=int, default=12)
+    PARSER.add_argument('--disagreement-rate', type=float, default=0.05)
+    PARSER.add_argument('--pushing-battle-density', type=float, default=1,
+                        help='average number of pushing battles per match')
+    PARSER.add_argument('--seed', type=int, default=1)
+    PARSER.add_argument('--data-directory', default=None,
+                        help="also save the event in the 'data' directory "
+                        'inside this directory')
+    ARGUMENTS = PARSER.parse_args()
+    if not MIN_TEAM_COUNT <= ARGUMENTS.teams <= MAX_TEAM_COUNT:
+        PARSER.error(f'--teams must be from {MIN_TEAM_COUNT} to '
+                     f'{MAX_TEAM_COUNT}')
+    RECORDED_EVENT = generate_event(
+        ARGUMENTS.teams, ARGUMENTS.matches, ARGUMENTS.scouts_per_robot,
+        ARGUMENTS.actions_per_match, ARGUMENTS.disagreement_rate,
+        ARGUMENTS.pushing_battle_density, ARGUMENTS.seed)
+    with open(ARGUMENTS.output_file, 'w') as file:
+        json.dump(RECORDED_EVENT, file)
+    if ARGUMENTS.data_directory is not None:
+        utils.MAIN_DIRECTORY = ARGUMENTS.data_directory
+        save_data_directory(RECORDED_EVENT)
+    print(f"Generated {len(RECORDED_EVENT['events'])} events for "
+          f"{ARGUMENTS.teams} teams")
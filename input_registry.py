@@ -0,0 +1,118 @@
+"""Keeps track of the cached tempTIMDs and tempSuper datas.
+
+Stores a hash of the contents of every cached input, so an input that
+is sent again (e.g. when a stream reconnects) can be told apart from an
+edited input without reading the cached file.  Also stores the inputs
+in each group (e.g. the tempTIMDs for a TIMD), so the inputs for a TIMD
+can be found without listing the cache directory.
+
+The registry is also saved in the 'inputs' index of data_store.py, so
+the TIMD worker processes (which do not share this process's memory)
+can find the tempTIMDs for a TIMD with an indexed query.
+
+Group names:
+tempTIMDs are grouped by TIMD (e.g. '1678Q3-12' is in the group '1678Q3')
+tempSupers are grouped by match (e.g. 'S!Q3-B' is in the group 'S!Q3')
+
+Called by server.py and snapshot.py"""
+# External imports
+import hashlib
+import os
+# Internal imports
+import data_store
+import temp_timd_cache
+import utils
+
+# Cache folders that contain inputs
+INPUT_FOLDERS = ['temp_timds', 'temp_super']
+
+# Folder name to a dict of input names to the hashes of their contents
+HASHES = {folder_name: {} for folder_name in INPUT_FOLDERS}
+# Folder name to a dict of group names to the set of input names in
+# the group
+INPUTS_BY_GROUP = {folder_name: {} for folder_name in INPUT_FOLDERS}
+
+def get_group_name(input_name):
+    """Returns the name of the group an input is in.
+
+    input_name is the name of a tempTIMD or tempSuper (e.g. '1678Q3-12')"""
+    return input_name.split('-')[0]
+
+def hash_value(value):
+    """Returns the hash of the contents of an input (string)."""
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+def add_to_registry(folder_name, input_name, value_hash):
+    """Adds an input to the registry, or updates its hash."""
+    HASHES[folder_name][input_name] = value_hash
+    INPUTS_BY_GROUP[folder_name].setdefault(
+        get_group_name(input_name), set()).add(input_name)
+    data_store.write_input(folder_name, input_name,
+                           get_group_name(input_name), value_hash)
+
+def remove_from_registry(folder_name, input_name):
+    """Removes an input from the registry."""
+    HASHES[folder_name].pop(input_name, None)
+    data_store.delete_input(folder_name, input_name)
+    group_name = get_group_name(input_name)
+    group = INPUTS_BY_GROUP[folder_name].get(group_name, set())
+    group.discard(input_name)
+    if group == set():
+        INPUTS_BY_GROUP[folder_name].pop(group_name, None)
+
+def load_registry():
+    """Adds every input in the cache to the registry.
+
+    Used when the server (re)starts with inputs already in the cache.
+    The cached files are read instead of the 'inputs' index, since a
+    crash can happen after a file is saved and before it is indexed."""
+    with data_store.transaction():
+        for folder_name in INPUT_FOLDERS:
+            data_store.delete_inputs(folder_name)
+            for file_name in os.listdir(utils.create_file_path(
+                    f'data/cache/{folder_name}')):
+                with open(utils.create_file_path(
+                        f'data/cache/{folder_name}/{file_name}'),
+                          'r') as file:
+                    value = file.read()
+                # Removes '.txt' ending
+                add_to_registry(folder_name, file_name.split('.')[0],
+                                hash_value(value))
+
+def save_input(folder_name, input_name, value):
+    """Saves an input in the cache if its contents changed.
+
+    Returns True if the input was added, edited, or deleted, and False
+    if the cache already contained the same data.
+
+    folder_name is one of 'INPUT_FOLDERS'
+    input_name is the name of the input (e.g. '1678Q3-12')
+    value is the compressed input (string), or None if the input was
+    deleted"""
+    file_path = utils.create_file_path(
+        f'data/cache/{folder_name}/{input_name}.txt')
+    old_hash = HASHES[folder_name].get(input_name)
+    if value is None:
+        if old_hash is None:
+            return False
+        os.remove(file_path)
+        remove_from_registry(folder_name, input_name)
+    else:
+        value_hash = hash_value(value)
+        if old_hash == value_hash:
+            return False
+        with open(file_path, 'w') as file:
+            file.write(value)
+        add_to_registry(folder_name, input_name, value_hash)
+    # The decompressed copy of the old tempTIMD is no longer needed.
+    if folder_name == 'temp_timds' and old_hash is not None:
+        temp_timd_cache.evict_temp_timd(old_hash)
+    return True
+
+def get_input_names(folder_name):
+    """Returns a list of the names of the inputs in a folder."""
+    return list(HASHES[folder_name])
+
+def count_group_inputs(folder_name, group_name):
+    """Returns the number of inputs in a group (e.g. tempTIMDs for a TIMD)."""
+    return len(INPUTS_BY_GROUP[folder_name].get(group_name, set()))
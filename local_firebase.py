@@ -0,0 +1,447 @@
+"""Local, in-memory stand-in for the Firebase Realtime Database.
+
+Supports the subset of the pyrebase API used by the server: 'child',
+'get', 'val', 'shallow', 'set', 'update' (including multi-location
+updates), 'remove', and 'stream' with 'put' and 'patch' events.
+
+The database can be used in-process (with
+'firebase_communicator.use_local_database'), or served over HTTP with
+the Firebase REST API (including streaming), so that pyrebase itself is
+used (with 'firebase_communicator.URL' set to the URL of the server).
+
+Latency and failures can be injected into every request, to profile the
+server (e.g. upload_data.py and the stream handlers) under load.  Failed
+requests raise the same errors as pyrebase, or respond with a 503
+status code over HTTP.
+
+Used by replay_event.py to run the server without a network connection.
+
+Usage: python3 local_firebase.py [port] [initial data file]
+Serves a local database over HTTP (e.g. at http://localhost:8200/)"""
+# External imports
+import copy
+import http.server
+import json
+import queue
+import random
+import socketserver
+import sys
+import threading
+import time
+import traceback
+import urllib.parse
+import requests
+# No internal imports
+
+# Default port of the local HTTP server
+HTTP_PORT = 8200
+# Seconds between the keep-alive events sent to HTTP streams.  Firebase
+# sends them every 30 seconds.  A shorter time is used so that closed
+# streams are found sooner.
+KEEP_ALIVE_INTERVAL = 5
+
+def split_path(path):
+    """Returns a list of the keys in a database path.
+
+    path is a database path (e.g. '/TIMDs/1678Q3')"""
+    return [key for key in str(path).split('/') if key != '']
+
+def get_value(data, keys):
+    """Returns the value at a list of keys in nested dicts, or None."""
+    for key in keys:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+def set_value(data, keys, value):
+    """Sets the value at a list of keys in nested dicts.
+
+    Setting a value to None deletes it.  Empty dicts are deleted, since
+    Firebase does not store them.  Returns the updated data."""
+    if keys == []:
+        if value == {}:
+            return None
+        return copy.deepcopy(value)
+    if not isinstance(data, dict):
+        data = {}
+    child_data = set_value(data.get(keys[0]), keys[1:], value)
+    if child_data is None:
+        data.pop(keys[0], None)
+    else:
+        data[keys[0]] = child_data
+    if data == {}:
+        return None
+    return data
+
+class LocalDatabase:
+    """The contents of a local database and its open streams.
+
+    latency is the number of seconds each request takes
+    failure_rate is the probability (0 to 1) that a request fails
+    seed is the seed of the random failures, so they can be repeated"""
+    def __init__(self, latency=0, failure_rate=0, seed=None):
+        self.data = None
+        self.streams = []
+        # List of (time, path) tuples for every value that is written.
+        # Used by replay_event.py to find when data was uploaded.
+        self.writes = []
+        self.lock = threading.RLock()
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        # Number of requests and failed requests, used to check the
+        # failures that were injected.
+        self.request_count = 0
+        self.failure_count = 0
+
+    def make_request(self):
+        """Simulates the latency and failures of a single request.
+
+        Raises 'requests.exceptions.ConnectionError' (the same error
+        that pyrebase raises without an internet connection) if the
+        request fails."""
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.lock:
+            self.request_count += 1
+            if self.random.random() >= self.failure_rate:
+                return
+            self.failure_count += 1
+        raise requests.exceptions.ConnectionError(
+            'Injected failure from local_firebase')
+
+    def disconnect_streams(self):
+        """Closes every open stream, as if the connection was lost.
+
+        The server restarts streams that are no longer running."""
+        with self.lock:
+            streams = list(self.streams)
+        for stream in streams:
+            stream.close()
+
+    def child(self, *args):
+        """Returns a reference to a child of the root of the database."""
+        return LocalReference(self, []).child(*args)
+
+    def update(self, data):
+        """Updates multiple locations at once (multi-location update)."""
+        LocalReference(self, []).update(data)
+
+    def write(self, locations, is_update):
+        """Writes values to the database and sends stream events.
+
+        locations is a dict of database paths (lists of keys) as tuples
+        to their new values
+        is_update is True if the write is from 'update', which causes
+        'patch' events to be sent instead of 'put' events"""
+        with self.lock:
+            write_time = time.time()
+            for keys, value in locations.items():
+                self.data = set_value(self.data, list(keys), value)
+                self.writes.append((write_time, '/'.join(keys)))
+            for stream in self.streams:
+                stream.send_events(locations, is_update)
+
+    def wait_for_streams(self):
+        """Waits until every open stream has handled all of its events."""
+        with self.lock:
+            streams = list(self.streams)
+        for stream in streams:
+            stream.events.join()
+
+class LocalResponse:
+    """Response of a 'get' request, in the same format as pyrebase."""
+    def __init__(self, value, key):
+        self.value = value
+        self.key_ = key
+
+    def val(self):
+        """Returns the value of the response."""
+        return self.value
+
+    def key(self):
+        """Returns the key of the requested location."""
+        return self.key_
+
+class LocalReference:
+    """Location in a local database, in the same format as pyrebase."""
+    def __init__(self, database, keys, is_shallow=False):
+        self.database = database
+        self.keys = keys
+        self.is_shallow = is_shallow
+
+    def child(self, *args):
+        """Returns a reference to a child of this location."""
+        keys = list(self.keys)
+        for arg in args:
+            keys += split_path(arg)
+        return LocalReference(self.database, keys)
+
+    def shallow(self):
+        """Makes 'get' only return the keys of the children."""
+        return LocalReference(self.database, self.keys, True)
+
+    def get(self):
+        """Returns the data at this location."""
+        self.database.make_request()
+        with self.database.lock:
+            value = copy.deepcopy(get_value(self.database.data, self.keys))
+        # Pyrebase returns the keys of the children for shallow requests.
+        if self.is_shallow and isinstance(value, dict):
+            value = value.keys()
+        return LocalResponse(value, self.keys[-1] if self.keys else None)
+
+    def set(self, data):
+        """Replaces the data at this location."""
+        self.database.make_request()
+        self.database.write({tuple(self.keys): data}, False)
+
+    def update(self, data):
+        """Updates the children of this location.
+
+        Keys of 'data' can be paths (e.g. 'TIMDs/1678Q3/teamNumber'),
+        which updates multiple locations at once."""
+        self.database.make_request()
+        self.database.write({tuple(self.keys + split_path(path)): value
+                             for path, value in data.items()}, True)
+
+    def remove(self):
+        """Deletes the data at this location."""
+        self.set(None)
+
+    def stream(self, stream_handler, stream_id=None):
+        """Calls 'stream_handler' with every change to this location.
+
+        The first event contains all of the data at this location."""
+        return LocalStream(self.database, self.keys, stream_handler,
+                           stream_id)
+
+class LocalStream:
+    """Sends the changes to a location to a stream handler."""
+    def __init__(self, database, keys, stream_handler, stream_id):
+        self.database = database
+        self.keys = keys
+        self.stream_handler = stream_handler
+        self.stream_id = stream_id
+        self.events = queue.Queue()
+        with database.lock:
+            self.events.put({
+                'event': 'put',
+                'path': '/',
+                'data': copy.deepcopy(get_value(database.data, keys)),
+            })
+            database.streams.append(self)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send_events(self, locations, is_update):
+        """Adds the events for a write to this stream's queue.
+
+        locations is a dict of database paths (tuples of keys) to values
+        is_update is True if the write is from 'update'"""
+        stream_keys = tuple(self.keys)
+        patch_data = {}
+        for keys, value in locations.items():
+            # The write is inside the streamed location
+            if keys[:len(stream_keys)] == stream_keys:
+                relative_keys = keys[len(stream_keys):]
+                if is_update and len(relative_keys) > 0:
+                    patch_data['/'.join(relative_keys)] = copy.deepcopy(value)
+                else:
+                    self.events.put({
+                        'event': 'put',
+                        'path': '/' + '/'.join(relative_keys),
+                        'data': copy.deepcopy(value),
+                    })
+            # The write replaces the streamed location
+            elif stream_keys[:len(keys)] == keys:
+                self.events.put({
+                    'event': 'put',
+                    'path': '/',
+                    'data': copy.deepcopy(get_value(
+                        value, list(stream_keys[len(keys):]))),
+                })
+        if patch_data != {}:
+            self.events.put({'event': 'patch', 'path': '/',
+                             'data': patch_data})
+
+    def run(self):
+        """Calls the stream handler with each event until closed."""
+        while True:
+            event = self.events.get()
+            if event is None:
+                self.events.task_done()
+                break
+            try:
+                self.stream_handler(event)
+            # An error in a stream handler stops the stream, in the same
+            # way as pyrebase.
+            except Exception:  # pylint: disable=broad-except
+                traceback.print_exc()
+                break
+            finally:
+                self.events.task_done()
+        with self.database.lock:
+            if self in self.database.streams:
+                self.database.streams.remove(self)
+        # Events that were not handled are discarded, so they do not
+        # block 'wait_for_streams'.
+        while True:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                break
+            self.events.task_done()
+
+    def close(self):
+        """Stops the stream."""
+        self.events.put(None)
+
+class LocalRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Responds to Firebase REST API requests for a local database.
+
+    Supports GET (including 'shallow=true' and streaming with
+    'Accept: text/event-stream'), PUT, PATCH, and DELETE."""
+    # Chunked encoding (used by streams) requires HTTP/1.1
+    protocol_version = 'HTTP/1.1'
+    # Set by 'start_http_server'
+    database = None
+
+    def get_reference(self):
+        """Returns the reference to the location of the request."""
+        url = urllib.parse.urlsplit(self.path)
+        path = urllib.parse.unquote(url.path)
+        # Removes '.json' from the end of the path
+        if path.endswith('.json'):
+            path = path[:-len('.json')]
+        reference = self.database.child(path)
+        if urllib.parse.parse_qs(url.query).get('shallow') == ['true']:
+            reference = reference.shallow()
+        return reference
+
+    def send_json(self, status_code, data):
+        """Sends a response containing JSON data."""
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        """Returns the JSON data in the body of the request."""
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def handle_request(self, method):
+        """Runs a request on the local database and sends the response.
+
+        method is the HTTP method of the request (e.g. 'PATCH')"""
+        reference = self.get_reference()
+        try:
+            if method == 'GET':
+                data = reference.get().val()
+                if reference.is_shallow and data is not None:
+                    data = {key: True for key in data}
+            elif method == 'PUT':
+                data = self.read_json()
+                reference.set(data)
+            elif method == 'PATCH':
+                data = self.read_json()
+                reference.update(data)
+            else:
+                data = None
+                reference.remove()
+        # Injected failures are sent as a 503 (Service Unavailable) status
+        # code, which pyrebase raises as 'requests.exceptions.HTTPError'.
+        except requests.exceptions.ConnectionError:
+            self.send_json(503, {'error': 'Injected failure'})
+            return
+        self.send_json(200, data)
+
+    def stream(self):
+        """Sends the changes to a location as server-sent events."""
+        reference = self.get_reference()
+        events = queue.Queue()
+        stream = reference.stream(events.put)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        # Firebase sends streams with chunked encoding, which pyrebase
+        # needs in order to close a stream.
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            while stream.thread.is_alive():
+                try:
+                    event = events.get(timeout=KEEP_ALIVE_INTERVAL)
+                except queue.Empty:
+                    message = 'event: keep-alive\ndata: null\n\n'
+                else:
+                    data = json.dumps({'path': event['path'],
+                                       'data': event['data']})
+                    message = f"event: {event['event']}\ndata: {data}\n\n"
+                message = message.encode('utf-8')
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(message), message))
+                self.wfile.flush()
+        # The client closed the stream
+        except OSError:
+            pass
+        finally:
+            stream.close()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Responds to a GET request, which can open a stream."""
+        if 'text/event-stream' in self.headers.get('Accept', ''):
+            self.stream()
+        else:
+            self.handle_request('GET')
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Responds to a PUT request ('set' in pyrebase)."""
+        self.handle_request('PUT')
+
+    def do_PATCH(self):  # pylint: disable=invalid-name
+        """Responds to a PATCH request ('update' in pyrebase)."""
+        self.handle_request('PATCH')
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        """Responds to a DELETE request ('remove' in pyrebase)."""
+        self.handle_request('DELETE')
+
+    # Arguments are passed by 'http.server', and are not used.
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Prevents each request from being printed."""
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server that handles each request in a separate thread.
+
+    Each open stream uses a thread for as long as it is open."""
+    daemon_threads = True
+
+def start_http_server(database, port=HTTP_PORT):
+    """Serves a local database over HTTP in a separate thread.
+
+    Returns the URL of the database, which can be used as
+    'firebase_communicator.URL'.
+
+    database is the local database to serve
+    port is the port the HTTP server listens on (int).  0 uses any free
+    port."""
+    handler = type('RequestHandler', (LocalRequestHandler,),
+                   {'database': database})
+    server = ThreadingHTTPServer(('localhost', port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f'http://localhost:{server.server_address[1]}/'
+
+if __name__ == '__main__':
+    DATABASE = LocalDatabase()
+    if len(sys.argv) == 3:
+        with open(sys.argv[2], 'r') as file:
+            DATABASE.child('/').set(json.load(file))
+    PORT = int(sys.argv[1]) if len(sys.argv) > 1 else HTTP_PORT
+    print(f'Serving local database at {start_http_server(DATABASE, PORT)}')
+    while True:
+        time.sleep(60)
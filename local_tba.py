@@ -0,0 +1,198 @@
+"""Local stand-in for The Blue Alliance (TBA) API v3.
+
+Serves recorded or synthetic TBA responses from a local HTTP server, so
+the server can run without a network connection (e.g. in
+replay_event.py).  Sends 'Last-Modified' headers and responds to
+'If-Modified-Since' headers in the same way as TBA, so the caching in
+tba_communicator.py is used.
+
+Latency, rate limits, and outages can be simulated, to benchmark the
+files that use TBA (e.g. forward_tba_data.py, prepare_firebase.py, and
+'cache_match_schedule' in server.py) under the conditions at
+competition.
+
+Use 'start_local_tba' and set 'tba_communicator.BASE_URL' to the URL it
+returns.
+
+Usage: python3 local_tba.py <responses file> [port]
+The responses file is in the same format as 'data/cache/tba/tba.json',
+so the TBA cache from an event can be served as a recording."""
+# External imports
+import email.utils
+import http.server
+import json
+import socketserver
+import sys
+import threading
+import time
+# No internal imports
+
+# Default port of the local HTTP server
+HTTP_PORT = 8300
+# Number of seconds each response is delayed by
+LATENCY = 0
+# Maximum number of requests in each 'RATE_LIMIT_WINDOW' seconds.
+# Requests over the limit are sent a 429 (Too Many Requests) status
+# code.  None disables the rate limit.
+RATE_LIMIT = None
+RATE_LIMIT_WINDOW = 1
+# Time (epoch) when the current outage ends.  During an outage, the
+# connection is closed without a response, which tba_communicator.py
+# treats the same as a lost internet connection.
+OUTAGE_END_TIME = 0
+
+# API url (the path after '/api/v3/') to a dict containing the recorded
+# 'data' and its 'lastModified' time (epoch)
+RESPONSES = {}
+# Times (epoch) of the requests in the current rate limit window
+REQUEST_TIMES = []
+# Status code (e.g. 304) to the number of responses sent with it.
+# Outages are counted as status code 0.
+RESPONSE_COUNTS = {}
+# The HTTP server reads the responses from different threads.
+LOCK = threading.Lock()
+
+def set_response(api_url, data):
+    """Sets the data that is served for an API url.
+
+    api_url is the url of the API request (e.g. 'event/2019carv/rankings')
+    data is the response to the request (e.g. a list or dict), or None
+    to respond with a 404 status code"""
+    with LOCK:
+        if data is None:
+            RESPONSES.pop(api_url, None)
+        else:
+            # HTTP dates have a resolution of 1 second, so the time is
+            # increased if the data changes twice in the same second.
+            # Otherwise, the second change would be sent as a 304.
+            last_modified = time.time()
+            if api_url in RESPONSES:
+                last_modified = max(
+                    last_modified, RESPONSES[api_url]['lastModified'] + 1)
+            RESPONSES[api_url] = {'data': data,
+                                  'lastModified': last_modified}
+
+def load_responses(file_path):
+    """Sets the responses for every API url in a recorded TBA cache.
+
+    file_path is the path of a file in the same format as
+    'data/cache/tba/tba.json'"""
+    with open(file_path, 'r') as file:
+        cached_requests = json.load(file)
+    for api_url, cached_request in cached_requests.items():
+        set_response(api_url, cached_request['data'])
+
+def start_outage(duration):
+    """Stops responding to requests for a number of seconds.
+
+    duration is the length of the outage in seconds"""
+    global OUTAGE_END_TIME
+    OUTAGE_END_TIME = time.time() + duration
+
+def count_response(status_code):
+    """Adds a response to 'RESPONSE_COUNTS'."""
+    with LOCK:
+        RESPONSE_COUNTS[status_code] = RESPONSE_COUNTS.get(status_code, 0) + 1
+
+def is_rate_limited():
+    """Records a request and returns True if it is over the rate limit."""
+    if RATE_LIMIT is None:
+        return False
+    request_time = time.time()
+    with LOCK:
+        # Removes the requests from before the current window
+        while REQUEST_TIMES != [] and \
+                REQUEST_TIMES[0] <= request_time - RATE_LIMIT_WINDOW:
+            REQUEST_TIMES.pop(0)
+        if len(REQUEST_TIMES) >= RATE_LIMIT:
+            return True
+        REQUEST_TIMES.append(request_time)
+    return False
+
+class TBARequestHandler(http.server.BaseHTTPRequestHandler):
+    """Responds to HTTP requests for recorded TBA responses."""
+    def send_status(self, status_code):
+        """Sends a response without a body."""
+        count_response(status_code)
+        self.send_response(status_code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Sends the recorded response in response to a GET request."""
+        if LATENCY > 0:
+            time.sleep(LATENCY)
+        if time.time() < OUTAGE_END_TIME:
+            count_response(0)
+            # Closes the connection without sending a response
+            self.close_connection = True
+            return
+        if is_rate_limited():
+            count_response(429)
+            self.send_response(429)
+            self.send_header('Retry-After', str(RATE_LIMIT_WINDOW))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        api_url = self.path.split('/api/v3/', 1)[-1]
+        with LOCK:
+            response = RESPONSES.get(api_url)
+        if response is None:
+            self.send_status(404)
+            return
+        last_modified = int(response['lastModified'])
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                if_modified_since = email.utils.parsedate_to_datetime(
+                    if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                if_modified_since = None
+        if if_modified_since is not None and \
+                last_modified <= if_modified_since:
+            self.send_status(304)
+            return
+        body = json.dumps(response['data']).encode('utf-8')
+        count_response(200)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Last-Modified',
+                         email.utils.formatdate(last_modified, usegmt=True))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Arguments are passed by 'http.server', and are not used.
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Prevents each request from being printed."""
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server that handles each request in a separate thread.
+
+    Requests are handled at the same time, so 'LATENCY' delays each
+    request instead of adding up across requests."""
+    daemon_threads = True
+
+def start_local_tba(port=0):
+    """Serves the recorded responses from a local HTTP server.
+
+    The server runs in a separate thread.  Returns the base URL of the
+    local API, which replaces 'tba_communicator.BASE_URL'.
+
+    port is the port the HTTP server listens on (int).  Defaults to any
+    free port."""
+    server = ThreadingHTTPServer(('localhost', port), TBARequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f'http://localhost:{server.server_address[1]}/api/v3/'
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [2, 3]:
+        print('Usage: python3 local_tba.py <responses file> [port]')
+        sys.exit(1)
+    load_responses(sys.argv[1])
+    PORT = int(sys.argv[2]) if len(sys.argv) == 3 else HTTP_PORT
+    print(f'Serving local TBA API at {start_local_tba(PORT)}')
+    while True:
+        time.sleep(60)
@@ -0,0 +1,232 @@
+"""Records how long each stage of the server loop takes.
+
+Records the wall time and CPU time of each stage, counts of the items
+that were processed (e.g. TIMDs calculated, files uploaded, and bytes
+sent), and a histogram of loop durations.
+
+The metrics are served in the Prometheus text format from a local HTTP
+server (e.g. http://localhost:8100/metrics), and the metrics of each
+loop (including the number of TIMD calculations for each match) are
+added as a line of JSON to 'data/metrics/loops.jsonl'.  Only the new
+line is written, so saving a loop does not depend on the number of
+loops before it.  The file is rotated to 'data/metrics/loops.1.jsonl'
+when it is full.
+
+Called by server.py and upload_data.py"""
+# External imports
+import http.server
+import json
+import os
+import threading
+import time
+# Internal imports
+import utils
+
+# Port of the local HTTP server that serves the metrics.
+METRICS_PORT = 8100
+# Upper bounds (in seconds) of the buckets in the loop duration histogram.
+LOOP_DURATION_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+# Number of loops in 'data/metrics/loops.jsonl' before it is rotated.
+# The previous file is kept as 'data/metrics/loops.1.jsonl', so between
+# 'ROLLING_LOOP_COUNT' and twice as many of the most recent loops are
+# kept.
+ROLLING_LOOP_COUNT = 1000
+LOOPS_FILE = 'data/metrics/loops.jsonl'
+ROTATED_LOOPS_FILE = 'data/metrics/loops.1.jsonl'
+
+# Stage name to the total wall time (seconds) the stage has taken
+STAGE_WALL_TIME = {}
+# Stage name to the total CPU time (seconds) the stage has taken
+STAGE_CPU_TIME = {}
+# Stage name to the number of times the stage has run
+STAGE_RUNS = {}
+# Item name (e.g. 'timds_calculated') to the total count of the item
+ITEM_COUNTS = {}
+# Number of loops with a duration less than or equal to each bucket in
+# 'LOOP_DURATION_BUCKETS'
+LOOP_DURATION_BUCKET_COUNTS = [0] * len(LOOP_DURATION_BUCKETS)
+LOOP_DURATION_SUM = 0
+LOOP_COUNT = 0
+# Match number (string) to the number of times a TIMD in the match has
+# been calculated
+TIMD_CALCULATIONS_BY_MATCH = {}
+
+# Stage times, item counts, and TIMD calculations by match for the loop
+# that is currently running.
+CURRENT_LOOP = {'stages': {}, 'items': {}, 'timdCalculationsByMatch': {}}
+# Number of loops in 'LOOPS_FILE'.  None until it is counted by the first
+# call to 'finish_loop' (e.g. after a restart).
+LOOPS_FILE_LINE_COUNT = None
+
+# The HTTP server reads the metrics from a different thread.
+LOCK = threading.Lock()
+
+def record_stage(stage_name, wall_time, cpu_time):
+    """Records a single run of a stage.
+
+    stage_name is the name of the stage (e.g. 'calculate_defense')
+    wall_time is the number of seconds the stage took
+    cpu_time is the number of CPU seconds used by the server process
+    while the stage ran.  Does not include CPU time used by other
+    processes (e.g. TIMD worker processes)."""
+    with LOCK:
+        STAGE_WALL_TIME[stage_name] = STAGE_WALL_TIME.get(
+            stage_name, 0) + wall_time
+        STAGE_CPU_TIME[stage_name] = STAGE_CPU_TIME.get(
+            stage_name, 0) + cpu_time
+        STAGE_RUNS[stage_name] = STAGE_RUNS.get(stage_name, 0) + 1
+        stage_data = CURRENT_LOOP['stages'].setdefault(
+            stage_name, {'wallTime': 0, 'cpuTime': 0})
+        stage_data['wallTime'] += wall_time
+        stage_data['cpuTime'] += cpu_time
+
+def count_items(item_name, count):
+    """Adds to the count of an item.
+
+    item_name is the name of the item (e.g. 'files_uploaded')
+    count is the number of items that were processed (int)"""
+    with LOCK:
+        ITEM_COUNTS[item_name] = ITEM_COUNTS.get(item_name, 0) + count
+        CURRENT_LOOP['items'][item_name] = CURRENT_LOOP['items'].get(
+            item_name, 0) + count
+
+def count_match_calculations(match_number, count):
+    """Adds to the number of TIMD calculations for a match.
+
+    Used to tune the debounce times in server.py.  Ideally each of the 6
+    TIMDs in a match is calculated once.
+
+    match_number is the number of the match (string)
+    count is the number of TIMDs in the match that were calculated"""
+    with LOCK:
+        TIMD_CALCULATIONS_BY_MATCH[match_number] = \
+            TIMD_CALCULATIONS_BY_MATCH.get(match_number, 0) + count
+        loop_calculations = CURRENT_LOOP['timdCalculationsByMatch']
+        loop_calculations[match_number] = loop_calculations.get(
+            match_number, 0) + count
+
+def time_stage(stage_name, stage_function, *args):
+    """Runs a stage and records its wall time and CPU time.
+
+    Returns the return value of the stage.
+
+    stage_name is the name used for the stage in the metrics
+    stage_function is the function that runs the stage
+    args are passed to 'stage_function'"""
+    start_wall_time = time.perf_counter()
+    start_cpu_time = time.process_time()
+    try:
+        return stage_function(*args)
+    finally:
+        record_stage(stage_name, time.perf_counter() - start_wall_time,
+                     time.process_time() - start_cpu_time)
+
+def finish_loop(duration):
+    """Records the duration of a loop and saves the loop's metrics.
+
+    Adds the metrics of the loop to the end of 'LOOPS_FILE', and rotates
+    the file once it has 'ROLLING_LOOP_COUNT' loops.
+
+    duration is the number of seconds the loop took"""
+    global CURRENT_LOOP, LOOP_DURATION_SUM, LOOP_COUNT, LOOPS_FILE_LINE_COUNT
+    with LOCK:
+        for i, bucket in enumerate(LOOP_DURATION_BUCKETS):
+            if duration <= bucket:
+                LOOP_DURATION_BUCKET_COUNTS[i] += 1
+        LOOP_DURATION_SUM += duration
+        LOOP_COUNT += 1
+
+        CURRENT_LOOP['time'] = time.time()
+        CURRENT_LOOP['duration'] = duration
+        loop_data = CURRENT_LOOP
+        CURRENT_LOOP = {'stages': {}, 'items': {},
+                        'timdCalculationsByMatch': {}}
+
+    # The file is only written by the main loop, so it is written after
+    # the lock is released, which does not block the HTTP server.
+    loops_file_path = utils.create_file_path(LOOPS_FILE)
+    if LOOPS_FILE_LINE_COUNT is None:
+        try:
+            with open(loops_file_path, 'r') as file:
+                LOOPS_FILE_LINE_COUNT = sum(1 for _ in file)
+        except FileNotFoundError:
+            LOOPS_FILE_LINE_COUNT = 0
+    if LOOPS_FILE_LINE_COUNT >= ROLLING_LOOP_COUNT:
+        # Replaces the previously rotated file
+        os.replace(loops_file_path,
+                   utils.create_file_path(ROTATED_LOOPS_FILE))
+        LOOPS_FILE_LINE_COUNT = 0
+    with open(loops_file_path, 'a') as file:
+        file.write(json.dumps(loop_data) + '\n')
+    LOOPS_FILE_LINE_COUNT += 1
+
+def format_metrics():
+    """Returns the metrics in the Prometheus text format (string)."""
+    lines = []
+    with LOCK:
+        for metric_name, description, values in [
+                ('server_stage_wall_seconds_total',
+                 'Total wall time taken by each stage.', STAGE_WALL_TIME),
+                ('server_stage_cpu_seconds_total',
+                 'Total CPU time used by the server during each stage.',
+                 STAGE_CPU_TIME),
+                ('server_stage_runs_total',
+                 'Number of times each stage has run.', STAGE_RUNS)]:
+            lines.append(f'# HELP {metric_name} {description}')
+            lines.append(f'# TYPE {metric_name} counter')
+            for stage_name, value in sorted(values.items()):
+                lines.append(f'{metric_name}{{stage="{stage_name}"}} {value}')
+
+        lines.append('# HELP server_items_total Number of items processed.')
+        lines.append('# TYPE server_items_total counter')
+        for item_name, count in sorted(ITEM_COUNTS.items()):
+            lines.append(f'server_items_total{{item="{item_name}"}} {count}')
+
+        lines.append('# HELP server_timd_calculations_total Number of TIMD '
+                     'calculations for each match.')
+        lines.append('# TYPE server_timd_calculations_total counter')
+        for match_number, count in sorted(TIMD_CALCULATIONS_BY_MATCH.items(),
+                                          key=lambda item: int(item[0])):
+            lines.append(f'server_timd_calculations_total{{match='
+                         f'"{match_number}"}} {count}')
+
+        lines.append('# HELP server_loop_duration_seconds Duration of each '
+                     'server loop.')
+        lines.append('# TYPE server_loop_duration_seconds histogram')
+        for bucket, count in zip(LOOP_DURATION_BUCKETS,
+                                 LOOP_DURATION_BUCKET_COUNTS):
+            lines.append(f'server_loop_duration_seconds_bucket'
+                         f'{{le="{bucket}"}} {count}')
+        lines.append(
+            f'server_loop_duration_seconds_bucket{{le="+Inf"}} {LOOP_COUNT}')
+        lines.append(f'server_loop_duration_seconds_sum {LOOP_DURATION_SUM}')
+        lines.append(f'server_loop_duration_seconds_count {LOOP_COUNT}')
+    return '\n'.join(lines) + '\n'
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Responds to HTTP requests for the metrics."""
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Sends the metrics in response to a GET request."""
+        body = format_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Arguments are passed by 'http.server', and are not used.
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Prevents each request from being printed."""
+
+def start_http_server(port=METRICS_PORT):
+    """Serves the metrics from a local HTTP server in a separate thread.
+
+    port is the port the HTTP server listens on (int)"""
+    try:
+        server = http.server.HTTPServer(('localhost', port),
+                                        MetricsRequestHandler)
+    except OSError:
+        print(f'Error: Unable to serve metrics on port {port}')
+        return
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
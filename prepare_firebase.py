@@ -3,10 +3,10 @@
 
 Sends blank 'Teams' and 'Matches' to Realtime Database."""
 # External imports
-import json
 import sys
 import shutil
 # Internal imports
+import assignments
 import firebase_communicator
 import tba_communicator
 import utils
@@ -105,9 +105,7 @@ if PREPARE_MATCHES is True:
 
 if FULL_WIPE is True:
     # Loads scout names from assignment file
-    with open(utils.create_file_path('data/assignments/assignments.json'),
-              'r') as file:
-        SCOUT_NAMES = json.load(file)['letters'].keys()
+    SCOUT_NAMES = assignments.get_scout_letters().keys()
     FIREBASE_UPLOAD.update({
         'tempTIMDs': None,
         'TIMDs': None,
@@ -0,0 +1,223 @@
+#!/usr/bin/python3.6
+"""Replays a recorded event through the server at an accelerated speed.
+
+Runs the server's code paths (stream handlers, the main loop, and every
+calculation) against a local stand-in for Firebase (local_firebase.py)
+and for TBA (local_tba.py), so an event can be replayed without a
+network connection and without affecting the real cache.
+
+The recorded event is a JSON file in the following format:
+{
+    "assignments": contents of 'data/assignments/assignments.json',
+    "firebase": initial contents of the database (e.g. scoutManagement),
+    "tba": {API url: initial response},
+    "events": [
+        {"time": 12.5, "path": "tempTIMDs/1678Q3-12", "value": "..."},
+        {"time": 14.0, "path": "scoutManagement/currentMatchNumber",
+         "value": 4},
+        {"time": 90.0, "tbaUrl": "match/2019carv_qm3", "value": {...}},
+        ...
+    ]
+}
+'time' is the number of seconds after the start of the replay.  Events
+with a 'path' set a value in the database, and events with a 'tbaUrl'
+change the response of a TBA API request.
+
+Reports the time from when the last tempTIMD for each match is
+submitted until the calculated data for the match is uploaded.  The
+report is saved in 'data/replay/report.json'.
+
+Usage: python3 replay_event.py <event file> [speed]
+speed is how many times faster than real time the event is replayed
+(e.g. 1 or 10), or 'max' to send each event without waiting.  Defaults
+to 'max'."""
+# External imports
+import json
+import sys
+import tempfile
+import threading
+import time
+# Internal imports
+import firebase_communicator
+import local_firebase
+import local_tba
+import utils
+
+# The report is saved in the main directory, not in the temporary
+# directory that the replay uses.
+REPORT_FILE = utils.create_file_path('data/replay/report.json')
+
+def percentile(values, percent):
+    """Returns a percentile of a list of numbers (nearest rank).
+
+    values is a list of numbers
+    percent is the percentile to return (e.g. 95)"""
+    values = sorted(values)
+    if values == []:
+        return None
+    index = int(round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+def feed_events(database, events, speed, submit_times):
+    """Applies the recorded events at their recorded times.
+
+    database is the local database the server is using
+    events is the list of recorded events
+    speed is how many times faster than real time the events are
+    applied, or 0 to apply them without waiting
+    submit_times is a dict that the time (epoch) each tempTIMD is
+    submitted is added to"""
+    start_time = time.time()
+    for event in sorted(events, key=lambda event: event['time']):
+        if speed != 0:
+            time.sleep(max(start_time + event['time'] / speed -
+                           time.time(), 0))
+        if 'tbaUrl' in event:
+            local_tba.set_response(event['tbaUrl'], event['value'])
+            continue
+        database.child(event['path']).set(event['value'])
+        keys = local_firebase.split_path(event['path'])
+        if keys[0] == 'tempTIMDs' and len(keys) == 2:
+            submit_times[keys[1]] = time.time()
+
+def create_report(database, submit_times, replay_time, loop_count):
+    """Returns the report of a replay (dict).
+
+    database is the local database the server used
+    submit_times is a dict of tempTIMD names to the time (epoch) each
+    tempTIMD was last submitted
+    replay_time is the number of seconds the replay took
+    loop_count is the number of server loops that were run"""
+    # TIMD name to the time its last tempTIMD was submitted
+    last_submit_times = {}
+    for temp_timd_name, submit_time in submit_times.items():
+        timd_name = temp_timd_name.split('-')[0]
+        last_submit_times[timd_name] = max(
+            submit_time, last_submit_times.get(timd_name, 0))
+    # TIMD name to the time its calculated data was first uploaded
+    # after its last tempTIMD was submitted
+    upload_times = {}
+    for write_time, path in database.writes:
+        keys = path.split('/')
+        if keys[0] != 'TIMDs' or len(keys) < 3 or \
+                keys[2] != 'calculatedData':
+            continue
+        timd_name = keys[1]
+        if timd_name in upload_times or \
+                write_time < last_submit_times.get(timd_name, write_time + 1):
+            continue
+        upload_times[timd_name] = write_time
+
+    matches = {}
+    for timd_name, submit_time in last_submit_times.items():
+        match_number = timd_name.split('Q')[1]
+        match = matches.setdefault(match_number, {
+            'lastSubmitTime': 0, 'uploadTime': 0, 'missingTIMDs': []})
+        match['lastSubmitTime'] = max(match['lastSubmitTime'], submit_time)
+        if timd_name in upload_times:
+            match['uploadTime'] = max(match['uploadTime'],
+                                      upload_times[timd_name])
+        else:
+            match['missingTIMDs'].append(timd_name)
+    latencies = []
+    for match in matches.values():
+        if match['missingTIMDs'] == []:
+            match['latency'] = match['uploadTime'] - match['lastSubmitTime']
+            latencies.append(match['latency'])
+        else:
+            match['latency'] = None
+
+    return {
+        'replayTime': replay_time,
+        'loopCount': loop_count,
+        'matchCount': len(matches),
+        'latency': {
+            'mean': utils.avg(latencies, None),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'max': max(latencies) if latencies != [] else None,
+        },
+        'matches': {match_number: matches[match_number] for match_number
+                    in sorted(matches, key=int)},
+    }
+
+def replay_event(recorded_event, speed=0):
+    """Replays a recorded event through the server.
+
+    Returns the report of the replay (dict).
+
+    recorded_event is the recorded event (dict)
+    speed is how many times faster than real time the event is
+    replayed, or 0 to send each event without waiting"""
+    # The replay uses a temporary directory, so the real cache is not
+    # deleted by the cold start.
+    utils.MAIN_DIRECTORY = tempfile.mkdtemp(prefix='replay_')
+    with open(utils.create_file_path('data/api_keys/tba_key.txt'),
+              'w') as file:
+        file.write('replay')
+    with open(utils.create_file_path('data/assignments/assignments.json'),
+              'w') as file:
+        json.dump(recorded_event['assignments'], file)
+
+    tba_communicator_url = local_tba.start_local_tba()
+    for api_url, data in recorded_event.get('tba', {}).items():
+        local_tba.set_response(api_url, data)
+    database = local_firebase.LocalDatabase()
+    database.child('/').set(recorded_event.get('firebase', {}))
+    firebase_communicator.use_local_database(database)
+
+    # Imported after the local stand-ins are set up, since these modules
+    # connect to Firebase and read the TBA API key when they are imported.
+    # pylint: disable=import-outside-toplevel
+    import metrics
+    import server
+    import tba_communicator
+    tba_communicator.BASE_URL = tba_communicator_url
+    # The debounce times are shortened by the same amount as the event.
+    if speed == 0:
+        server.TIMD_DEBOUNCE_TIME = 0
+        server.MATCH_DEBOUNCE_TIME = 0
+    else:
+        server.TIMD_DEBOUNCE_TIME /= speed
+        server.MATCH_DEBOUNCE_TIME /= speed
+
+    start_time = time.time()
+    server.start_server(cold_start=True)
+    # tempTIMD name to the time (epoch) it was last submitted
+    submit_times = {}
+    feeder = threading.Thread(target=feed_events, args=(
+        database, recorded_event['events'], speed, submit_times))
+    feeder.start()
+    while True:
+        if not feeder.is_alive():
+            # Waits for the stream handlers to receive the last events.
+            database.wait_for_streams()
+            if server.is_idle():
+                break
+        server.run_loop()
+    replay_time = time.time() - start_time
+
+    for stream in server.STREAMS.values():
+        stream.close()
+    if server.TIMD_POOL is not None:
+        server.TIMD_POOL.shutdown()
+    return create_report(database, submit_times, replay_time,
+                         metrics.LOOP_COUNT)
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [2, 3]:
+        print('Usage: python3 replay_event.py <event file> [speed]')
+        sys.exit(1)
+    with open(sys.argv[1], 'r') as file:
+        RECORDED_EVENT = json.load(file)
+    if len(sys.argv) == 3 and sys.argv[2] != 'max':
+        SPEED = float(sys.argv[2])
+    else:
+        SPEED = 0
+    REPORT = replay_event(RECORDED_EVENT, SPEED)
+    with open(REPORT_FILE, 'w') as file:
+        json.dump(REPORT, file, indent=2)
+    print(f"Replayed {REPORT['matchCount']} matches in "
+          f"{REPORT['replayTime']:.1f} seconds")
+    print(f"Upload latency (seconds): {REPORT['latency']}")
+    print(f'Report saved in {REPORT_FILE}')
@@ -3,66 +3,189 @@
 
 Runs on one of two available Ubuntu 18.04 LTS computers in the stands at
 competition. This script runs all the database listeners and the while
-loop that checks if calculations need to be made.
+loop that checks if calculations need to be made.  Calculations are run
+inside this (long-lived) process by calling each calculation file's
+entry point, so Python and its imports only start up once.
+
+Only data that has changed since the last loop is recalculated.  The
+stream handlers mark changed data as dirty in 'dependency_graph', and
+each loop recalculates the dirty nodes in dependency order.  The loop
+waits on a work queue that the stream handlers add to, so it reacts to
+new data immediately and does not use CPU while the event is idle.
 
 HACK: Runs some calculations (added mid-season) continuously."""
 # External imports
-import json
+import concurrent.futures
 import os
+import queue
 import shutil
 import signal
-import subprocess
 import sys
 import time
+import traceback
 # Internal imports
+import calculate_abilities
+import calculate_defense
+import calculate_predictions
+import calculate_pushing_ability
+import calculate_sprs
+import calculate_team
+import calculate_timd
+import data_store
+import dependency_graph
+import event_cache
 import firebase_communicator
+import forward_tba_data
+import forward_temp_super
+import input_registry
+import metrics
+import snapshot
 import tba_communicator
+import update_assignments
+import upload_data
 import utils
 
 # Uses default firebase URL
 # DB stands for database
 DB = firebase_communicator.configure_firebase()
 
-def delete_cache_data_folder(folder_name):
-    """Deletes a cache folder and its contents, then recreates the folder.
-
-    Removes any outdated data, since all data is re-downloaded when a
-    Firebase stream is restarted."""
-    # Checks if the directory exists before trying to delete it to avoid
-    # causing an error.
-    if os.path.isdir(utils.create_file_path(
-            f'data/cache/{folder_name}', False)):
-        shutil.rmtree(utils.create_file_path(
-            f'data/cache/{folder_name}', False))
-
-def register_modified_temp_timd(temp_timd_name):
-    """Removes a modified tempTIMD from 'LATEST_CALCULATIONS_BY_TIMD'.
-
-    Called when a tempTIMD is removed or edited.  This function
-    will cause the relevant data to be recalculated to reflect the new
-    data."""
-    timd_name = temp_timd_name.split('-')[0]
-    if LATEST_CALCULATIONS_BY_TIMD.get(timd_name) is not None:
-        LATEST_CALCULATIONS_BY_TIMD[timd_name] = (
-            LATEST_CALCULATIONS_BY_TIMD[timd_name].remove(
-                temp_timd_name))
-        # TODO: If there is only one tempTIMD in the list, and it is
-        # removed, the TIMD data will not be recalculated or deleted.
-        # Need to delete TIMD data + recalculate team + match data if
-        # this happens.
+# Stream handlers add the name of their stream's data (e.g. 'temp_super')
+# to this queue when new data arrives.  The main loop waits on the queue
+# instead of sleeping, so new data is calculated as soon as it arrives.
+# Every job in the queue is handled in the same pass, so the order of
+# the jobs does not matter.  The data for the current matches is
+# calculated first instead (see 'run_calculations').
+WORK_QUEUE = queue.Queue()
+# Data for the matches around 'CURRENT_MATCH_NUMBER' is calculated
+# before the data for any other match.  Includes the
+# 'RECENT_MATCH_COUNT' matches before it (which have just been played)
+# and the 'UPCOMING_MATCH_COUNT' matches after it (which need
+# predictions).
+RECENT_MATCH_COUNT = 2
+UPCOMING_MATCH_COUNT = 3
+# Maximum number of TIMDs calculated in a background pass.  Background
+# passes calculate the data for the other matches and the event-wide
+# data (e.g. Elo and abilities).  They are kept short so that new data
+# for the current matches does not wait behind them.
+BACKGROUND_BATCH_SIZE = 18
+# Updated by 'match_num_stream_handler'.  None until the stream starts,
+# which causes every match to be treated as a current match.
+CURRENT_MATCH_NUMBER = None
+# Seconds between runs of the jobs that are not started by a stream
+# event (e.g. restarting dead streams and updating 'lastServerRun').
+PERIODIC_JOB_INTERVAL = 5
+# Number of processes used to calculate TIMDs.  TIMDs are independent,
+# so the TIMDs from a match are calculated at the same time on different
+# CPU cores.  Set to 1 to calculate TIMDs one at a time in this process.
+TIMD_WORKER_COUNT = os.cpu_count() or 1
+# Scouts submit their tempTIMDs for a TIMD within a few seconds of each
+# other, so a TIMD is not calculated until all of its scouts' tempTIMDs
+# have arrived, or until it has waited 'TIMD_DEBOUNCE_TIME' seconds.
+SCOUTS_PER_TIMD = 3
+TIMD_DEBOUNCE_TIME = 15
+# The tempSuper data for a match is not forwarded until both alliances'
+# tempSuper data has arrived, or until it has waited
+# 'MATCH_DEBOUNCE_TIME' seconds.
+TEMP_SUPERS_PER_MATCH = 2
+MATCH_DEBOUNCE_TIME = 15
+
+# Firebase stream name to stream, created by 'start_server'
+STREAMS = {}
+# Process pool used to calculate TIMDs, created by 'start_server'
+TIMD_POOL = None
+# Time (epoch) when the periodic jobs are next run
+NEXT_PERIODIC_RUN = 0
+# Time (epoch) when the next group of held inputs is released
+NEXT_RELEASE_TIME = None
+# Data for the entire event, shared by the stages that use every team or
+# match.  Created by 'start_server', and refreshed before each stage.
+CACHE = None
+
+def run_stage(stage_function, *args):
+    """Runs a single calculation stage inside the server process.
+
+    An error in a stage is printed instead of stopping the server, in
+    the same way that an error in a separate 'python3' process would
+    not stop the server.
+
+    Records the time the stage takes in 'metrics'.  Returns the return
+    value of the stage, or None if the stage raised an error.
+
+    stage_function is the entry point of the stage (e.g.
+    'calculate_defense.calculate_defense')
+    args are passed to 'stage_function'"""
+    try:
+        return metrics.time_stage(
+            stage_function.__name__, stage_function, *args)
+    # Any error can occur in a stage, and none of them should stop the
+    # server.
+    except Exception:  # pylint: disable=broad-except
+        traceback.print_exc()
+        return None
+
+def delete_timd(timd_name):
+    """Deletes a TIMD that no longer has any tempTIMDs.
+
+    Deletes the TIMD from the local cache and the upload queue, and
+    journals its removal from Firebase.
+
+    timd_name is the name of the TIMD (e.g. '1678Q3')"""
+    data_store.delete('timds', timd_name)
+    file_path = utils.create_file_path(
+        f'data/upload_queue/timds/{timd_name}.json')
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    # Removed from Firebase by 'upload_data', so the TIMD is also
+    # removed if Firebase is unreachable.  The TIMD is uploaded again if
+    # it is recalculated.
+    upload_data.queue_removal('TIMDs', timd_name)
+    print(f'Deleted {timd_name}')
+
+def calculate_timds(timd_names):
+    """Calculates TIMDs, using 'TIMD_WORKER_COUNT' processes.
+
+    Each TIMD is saved by the process that calculates it.  The data that
+    depends on the TIMDs (e.g. team data) is calculated afterwards by
+    this process, once per team.
+
+    timd_names is a list of the names of the TIMDs (e.g. '1678Q3')"""
+    metrics.count_items('timds_calculated', len(timd_names))
+    # Used to tune the debounce times.  Ideally each TIMD in a match is
+    # calculated once.
+    for timd in timd_names:
+        metrics.count_match_calculations(timd.split('Q')[1], 1)
+    if TIMD_WORKER_COUNT == 1 or len(timd_names) <= 1:
+        for timd in timd_names:
+            run_stage(calculate_timd.calculate_timd, timd)
+            print(f"Did calculations for {timd}")
+        return
+    start_time = time.perf_counter()
+    futures = {TIMD_POOL.submit(calculate_timd.calculate_timd, timd): timd
+               for timd in timd_names}
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            future.result()
+        # Any error can occur in a calculation, and none of them should
+        # stop the server.
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+        else:
+            print(f"Did calculations for {futures[future]}")
+    # The CPU time used by the worker processes is not recorded.
+    metrics.record_stage('calculate_timd', time.perf_counter() - start_time, 0)
 
 def match_num_stream_handler(snapshot):
     """Runs when 'currentMatchNumber' is updated on Firebase."""
     # Validates that data was correctly received and is in its expected format
     # Documentation of 'put' and 'patch' Firebase Database events
     # https://firebase.google.com/docs/reference/rest/database/#section-streaming
+    global CURRENT_MATCH_NUMBER
     if (snapshot['event'] == 'put' and snapshot['path'] == '/' and
             isinstance(snapshot['data'], int)):
-        # Forwards TBA data to Teams, TIMDs, and Matches.
-        subprocess.call('python3 forward_tba_data.py', shell=True)
-        # Calculates SPRs (Scout Precision Rankings)
-        subprocess.call('python3 calculate_sprs.py', shell=True)
-        print('Did SPRs calculations')
+        CURRENT_MATCH_NUMBER = snapshot['data']
+        # TBA data is forwarded by the main loop, so it is not written
+        # at the same time as the calculations.
+        WORK_QUEUE.put('forward_tba_data')
 
 def cycle_num_stream_handler(snapshot):
     """Runs when 'cycleNumber' is updated on firebase"""
@@ -76,33 +199,101 @@ def cycle_num_stream_handler(snapshot):
             cycle_number = 0
         # Prevents different QRs from being created with the same cycle number.
         if previous_qr.split('_')[0] != str(cycle_number):
-            subprocess.call(
-                f'python3 update_assignments.py {cycle_number}',
-                shell=True)
+            run_stage(update_assignments.update_assignments, cycle_number)
+
+def save_temp_timd(temp_timd_name, temp_timd_value):
+    """Saves a single tempTIMD in the local cache.
+
+    Marks the tempTIMD as dirty if it changed, which causes the
+    corresponding TIMD (and the data calculated from it) to be
+    recalculated.
+
+    temp_timd_name is the name of the tempTIMD (e.g. '1678Q3-12')
+    temp_timd_value is the compressed tempTIMD (string), or None if the
+    tempTIMD was deleted"""
+    if temp_timd_value is not None:
+        # HACK: Remove trailing '\n' (newlines) in compressed tempTIMD
+        # data.  This is a bug in the Scout app.
+        temp_timd_value = temp_timd_value.rstrip('\n')
+    # Holds the lock so that a snapshot never contains the new tempTIMD
+    # without the dirty node.
+    with dependency_graph.LOCK:
+        # Skips tempTIMDs that are already cached (e.g. when a stream
+        # reconnects and sends all of the tempTIMDs again).  Deleted
+        # tempTIMDs are removed from the cache.
+        if not input_registry.save_input(
+                'temp_timds', temp_timd_name, temp_timd_value):
+            return
+        if temp_timd_value is not None:
+            # Waits for the other scouts' tempTIMDs for the TIMD
+            # (e.g. '1678Q3-12' -> '1678Q3')
+            dependency_graph.hold('temp_timd', temp_timd_name,
+                                  input_registry.get_group_name(
+                                      temp_timd_name))
+            return
+        dependency_graph.mark_dirty('temp_timd', temp_timd_name)
 
-def temp_timd_stream_handler(temp_timd_name, temp_timd_value_):
+def temp_timd_stream_handler(snapshot):
     """Runs when any new tempTIMDs are uploaded"""
-    # HACK: Remove trailing '\n' (newlines) in compressed tempTIMD
-    # data.  This is a bug in the Scout app.
-    temp_timd_value_ = temp_timd_value_.rstrip('\n')
-    # This means that this tempTIMD has been deleted from Firebase
-    # and we should delete our local copy.
-    if temp_timd_value_ is None:
-        os.remove(utils.create_file_path(
-            f'data/cache/temp_timds/{temp_timd_name}.txt'))
-        # Causes the corresponding TIMD to be recalculated
-        register_modified_temp_timd(temp_timd_name)
+    data = snapshot['data']
+    path = snapshot['path']
+
+    # This occurs when the entirety of tempTIMDs are updated (stream
+    # initialization or reconnection, all tempTIMDs deleted, or first
+    # tempTIMD created), or when several tempTIMDs are sent in a single
+    # 'patch' event.
+    if path == '/':
+        if data is None:
+            data = {}
+        if snapshot['event'] == 'put':
+            # A 'put' at the root replaces every tempTIMD, so cached
+            # tempTIMDs that are not in 'data' have been deleted while
+            # the stream was disconnected.
+            with dependency_graph.LOCK:
+                for temp_timd_name in input_registry.get_input_names(
+                        'temp_timds'):
+                    if temp_timd_name not in data:
+                        data[temp_timd_name] = None
+    elif path.count('/') == 1:
+        # This is moving the path into the data so it is in the same
+        # format as data at the path '/'.
+        # The '[1:]' removes the slash at the beginning of the path
+        data = {path[1:]: data}
+    # tempTIMDs are only one child deep, so this will only trigger if
+    # invalid data is sent to Firebase.
     else:
-        with open(utils.create_file_path(
-                f'data/cache/temp_timds/{temp_timd_name}.txt'),
-                'w') as file:
-            file.write(temp_timd_value_)
-        timd_name = temp_timd_name.split('-')[0]
-        # This means an already existing tempTIMD has been modified
-        # and needs to be recalculated.
-        if temp_timd_name in LATEST_CALCULATIONS_BY_TIMD.get(
-                timd_name, []):
-            register_modified_temp_timd(temp_timd_name)
+        print('Error: Invalid tempTIMD data received')
+        return
+
+    for temp_timd_name, temp_timd_value in data.items():
+        save_temp_timd(temp_timd_name, temp_timd_value)
+    WORK_QUEUE.put('temp_timd')
+
+def save_temp_super(temp_super_name, temp_super_value):
+    """Saves a single tempSuper data in the local cache.
+
+    Marks the tempSuper data as dirty if it changed.
+
+    temp_super_name is the name of the tempSuper data (e.g. 'S!Q3-B')
+    temp_super_value is the compressed tempSuper data (string), or None
+    if the tempSuper data was deleted"""
+    # Holds the lock so that a snapshot never contains the new tempSuper
+    # without the dirty node.
+    with dependency_graph.LOCK:
+        # Skips tempSupers that are already cached (e.g. when a stream
+        # reconnects and sends all of the tempSupers again).  Deleted
+        # tempSupers are removed from the cache.
+        if not input_registry.save_input(
+                'temp_super', temp_super_name, temp_super_value):
+            return
+        if temp_super_value is not None:
+            # Waits for the other alliance's tempSuper for the match
+            # (e.g. 'S!Q3-B' -> 'S!Q3')
+            dependency_graph.hold('temp_super', temp_super_name,
+                                  input_registry.get_group_name(
+                                      temp_super_name))
+            return
+        dependency_graph.mark_dirty('temp_super', temp_super_name)
 
 def temp_super_stream_handler(snapshot):
     """Runs when any new tempSuper datas are uploaded"""
@@ -110,14 +301,21 @@ def temp_super_stream_handler(snapshot):
     path = snapshot['path']
 
     # This occurs when the entirety of tempSuper datas are updated
-    # (stream initialization, all tempSuper data deleted, or first
-    # tempSuper created)
+    # (stream initialization or reconnection, all tempSuper data
+    # deleted, or first tempSuper created)
     if path == '/':
         # This means that all tempSuper datas have been wiped and we
         # should wipe our local copy.
         if data is None:
-            delete_cache_data_folder('temp_super')
-            return
+            data = {}
+        if snapshot['event'] == 'put':
+            # A 'put' at the root replaces every tempSuper, so cached
+            # tempSupers that are not in 'data' have been deleted.
+            with dependency_graph.LOCK:
+                for temp_super_name in input_registry.get_input_names(
+                        'temp_super'):
+                    if temp_super_name not in data:
+                        data[temp_super_name] = None
     elif path.count('/') == 1:
         # This is moving the path into the data so it is in the same
         # format as data at the path '/'.  This allows us to use the
@@ -133,27 +331,18 @@ def temp_super_stream_handler(snapshot):
 
     # This saves each tempSuper data in a separate text file.
     for temp_super_name, temp_super_value in data.items():
-        # This means that this tempSuper has been deleted from Firebase
-        # and we should delete it from our local copy.
-        if temp_super_value is None:
-            os.remove(utils.create_file_path(
-                f'data/cache/temp_super/{temp_super_name}.txt'))
-        else:
-            with open(utils.create_file_path(
-                    f'data/cache/temp_super/{temp_super_name}.txt'),
-                      'w') as file:
-                file.write(temp_super_value)
-
+        save_temp_super(temp_super_name, temp_super_value)
+    WORK_QUEUE.put('temp_super')
 
 def create_streams(stream_names=None):
     """Creates firebase streams given a list of possible streams.
 
     These possible streams include: MATCH_NUM_STREAM, CYCLE_NUM_STREAM,
-                                    TEMP_SUPER_STREAM"""
+                                    TEMP_SUPER_STREAM, TEMP_TIMD_STREAM"""
     # If specific streams are not given, create all of the possible streams
     if stream_names is None:
         stream_names = ['MATCH_NUM_STREAM', 'CYCLE_NUM_STREAM',
-                        'TEMP_SUPER_STREAM']
+                        'TEMP_SUPER_STREAM', 'TEMP_TIMD_STREAM']
     streams = {}
     # Creates each of the streams specified and stores them in the
     # streams dict.
@@ -166,10 +355,17 @@ def create_streams(stream_names=None):
             streams[name] = DB.child('scoutManagement/cycleNumber'
                                     ).stream(cycle_num_stream_handler)
         elif name == 'TEMP_SUPER_STREAM':
-            # Used to remove any outdated data
-            delete_cache_data_folder('temp_super')
+            # The cached tempSupers are kept, since the first event of
+            # the stream contains every tempSuper and only the tempSupers
+            # that changed are recalculated.
             streams[name] = DB.child('tempSuper').stream(
                 temp_super_stream_handler)
+        elif name == 'TEMP_TIMD_STREAM':
+            # The cached tempTIMDs are kept, since the first event of the
+            # stream contains every tempTIMD (in a single request) and
+            # only the tempTIMDs that changed are recalculated.
+            streams[name] = DB.child('tempTIMDs').stream(
+                temp_timd_stream_handler)
     return streams
 
 # signal.signal passes two arguments to this function, neither are used
@@ -191,7 +387,17 @@ def handle_ctrl_c(*args):
     sys.exit(0)
 
 def cache_match_schedule():
-    """Requests the match schedule from TBA and adds it to the cache."""
+    """Requests the match schedule from TBA and adds it to the cache.
+
+    Uses the cached match schedule instead if it exists (e.g. after a
+    warm restart)."""
+    cached_match_schedule = data_store.read_all('match_schedule')
+    if cached_match_schedule != {}:
+        for match_data in cached_match_schedule.values():
+            dependency_graph.register_match(
+                str(match_data['matchNumber']),
+                match_data['redTeams'] + match_data['blueTeams'])
+        return
     # HACK: Only pulls the match schedule once since the caching built
     # into tba_communicator.py is not complete.
     matches = tba_communicator.request_matches()
@@ -205,49 +411,182 @@ def cache_match_schedule():
             # (e.g. 'frc1678' -> '1678')
             red_teams = [team[3:] for team in red_teams]
             blue_teams = [team[3:] for team in blue_teams]
+            # Predictions for the match are recalculated when one of its
+            # teams changes.
+            dependency_graph.register_match(
+                str(match_number), red_teams + blue_teams)
             final_match_data = {
                 'matchNumber': match_number,
                 'redTeams': red_teams,
                 'blueTeams': blue_teams,
             }
-        with open(utils.create_file_path(
-                f'data/cache/match_schedule/{match_number}.json'), 'w') as file:
-            json.dump(final_match_data, file)
-
-# Deletes the entire 'cache' directory to remove any old data.
-# Checks if the directory exists before trying to delete it to avoid
-# causing an error.
-if os.path.isdir(utils.create_file_path('data/cache', False)):
-    shutil.rmtree(utils.create_file_path('data/cache', False))
-
-# Detects when CTRL+C is pressed, then runs handle_ctrl_c
-signal.signal(signal.SIGINT, handle_ctrl_c)
-
-# Creates all the database streams and stores them in global dict.
-STREAMS = create_streams()
-
-# In order to make match calculations, the match schedule must be taken
-# from TBA and put into the cache.
-cache_match_schedule()
-
-# Wipes 'temp_timds' cache folder
-delete_cache_data_folder('temp_timds')
-# Stores the keys of cached 'tempTIMDs'
-CACHED_TEMP_TIMD_KEYS = []
-
-# Stores the tempTIMDs that have already been calculated in order to
-# prevent them from being recalculated if the data has not changed.
-# TODO: Replace with variable containing TIMDs that need to be (re)calculated.
-LATEST_CALCULATIONS_BY_TIMD = {}
-
-# Pulls all tempTIMDs in a single request
-# (Improves efficiency on server restart)
-INITIAL_TEMP_TIMDS = DB.child('tempTIMDs').get().val()
-if INITIAL_TEMP_TIMDS is not None:
-    for temp_timd, temp_timd_value in INITIAL_TEMP_TIMDS.items():
-        temp_timd_stream_handler(temp_timd, temp_timd_value)
-    CACHED_TEMP_TIMD_KEYS += INITIAL_TEMP_TIMDS.keys()
-while True:
+        data_store.write('match_schedule', str(match_number),
+                         final_match_data)
+
+def release_held_inputs():
+    """Releases the held inputs that are ready to be calculated.
+
+    A group of held inputs is ready when all of its inputs have arrived,
+    or when it has waited long enough.  Returns the time (epoch) when the
+    next group will be released, or None if there are no held groups."""
+    next_release_time = None
+    with dependency_graph.LOCK:
+        for group_name, group in list(dependency_graph.HELD_GROUPS.items()):
+            # tempSuper groups start with 'S!'
+            if group_name[:2] == 'S!':
+                input_count = input_registry.count_group_inputs(
+                    'temp_super', group_name)
+                expected_count = TEMP_SUPERS_PER_MATCH
+                release_time = group['firstHoldTime'] + MATCH_DEBOUNCE_TIME
+            else:
+                input_count = input_registry.count_group_inputs(
+                    'temp_timds', group_name)
+                expected_count = SCOUTS_PER_TIMD
+                release_time = group['firstHoldTime'] + TIMD_DEBOUNCE_TIME
+            if (input_count >= expected_count or
+                    time.time() >= release_time):
+                dependency_graph.release(group_name)
+            elif next_release_time is None or release_time < next_release_time:
+                next_release_time = release_time
+    return next_release_time
+
+def get_match_distance(match_number):
+    """Returns how far a match is from the current matches.
+
+    Returns 0 for the matches around 'CURRENT_MATCH_NUMBER', which are
+    calculated first.  Other matches are calculated in order of
+    distance.
+
+    match_number is the number of the match (string)"""
+    if CURRENT_MATCH_NUMBER is None:
+        return 0
+    match_number = int(match_number)
+    if match_number < CURRENT_MATCH_NUMBER - RECENT_MATCH_COUNT:
+        return CURRENT_MATCH_NUMBER - RECENT_MATCH_COUNT - match_number
+    if match_number > CURRENT_MATCH_NUMBER + UPCOMING_MATCH_COUNT:
+        return match_number - CURRENT_MATCH_NUMBER - UPCOMING_MATCH_COUNT
+    return 0
+
+def is_current_timd(timd_name):
+    """Returns True if a TIMD is in one of the current matches."""
+    return get_match_distance(timd_name.split('Q')[1]) == 0
+
+def is_current_match(match_number):
+    """Returns True if a match is one of the current matches."""
+    return get_match_distance(match_number) == 0
+
+def has_current_work():
+    """Returns True if there are dirty nodes for the current matches."""
+    return (any(is_current_timd(timd) for timd in
+                dependency_graph.get_dirty('timd')) or
+            any(is_current_match(match_number) for node_type in
+                ['super_forward', 'defense', 'predictions'] for match_number
+                in dependency_graph.get_dirty(node_type)) or
+            dependency_graph.get_dirty('team') != set())
+
+def run_calculations(is_background=False):
+    """Recalculates the dirty nodes in the dependency graph.
+
+    The stages run in dependency order, so a node is only calculated
+    after the nodes it is calculated from.  Uploads the results.
+
+    is_background is False to only calculate the data for the current
+    matches (and the teams in them).  If it is True, the data for up to
+    'BACKGROUND_BATCH_SIZE' TIMDs from other matches and the event-wide
+    data is calculated instead."""
+    if is_background:
+        # Calculates the TIMDs closest to the current matches first.
+        background_timds = sorted(
+            dependency_graph.get_dirty('timd'),
+            key=lambda timd: get_match_distance(timd.split('Q')[1]))[
+                :BACKGROUND_BATCH_SIZE]
+        is_selected_timd = background_timds.__contains__
+        is_selected_match = None
+    else:
+        is_selected_timd = is_current_timd
+        is_selected_match = is_current_match
+
+    # Consolidates and calculates each TIMD with new tempTIMDs.
+    timds_to_calculate = []
+    for timd in sorted(dependency_graph.pop_dirty('timd', is_selected_timd)):
+        with dependency_graph.LOCK:
+            temp_timd_count = input_registry.count_group_inputs(
+                'temp_timds', timd)
+        if temp_timd_count > 0:
+            timds_to_calculate.append(timd)
+        else:
+            # Every tempTIMD for the TIMD has been deleted.
+            run_stage(delete_timd, timd)
+            dependency_graph.mark_dependents('timd', timd)
+    calculate_timds(timds_to_calculate)
+    for timd in timds_to_calculate:
+        dependency_graph.mark_dependents('timd', timd)
+
+    # Forwards tempSuper data to Matches and TIMDs.
+    matches_to_forward = dependency_graph.pop_dirty(
+        'super_forward', is_selected_match)
+    if matches_to_forward:
+        updated_teams = run_stage(
+            forward_temp_super.forward_temp_super, matches_to_forward)
+        for team_number in updated_teams or []:
+            dependency_graph.mark_dirty('team', team_number)
+
+    # Calculates pushing ELO rankings for teams.  Elo depends on the
+    # order of every pushing battle, so it is always calculated for the
+    # entire competition, in the background.
+    if is_background and dependency_graph.pop_dirty('elo'):
+        run_stage(calculate_pushing_ability.calculate_pushing_ability)
+
+    CACHE.refresh()
+    for team_number in dependency_graph.pop_dirty('team'):
+        changed_data_fields = run_stage(
+            calculate_team.calculate_team, team_number, CACHE)
+        dependency_graph.mark_dependents('team', team_number)
+        # 'pointsPrevented' is calculated from the opponents' team data,
+        # so it is recalculated for the team's matches if that data
+        # changed.
+        if set(changed_data_fields or []) & set(
+                calculate_defense.TEAM_DATA_FIELDS):
+            for match_number in dependency_graph.MATCHES_BY_TEAM.get(
+                    team_number, []):
+                dependency_graph.mark_dirty('defense', match_number)
+
+    # Calculates 'pointsPrevented'
+    matches_to_defend = dependency_graph.pop_dirty(
+        'defense', is_selected_match)
+    if matches_to_defend:
+        CACHE.refresh()
+        defending_teams = run_stage(
+            calculate_defense.calculate_defense, matches_to_defend, CACHE)
+        # The defending teams are recalculated in the next pass.
+        for team_number in defending_teams or []:
+            dependency_graph.mark_dirty('team', team_number)
+
+    # Makes predictions about match results.
+    matches_to_predict = dependency_graph.pop_dirty(
+        'predictions', is_selected_match)
+    if matches_to_predict:
+        CACHE.refresh()
+        run_stage(calculate_predictions.calculate_predictions,
+                  matches_to_predict, CACHE)
+
+    # Runs advanced calculations for every team in the competition.
+    # Abilities are z-scores, so they depend on every team, and are
+    # calculated in the background.
+    if is_background and dependency_graph.pop_dirty('abilities'):
+        CACHE.refresh()
+        run_stage(calculate_abilities.calculate_abilities, CACHE)
+
+    # Uploads data in data queue.
+    run_stage(upload_data.upload_data)
+
+    # Saves the calculation state, which is used if the server restarts.
+    run_stage(snapshot.save_snapshot)
+
+def run_periodic_jobs():
+    """Runs the jobs that are not started by a stream event.
+
+    Restarts dead streams and updates 'lastServerRun'."""
     # Goes through each of the streams to check if it is still active
     for stream_name, stream in STREAMS.items():
         if not stream.thread.is_alive():
@@ -257,64 +596,6 @@ while True:
             # a dict, which is why '.update' is called.
             STREAMS.update(create_streams([stream_name]))
 
-    # HACK: Pulls tempTIMDs in a custom stream
-    TEMP_TIMD_SHALLOW = DB.child('tempTIMDs').shallow().get().val()
-    if TEMP_TIMD_SHALLOW is not None:
-        for temp_timd in TEMP_TIMD_SHALLOW:
-            if temp_timd not in CACHED_TEMP_TIMD_KEYS:
-                temp_timd_value = DB.child('tempTIMDs').child(temp_timd).get().val()
-                temp_timd_stream_handler(temp_timd, temp_timd_value)
-                CACHED_TEMP_TIMD_KEYS.append(temp_timd)
-
-
-    # Checks list of tempTIMDs from files to determine what calculations
-    # are needed.
-
-    # List of files (tempTIMDs) in the 'temp_timds' cache directory.
-    TEMP_TIMD_FILES = os.listdir(utils.create_file_path(
-        'data/cache/temp_timds'))
-    # Stores groups of matching tempTIMDs under a single key (which is
-    # the corresponding TIMD).  Used to consolidate tempTIMDs.
-    # (Matching tempTIMDs are tempTIMDs for the same TIMD)
-    FILES_BY_TIMD = {}
-    for temp_timd in TEMP_TIMD_FILES:
-        # Removes '.txt' ending.
-        TEMP_TIMD_NAME = temp_timd.split('.')[0]
-        # Removes scout ID to find the corresponding TIMD for the
-        # tempTIMD.
-        TIMD_NAME = TEMP_TIMD_NAME.split('-')[0]
-        FILES_BY_TIMD[TIMD_NAME] = FILES_BY_TIMD.get(TIMD_NAME, []) + [
-            TEMP_TIMD_NAME]
-
-    # Runs calculations for each TIMD that has new data since the last
-    # time it ran.
-    # The calculation of TIMDs causes the corresponding match and team
-    # data to be recalculated.
-    for timd in FILES_BY_TIMD:
-        if LATEST_CALCULATIONS_BY_TIMD.get(timd) != FILES_BY_TIMD[timd]:
-            subprocess.call(f'python3 calculate_timd.py {timd}', shell=True)
-            print(f"Did calculations for {timd}")
-            LATEST_CALCULATIONS_BY_TIMD[timd] = FILES_BY_TIMD[timd]
-
-    # Calculates pushing ELO rankings for teams.
-    subprocess.call('python3 calculate_pushing_ability.py', shell=True)
-
-    # Forwards tempSuper data to Matches and TIMDs.
-    subprocess.call('python3 forward_temp_super.py', shell=True)
-
-    # Calculates 'pointsPrevented'
-    subprocess.call('python3 calculate_defense.py', shell=True)
-
-    if TEMP_TIMD_FILES != []:
-        # Makes predictions about match results.
-        subprocess.call('python3 calculate_predictions.py', shell=True)
-
-        # Runs advanced calculations for every team in the competition.
-        subprocess.call('python3 calculate_abilities.py', shell=True)
-
-    # Uploads data in data queue.
-    subprocess.call('python3 upload_data.py', shell=True)
-
     # Updates 'lastServerRun' on firebase with epoch time that the
     # server last ran.  Used to monitor if the server is offline by
     # checking if an excess amount of time has passed since the last run
@@ -323,4 +604,128 @@ while True:
     except OSError:
         print('Warning: No internet connection')
 
-    time.sleep(5)
+def start_server(cold_start=False):
+    """Prepares the cache and creates the Firebase streams.
+
+    cold_start is True to delete the cache and recalculate everything
+    from scratch.  Otherwise, the server restarts from the snapshot of
+    the last completed loop, so only the data that changed since then is
+    recalculated."""
+    global CACHE, STREAMS, TIMD_POOL
+    if cold_start is True:
+        saved_snapshot = None
+    else:
+        saved_snapshot = snapshot.read_snapshot()
+    if saved_snapshot is None:
+        # Deletes the entire 'cache' directory to remove any old data.
+        # Checks if the directory exists before trying to delete it to
+        # avoid causing an error.  The data store is closed first, since
+        # its database is in the cache.
+        data_store.close()
+        if os.path.isdir(utils.create_file_path('data/cache', False)):
+            shutil.rmtree(utils.create_file_path('data/cache', False))
+    CACHE = event_cache.EventCache()
+
+    # Worker processes are started when they are first needed, and are
+    # kept for the lifetime of the server.
+    if TIMD_WORKER_COUNT > 1:
+        TIMD_POOL = concurrent.futures.ProcessPoolExecutor(TIMD_WORKER_COUNT)
+
+    # In order to make match calculations, the match schedule must be
+    # taken from TBA and put into the cache.  The match schedule is
+    # cached before the streams are created, since the dependency graph
+    # uses it to find the predictions to recalculate when new data
+    # arrives.
+    cache_match_schedule()
+
+    if saved_snapshot is not None:
+        print('Restarting from snapshot...')
+        input_registry.load_registry()
+        snapshot.restore_snapshot(saved_snapshot)
+
+    # Creates all the database streams and stores them in global dict.
+    # The first event from the tempTIMD stream contains every tempTIMD.
+    STREAMS = create_streams()
+
+def run_loop():
+    """Runs a single iteration of the server loop.
+
+    Sleeps until a stream handler adds work to the queue, until held
+    inputs need to be released, or until the periodic jobs need to run.
+    Then runs a single calculation pass if there is anything to
+    calculate."""
+    global NEXT_PERIODIC_RUN, NEXT_RELEASE_TIME
+    if dependency_graph.has_dirty_nodes():
+        # Some nodes were marked as dirty during the last pass (e.g. the
+        # defending teams), so they are calculated without waiting.
+        wait_time = 0
+    elif NEXT_RELEASE_TIME is not None:
+        wait_time = max(min(NEXT_PERIODIC_RUN, NEXT_RELEASE_TIME) -
+                        time.time(), 0)
+    else:
+        wait_time = max(NEXT_PERIODIC_RUN - time.time(), 0)
+    try:
+        # Uses no CPU while waiting.
+        job = WORK_QUEUE.get(timeout=wait_time)
+    except queue.Empty:
+        job = None
+    loop_start_time = time.perf_counter()
+
+    # Handles every job in the queue in a single pass, since the
+    # calculations for them are combined by 'dependency_graph'.
+    jobs = set()
+    while job is not None:
+        jobs.add(job)
+        try:
+            job = WORK_QUEUE.get_nowait()
+        except queue.Empty:
+            job = None
+
+    if 'forward_tba_data' in jobs:
+        # Forwards TBA data to Teams, TIMDs, and Matches.
+        played_matches = run_stage(forward_tba_data.forward_tba_data)
+        for match_number in played_matches or []:
+            dependency_graph.mark_dirty('tba_match', match_number)
+        # Calculates SPRs (Scout Precision Rankings)
+        run_stage(calculate_sprs.calculate_sprs)
+        print('Did SPRs calculations')
+
+    if time.time() >= NEXT_PERIODIC_RUN:
+        run_periodic_jobs()
+        NEXT_PERIODIC_RUN = time.time() + PERIODIC_JOB_INTERVAL
+
+    NEXT_RELEASE_TIME = release_held_inputs()
+
+    # The data for the current matches is calculated first.  The rest is
+    # calculated in short background passes when there is no data for
+    # the current matches left to calculate.
+    if 'forward_tba_data' in jobs or has_current_work():
+        run_calculations()
+    elif dependency_graph.has_dirty_nodes():
+        run_calculations(is_background=True)
+    else:
+        return
+    metrics.finish_loop(time.perf_counter() - loop_start_time)
+
+def is_idle():
+    """Returns True if the server has no work left to do.
+
+    Used by replay_event.py to find when the server has finished
+    calculating the data that has been sent to it."""
+    with dependency_graph.LOCK:
+        return (WORK_QUEUE.empty() and
+                not dependency_graph.has_dirty_nodes() and
+                dependency_graph.HELD_GROUPS == {})
+
+if __name__ == '__main__':
+    # Serves the server loop metrics (e.g. to Prometheus)
+    metrics.start_http_server()
+
+    # Detects when CTRL+C is pressed, then runs handle_ctrl_c
+    signal.signal(signal.SIGINT, handle_ctrl_c)
+
+    # Run with '--cold' to recalculate everything from scratch.
+    start_server('--cold' in sys.argv)
+
+    while True:
+        run_loop()
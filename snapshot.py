@@ -0,0 +1,96 @@
+"""Saves and loads snapshots of the server's calculation state.
+
+A snapshot is saved after each completed server loop.  It contains a
+hash of every cached tempTIMD and tempSuper data, and the nodes in
+'dependency_graph' that were still dirty or held.  Together with the
+data in 'data/cache', it describes a consistent state of the
+calculations.
+
+When the server restarts, the snapshot is compared against the cache.
+Any tempTIMD or tempSuper data that changed after the snapshot (e.g.
+during a loop that crashed) is marked as dirty, so only the data that
+differs is recalculated instead of the entire event.
+
+Called by server.py"""
+# External imports
+import json
+import os
+# Internal imports
+import dependency_graph
+import input_registry
+import utils
+
+SNAPSHOT_FILE = 'data/cache/snapshot.json'
+# Increased when the format of the snapshot (or of the cache) changes, so
+# that snapshots from an older version of the server are not used.
+SNAPSHOT_VERSION = 2
+
+# Cache folder to the type of node in 'dependency_graph' that its files
+# are for.
+INPUT_FOLDERS = {
+    'temp_timds': 'temp_timd',
+    'temp_super': 'temp_super',
+}
+
+def save_snapshot():
+    """Saves a snapshot of the cached inputs and the dirty nodes.
+
+    Stream handlers hold 'dependency_graph.LOCK' while saving inputs,
+    so the snapshot never contains an input without its dirty nodes."""
+    with dependency_graph.LOCK:
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'inputs': {folder_name: dict(input_registry.HASHES[folder_name])
+                       for folder_name in INPUT_FOLDERS},
+            'dirtyNodes': {node_type: list(node_names) for node_type,
+                           node_names in dependency_graph.DIRTY_NODES.items()},
+            'heldInputs': [list(held_input) for group in
+                           dependency_graph.HELD_GROUPS.values() for
+                           held_input in group['inputs']],
+        }
+    # Writes to a temporary file first so that a crash while writing
+    # does not leave a partial snapshot.
+    file_path = utils.create_file_path(SNAPSHOT_FILE)
+    with open(f'{file_path}.tmp', 'w') as file:
+        json.dump(snapshot, file)
+    os.replace(f'{file_path}.tmp', file_path)
+
+def read_snapshot():
+    """Returns the saved snapshot (dict).
+
+    Returns None if there is no usable snapshot, meaning the cache needs
+    to be rebuilt from scratch."""
+    try:
+        with open(utils.create_file_path(SNAPSHOT_FILE), 'r') as file:
+            snapshot = json.load(file)
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+def restore_snapshot(snapshot):
+    """Restores the calculation state from a snapshot.
+
+    Marks the inputs that differ from the snapshot as dirty, and marks
+    the nodes that were dirty when the snapshot was saved.  The match
+    schedule needs to be registered in 'dependency_graph', and the cached
+    inputs need to be loaded into 'input_registry' first.
+
+    snapshot is the snapshot returned by 'read_snapshot' (dict)"""
+    for folder_name, node_type in INPUT_FOLDERS.items():
+        snapshot_hashes = snapshot['inputs'].get(folder_name, {})
+        cached_hashes = input_registry.HASHES[folder_name]
+        # Inputs that were added, edited, or deleted after the snapshot
+        for input_name in set(snapshot_hashes) | set(cached_hashes):
+            if snapshot_hashes.get(input_name) != cached_hashes.get(
+                    input_name):
+                dependency_graph.mark_dirty(node_type, input_name)
+
+    for node_type, node_names in snapshot['dirtyNodes'].items():
+        for node_name in node_names:
+            dependency_graph.mark_dirty(node_type, node_name)
+    # Held inputs are calculated right away, since the rest of their
+    # group may have arrived while the server was offline.
+    for node_type, node_name in snapshot['heldInputs']:
+        dependency_graph.mark_dirty(node_type, node_name)
@@ -11,6 +11,9 @@ import time
 import utils
 
 EVENT_CODE = '2019carv'
+# Base URL of the TBA API.  Changed to use a local stand-in for TBA
+# (e.g. in replay_event.py).
+BASE_URL = 'https://www.thebluealliance.com/api/v3/'
 
 with open(utils.create_file_path('data/api_keys/tba_key.txt')) as file:
     API_KEY = file.read()
@@ -27,8 +30,7 @@ def make_request(api_url, show_output=True, acceptable_cache_age=0):
     acceptable_cache_age is the maximum age (in seconds) of data that
     can be pulled from the cache.  Pulling from the cache is disabled by
     default."""
-    base_url = 'https://www.thebluealliance.com/api/v3/'
-    full_url = base_url + api_url
+    full_url = BASE_URL + api_url
     request_headers = {'X-TBA-Auth-Key': API_KEY}
 
     # This cache is used with TBA's 'Last-Modified' and
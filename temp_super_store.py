@@ -0,0 +1,88 @@
+#!/usr/bin/python3.6
+"""Decompresses each tempSuper once, when it changes.
+
+forward_temp_super.py, calculate_pushing_ability.py, and
+export_pushing_battles.py all use the tempSuper data.  Instead of each
+of them reading and decompressing every file in 'data/cache/temp_super',
+'ingest_temp_supers' decompresses the tempSupers that changed since it
+last ran, and saves the teams (including their opponents and timelines)
+and pushing battles in the 'temp_supers' table of data_store.py, which
+they all read from.
+
+The tempSupers that changed are found by comparing the hashes in the
+'inputs' index of data_store.py (kept up to date by input_registry.py)
+with the hashes of the decompressed tempSupers, so the tempSuper files
+are not read if nothing changed."""
+# External imports
+# No external imports
+# Internal imports
+import data_store
+import decompressor
+import input_registry
+import utils
+
+def ingest_temp_supers():
+    """Decompresses every tempSuper that changed, and removes the
+    decompressed tempSupers that were deleted.
+
+    Returns the number of tempSupers that were decompressed."""
+    input_hashes = data_store.read_input_hashes('temp_super')
+    decompressed_hashes = data_store.read_temp_super_hashes()
+    decompressed_count = 0
+    with data_store.transaction():
+        for temp_super_name in decompressed_hashes:
+            if temp_super_name not in input_hashes:
+                data_store.delete_temp_super(temp_super_name)
+        for temp_super_name, value_hash in input_hashes.items():
+            if decompressed_hashes.get(temp_super_name) == value_hash:
+                continue
+            try:
+                with open(utils.create_file_path(
+                        f'data/cache/temp_super/{temp_super_name}.txt'),
+                          'r') as file:
+                    compressed_temp_super = file.read()
+            # The tempSuper was deleted after the index was read.  Its row
+            # in the index is also deleted.
+            except FileNotFoundError:
+                continue
+            # The file can change after the index is read, so the hash of
+            # the contents that were read is saved.
+            value_hash = input_registry.hash_value(compressed_temp_super)
+            # Removes trailing newline (if it exists) from file data.
+            # Many file editors will automatically add a newline at the
+            # end of files.
+            compressed_temp_super = compressed_temp_super.rstrip('\n')
+            try:
+                decompressed_temp_super = \
+                    decompressor.decompress_temp_super_data(
+                        compressed_temp_super)
+            # Invalid tempSupers are saved as None, so they are not
+            # decompressed again until they change.
+            except (IndexError, KeyError, ValueError):
+                decompressed_temp_super = None
+            if decompressed_temp_super is None or None in \
+                    decompressed_temp_super.values():
+                print(f"Error: Unable to decompress tempSuper "
+                      f"'{temp_super_name}'")
+            data_store.write_temp_super(temp_super_name, value_hash,
+                                        decompressed_temp_super)
+            decompressed_count += 1
+    return decompressed_count
+
+def read_temp_supers(match_numbers=None):
+    """Returns a dict of tempSuper names to decompressed tempSupers.
+
+    Decompresses the tempSupers that changed first.  Each decompressed
+    tempSuper is a dict containing its 'teams' (the same as
+    'decompressor.decompress_temp_super') and 'pushingBattles' (the
+    same as 'decompressor.decompress_temp_super_pushing_battles').
+    Either of them is None if it could not be decompressed.  The
+    tempSupers are in order of match number, then name.  tempSupers that
+    could not be decompressed at all are not included.
+
+    match_numbers is a list of the match numbers (strings or integers)
+    to read.  Defaults to every match."""
+    ingest_temp_supers()
+    return {temp_super_name: temp_super for temp_super_name, temp_super in
+            data_store.read_temp_supers(match_numbers).items() if
+            temp_super is not None}
@@ -0,0 +1,110 @@
+#!/usr/bin/python3.6
+"""Caches decompressed tempTIMDs, so each tempTIMD is decompressed once.
+
+calculate_timd.py decompresses the tempTIMDs of a TIMD each time the
+TIMD is calculated, and calculate_sprs.py decompresses every tempTIMD in
+the competition each time the match number changes.  Both use
+'decompress_temp_timd' in this file instead of the one in
+decompressor.py, so a tempTIMD that did not change is only
+decompressed once.
+
+tempTIMDs are found by the hash of the compressed tempTIMD, so a
+tempTIMD that is edited is decompressed again.  The hash also includes
+the hash of the assignments file (the scout names are decompressed with
+it) and 'CACHE_VERSION'.
+
+Decompressed tempTIMDs are stored pickled, which cannot be changed by
+the callers, and each call unpickles a new copy (which can be changed,
+e.g. by consolidation.py).  Unpickling is several times faster than
+decompressing, and faster than loading the same data from JSON.
+
+If 'PERSIST' is True, decompressed tempTIMDs are also saved in the
+'decompressed_temp_timds' table of data_store.py.  The table is shared
+by every process (e.g. the TIMD worker processes in server.py and the
+server process, which calculates SPRs), and is kept when the server
+restarts.
+
+When a tempTIMD is edited or deleted, input_registry.py removes its old
+decompressed copy with 'evict_temp_timd'.  Each process also keeps at
+most 'MAX_CACHED_TEMP_TIMDS' tempTIMDs in memory, since the TIMD worker
+processes do not see the evictions in the server process."""
+# External imports
+import hashlib
+import pickle
+# Internal imports
+import assignments
+import data_store
+import decompressor
+
+# Increase when the output of decompressor.py changes, so the tempTIMDs
+# that were decompressed before the change are decompressed again.
+CACHE_VERSION = 1
+# True to save the decompressed tempTIMDs in data_store.py
+PERSIST = True
+# Maximum number of decompressed tempTIMDs kept in memory.  The oldest
+# are removed first.  An event has about 2000 tempTIMDs.
+MAX_CACHED_TEMP_TIMDS = 10000
+
+# Hash of a compressed tempTIMD (from 'hash_temp_timd') to a
+# (key from 'get_key', pickled decompressed tempTIMD) tuple
+DECOMPRESSED_TEMP_TIMDS = {}
+
+def hash_temp_timd(compressed_temp_timd):
+    """Returns the hash of a compressed tempTIMD (string).
+
+    The same as its hash in input_registry.py, which is not imported,
+    since input_registry.py imports this file.
+
+    compressed_temp_timd is a string."""
+    return hashlib.sha1(compressed_temp_timd.encode('utf-8')).hexdigest()
+
+def get_key(input_hash):
+    """Returns the key of a compressed tempTIMD in the cache (string).
+
+    input_hash is the hash of the compressed tempTIMD (from
+    'hash_temp_timd')"""
+    return hashlib.sha1(
+        f'{CACHE_VERSION}|{assignments.get_assignments_hash()}|'
+        f'{input_hash}'.encode('utf-8')).hexdigest()
+
+def evict_temp_timd(input_hash):
+    """Removes the decompressed copy of a tempTIMD that was edited or
+    deleted.
+
+    input_hash is the hash of the compressed tempTIMD before it was
+    edited or deleted"""
+    DECOMPRESSED_TEMP_TIMDS.pop(input_hash, None)
+    if PERSIST is True:
+        data_store.delete_decompressed_temp_timds(input_hash)
+
+def decompress_temp_timd(compressed_temp_timd):
+    """Returns a copy of the decompressed tempTIMD.
+
+    Same as 'decompressor.decompress_temp_timd', but only decompresses
+    a tempTIMD the first time.
+
+    compressed_temp_timd is a string."""
+    input_hash = hash_temp_timd(compressed_temp_timd)
+    key = get_key(input_hash)
+    cached_key, pickled_temp_timd = DECOMPRESSED_TEMP_TIMDS.pop(
+        input_hash, (None, None))
+    # Decompressed with different assignments or an older version
+    if cached_key != key:
+        pickled_temp_timd = None
+    if pickled_temp_timd is None and PERSIST is True:
+        # Another process (or the server before it restarted) might
+        # have decompressed it.
+        pickled_temp_timd = data_store.read_decompressed_temp_timd(key)
+    if pickled_temp_timd is None:
+        pickled_temp_timd = pickle.dumps(decompressor.decompress_temp_timd(
+            compressed_temp_timd), pickle.HIGHEST_PROTOCOL)
+        if PERSIST is True:
+            data_store.write_decompressed_temp_timd(key, input_hash,
+                                                    pickled_temp_timd)
+    # Added again at the end (it was removed above), so the least
+    # recently used tempTIMDs are at the start.
+    DECOMPRESSED_TEMP_TIMDS[input_hash] = (key, pickled_temp_timd)
+    while len(DECOMPRESSED_TEMP_TIMDS) > MAX_CACHED_TEMP_TIMDS:
+        DECOMPRESSED_TEMP_TIMDS.pop(next(iter(DECOMPRESSED_TEMP_TIMDS)),
+                                    None)
+    return pickle.loads(pickled_temp_timd)
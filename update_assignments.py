@@ -4,6 +4,7 @@
 import json
 import sys
 # Internal imports
+import assignments
 import firebase_communicator
 import utils
 
@@ -11,36 +12,41 @@ import utils
 # DB stands for database
 DB = firebase_communicator.configure_firebase()
 
-if len(sys.argv) == 2:
-    CYCLE_NUMBER = sys.argv[1]
-else:
-    print('Error: Cycle number not being passed as an argument. Exiting...')
-    sys.exit(0)
+def update_assignments(cycle_number):
+    """Sends a new assignment QR code with scouts sorted by SPR.
 
-# Each scout name is associated with a letter (for compression).
-# This opens the JSON file that stores the letters and loads the dict
-# that is used to swap names with letters.
-with open(utils.create_file_path('data/assignments/assignments.json'), 'r') as file:
-    LETTERS = json.load(file)['letters']
+    cycle_number is the current cycle number (integer or string)"""
+    # Each scout name is associated with a letter (for compression).
+    # This loads the dict from the assignments file that is used to swap
+    # names with letters.
+    letters = assignments.get_scout_letters()
 
-AVAILABILITY = DB.child('scoutManagement/availability').get().val()
-AVAILABLE_SCOUTS = [scout for scout, availability in AVAILABILITY.items()
-                    if availability == 1]
+    scout_availability = DB.child(
+        'scoutManagement/availability').get().val()
+    available_scouts = [scout for scout, availability in
+                        scout_availability.items() if availability == 1]
 
-# The base assignment string
-ASSIGNMENT_STRING = f'{CYCLE_NUMBER}_{firebase_communicator.URL}|'
+    # The base assignment string
+    assignment_string = f'{cycle_number}_{firebase_communicator.URL}|'
 
-with open(utils.create_file_path('data/sprs/sprs.json'), 'r') as file:
-    SPRS = json.load(file)
+    with open(utils.create_file_path('data/sprs/sprs.json'), 'r') as file:
+        sprs = json.load(file)
 
-# Sorts scouts from best SPR to worst SPR
-# Scouts without SPRs default to 0.0, since we want them to be placed
-# with other scouts.  (Scouts with a lower SPR are more likely to be in
-# groups of 3)
-AVAILABLE_SCOUTS.sort(key=lambda scout: SPRS.get(scout, {}).get(
-    'overall', 0.0), reverse=True)
+    # Sorts scouts from best SPR to worst SPR
+    # Scouts without SPRs default to 0.0, since we want them to be placed
+    # with other scouts.  (Scouts with a lower SPR are more likely to be in
+    # groups of 3)
+    available_scouts.sort(key=lambda scout: sprs.get(scout, {}).get(
+        'overall', 0.0), reverse=True)
 
-for scout in AVAILABLE_SCOUTS:
-    ASSIGNMENT_STRING += LETTERS[scout]
+    for scout in available_scouts:
+        assignment_string += letters[scout]
 
-DB.child('scoutManagement/QRcode').set(ASSIGNMENT_STRING)
+    DB.child('scoutManagement/QRcode').set(assignment_string)
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        update_assignments(sys.argv[1])
+    else:
+        print('Error: Cycle number not being passed as an argument. Exiting...')
+        sys.exit(0)
@@ -3,18 +3,54 @@
 
 The 'upload_queue' directory contains three directories: 'timds',
 'teams', and 'matches'.  Collects data from each of these three
-directories and sends it to firebase in a single request."""
+directories, saves it in the upload journal (the 'upload_journal' table
+of data_store.py), and sends the journal to firebase in chunks of a
+limited size, which are sent at the same time and retried if they fail.
+The journal keeps the data while firebase is unreachable.
+
+Only the data fields that changed since they were last uploaded are
+sent.  The uploaded values are saved in the 'uploads' table of
+data_store.py, so the calculations can save entire TIMDs, teams, and
+matches in the upload queue without uploading the entire event each
+time.  This assumes that the server is the only one that writes to
+'TIMDs', 'Teams', and 'Matches' in Firebase.
+
+Documents that are deleted (e.g. a TIMD whose tempTIMDs were all
+deleted) are removed from Firebase through the journal as well."""
 # External imports
+import concurrent.futures
 import json
 import os
+import time
 # Internal imports
+import data_store
 import firebase_communicator
+import metrics
 import utils
 
 # Uses default firebase URL
 # DB stands for database
 DB = firebase_communicator.configure_firebase()
 
+# Maximum size (in bytes) of the data sent in a single request
+MAX_CHUNK_SIZE = 256 * 1024
+# Number of chunks that are sent at the same time
+UPLOAD_THREAD_COUNT = 4
+# Maximum number of chunks sent in a single loop
+MAX_CHUNKS_PER_LOOP = 40
+# Number of times a chunk is sent before giving up until the next loop
+UPLOAD_ATTEMPTS = 4
+# Number of seconds before the first retry of a chunk.  Doubled for
+# each retry after that.
+RETRY_DELAY = 0.5
+
+# Firebase key names to the equivilent local cache key names
+FIREBASE_TO_CACHE_KEY = {
+    'TIMDs': 'timds',
+    'Teams': 'teams',
+    'Matches': 'matches',
+}
+
 def collect_file_data(file_path_, firebase_collection):
     """Converts local format to multi-location format for a single file.
 
@@ -64,43 +100,200 @@ def collect_file_data(file_path_, firebase_collection):
                 document_name, path)] = value
     return multi_location_data
 
-FINAL_DATA = {}
+def remove_nans(file_data):
+    """Replaces NaNs (Not a Number) in the data of a file with None.
 
-# Firebase key names to the equivilent local cache key names
-FIREBASE_TO_CACHE_KEY = {
-    'TIMDs': 'timds',
-    'Teams': 'teams',
-    'Matches': 'matches',
-}
+    Relies on NaN != NaN.
+    HACK: NaNs should be handled during calculation.
+
+    file_data is the multi-location data of a file (dict)"""
+    for path, value in file_data.items():
+        if path.split('/')[-1] == 'timeline':
+            for action in value:
+                for key, value_ in action.items():
+                    if isinstance(value_, float) and value_ != value_:
+                        action[key] = None
+        if isinstance(value, float) and value != value:
+            file_data[path] = None
+
+def create_chunks(journal_entries):
+    """Splits journal entries into chunks of at most 'MAX_CHUNK_SIZE'.
+
+    An entry larger than 'MAX_CHUNK_SIZE' is put in a chunk by itself.
+    Returns a list of chunks, where each chunk is a list of entries.
+
+    journal_entries is a list of (sequence, path, JSON of the value)
+    tuples from 'data_store.read_journal'"""
+    chunks = []
+    chunk_size = 0
+    for entry in journal_entries:
+        # Approximate size of the entry in the JSON of the request
+        entry_size = len(entry[1]) + len(entry[2]) + 4
+        if chunks == [] or (chunk_size + entry_size > MAX_CHUNK_SIZE and
+                            chunks[-1] != []):
+            chunks.append([])
+            chunk_size = 0
+        chunks[-1].append(entry)
+        chunk_size += entry_size
+    return chunks
+
+def upload_chunk(chunk_data):
+    """Sends a chunk of data to Firebase, retrying if it fails.
+
+    Waits 'RETRY_DELAY' seconds before the first retry, and doubles the
+    delay before each retry after that.  Raises the error of the last
+    attempt if every attempt fails.  Returns the number of retries.
+
+    chunk_data is the multi-location data of the chunk (dict)"""
+    for attempt in range(UPLOAD_ATTEMPTS):
+        try:
+            DB.update(chunk_data)
+            return attempt
+        # A lost internet connection or an error response from Firebase
+        # (both are 'OSError's)
+        except OSError:
+            if attempt == UPLOAD_ATTEMPTS - 1:
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+def journal_upload_queue():
+    """Moves the changes in the upload queue files to the upload journal.
+
+    Only the paths whose values differ from the most recent uploaded or
+    journaled value are added.  Each file is removed once its changes
+    are saved in the journal."""
+    queued_files = []
+    for firebase_key, cache_key in FIREBASE_TO_CACHE_KEY.items():
+        for file in os.listdir(utils.create_file_path(
+                f'data/upload_queue/{cache_key}')):
+            file_path = utils.create_file_path(
+                f'data/upload_queue/{cache_key}/{file}')
+            # Collects the data from a single file
+            file_data = collect_file_data(file_path, firebase_key)
+            # Before sending the data, removes any NaNs in the data.
+            remove_nans(file_data)
+            queued_files.append((file_path, file_data))
+
+    # Removes the data that is the same as the last upload (or the last
+    # journaled value, if it has not been uploaded yet).  Values are
+    # compared as JSON, since they were loaded from JSON files.
+    json_values = {path: json.dumps(value, sort_keys=True) for _, file_data
+                   in queued_files for path, value in file_data.items()}
+    pending_values = data_store.read_pending_uploads(list(json_values))
+    changes = {path: json_value for path, json_value in json_values.items()
+               if pending_values.get(path) != json_value}
+    data_store.append_journal(changes)
+    metrics.count_items('paths_journaled', len(changes))
+    metrics.count_items('paths_unchanged', len(json_values) - len(changes))
+
+    # Removes files after they are journaled to prevent data loss
+    for file_path, _ in queued_files:
+        # Removes the file from the upload queue to prevent re-upload
+        os.remove(file_path)
+    metrics.count_items('files_uploaded', len(queued_files))
+
+def queue_removal(firebase_collection, document_name):
+    """Adds the removal of a document from Firebase to the upload journal.
+
+    The document is removed by the next successful upload, so it is also
+    removed if Firebase is unreachable when it is deleted.
+
+    firebase_collection refers to a collection on Firebase (must be
+    'TIMDs', 'Teams', or 'Matches')
+    document_name is the name of the document (e.g. '1678Q3')"""
+    if firebase_collection not in FIREBASE_TO_CACHE_KEY:
+        print(f"Error: '{firebase_collection}' is not a Firebase collection")
+        return
+    data_store.journal_removal(f'{firebase_collection}/{document_name}')
+
+def upload_removals(journal_entries):
+    """Uploads the removals of documents in the upload journal.
+
+    Returns True if there were no removals or they were uploaded, and
+    False if they failed to upload.
+
+    journal_entries is a list of (sequence, path, JSON of the value)
+    tuples from 'data_store.read_journal'"""
+    removals = [entry for entry in journal_entries
+                if data_store.is_document_path(entry[1])]
+    if removals == []:
+        return True
+    try:
+        retry_count = upload_chunk({path: None for _, path, _ in removals})
+    except OSError as error:
+        print(f'Warning: Failed to remove {len(removals)} documents '
+              f'({error})')
+        metrics.count_items('upload_failures', 1)
+        return False
+    # Also removes the uploaded values inside the documents.
+    data_store.acknowledge_journal(removals)
+    metrics.count_items('upload_retries', retry_count)
+    metrics.count_items('documents_removed', len(removals))
+    return True
+
+def upload_data():
+    """Uploads the changes in the upload queue to Firebase.
+
+    Changes are saved in the upload journal before they are uploaded,
+    so changes made while Firebase is unreachable are kept until it can
+    be reached again.  The journal is compacted before each upload, so
+    only the most recent value of each path is uploaded.
+
+    The journal is uploaded in chunks, which are sent at the same time
+    by 'UPLOAD_THREAD_COUNT' threads.  At most 'MAX_CHUNKS_PER_LOOP'
+    chunks are sent in each loop, so the rest of a large journal (e.g.
+    after a long outage) is uploaded in the next loops.  Removes each
+    entry from the journal after its chunk is uploaded.  After a chunk
+    fails, the chunks that have not started are not sent, since
+    Firebase is most likely unreachable.
+
+    Removed documents (from 'queue_removal') are removed before the
+    rest of the journal is uploaded."""
+    journal_upload_queue()
+    metrics.count_items('paths_compacted', data_store.compact_journal())
+
+    # Removals (e.g. of deleted TIMDs) are uploaded before the other
+    # entries, since the other entries inside a removed document were
+    # journaled after it was removed (e.g. a TIMD that was calculated
+    # again), and must not be removed with it.
+    journal_entries = data_store.read_journal()
+    if not upload_removals(journal_entries):
+        return
+    journal_entries = [entry for entry in journal_entries
+                       if not data_store.is_document_path(entry[1])]
+    chunks = create_chunks(journal_entries)[:MAX_CHUNKS_PER_LOOP]
+    # Pyrebase sends every request through the same HTTP session, so the
+    # threads share its pool of connections.
+    with concurrent.futures.ThreadPoolExecutor(UPLOAD_THREAD_COUNT) as pool:
+        futures = {}
+        for chunk in chunks:
+            chunk_data = {path: json.loads(json_value) for _, path,
+                          json_value in chunk}
+            futures[pool.submit(upload_chunk, chunk_data)] = (chunk,
+                                                              chunk_data)
+        for future in concurrent.futures.as_completed(futures):
+            chunk, chunk_data = futures[future]
+            if future.cancelled():
+                continue
+            try:
+                retry_count = future.result()
+            except OSError as error:
+                # The entries stay in the journal and are uploaded in a
+                # later loop.
+                print(f'Warning: Failed to upload {len(chunk)} paths '
+                      f'({error})')
+                metrics.count_items('upload_failures', 1)
+                for other_future in futures:
+                    other_future.cancel()
+                continue
+            # Only removed after the upload succeeds, so data that fails
+            # to upload is uploaded again.
+            data_store.acknowledge_journal(chunk)
+            metrics.count_items('upload_retries', retry_count)
+            metrics.count_items('paths_uploaded', len(chunk))
+            # Pyrebase sends the data as JSON
+            metrics.count_items('bytes_sent', len(json.dumps(
+                chunk_data).encode()))
 
-FILES_TO_REMOVE = []
-
-for firebase_key, cache_key in FIREBASE_TO_CACHE_KEY.items():
-    for file in os.listdir(utils.create_file_path(
-            f'data/upload_queue/{cache_key}')):
-        file_path = utils.create_file_path(
-            f'data/upload_queue/{cache_key}/{file}')
-        # Collects and adds the data from a single file to 'FINAL_DATA'
-        FINAL_DATA.update(collect_file_data(file_path, firebase_key))
-
-        FILES_TO_REMOVE.append(file_path)
-
-# Before sending the data, iterates through all of it and removes any
-# NaNs (Not a Number) in the data.  (Relies on NaN != NaN)
-# HACK: NaNs should be handled during calculation.
-for path, value in FINAL_DATA.items():
-    if path.split('/')[-1] == 'timeline':
-        for action in value:
-            for key, value_ in action.items():
-                if isinstance(value_, float) and value_ != value_:
-                    action[key] = None
-    if isinstance(value, float) and value != value:
-        FINAL_DATA[path] = None
-
-# Sends the data to firebase.
-DB.update(FINAL_DATA)
-
-# Removes files after upload to prevent data loss
-for file_path in FILES_TO_REMOVE:
-    # Removes the file from the upload queue to prevent re-upload
-    os.remove(file_path)
+if __name__ == '__main__':
+    upload_data()